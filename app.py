@@ -3,12 +3,13 @@
 # Uses the Flask framework, HTML, and CSS to create a website
 # implementation of ZotPlanner.
 
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 
-from query import prereq, valid_class, check_for_unlisted_prereqs
-from graph import Graph
-from search import query_catalogue, DATA_INDEX
+from query import prereq_subgraph, valid_class, check_for_unlisted_prereqs, unlocks
+from search import query_catalogue, RESULT_LIMIT
+from boolean_query import BooleanQueryError
+from registry import get_index
 
 app = Flask(__name__)
 COURSE_LIST = []
@@ -30,7 +31,7 @@ def index():
 
             if (dept+' '+course_num not in COURSE_LIST) and valid_class(dept+' '+course_num):
                 COURSE_LIST.append(dept+' '+course_num)
-                COURSE_TITLES.append(DATA_INDEX[COURSE_LIST[-1]][1])
+                COURSE_TITLES.append(get_index()[COURSE_LIST[-1]][1])
             else:
                 return render_template('index.html', search_results=[], courses=COURSE_LIST, titles=COURSE_TITLES, errormsg="Error adding class.")
         else:
@@ -38,11 +39,15 @@ def index():
 
             print("SEARCHING CATALOGUE:", query)
             
+            try:
+                results = query_catalogue(query, RESULT_LIMIT)
+            except BooleanQueryError as e:
+                return render_template('index.html', search_results=[], courses=COURSE_LIST, titles=COURSE_TITLES, errormsg=f"Invalid search: {e}")
+
             search_results = []
-            for i, course in enumerate(query_catalogue(query)):
-                if i >= 100:
-                    break
-                search_results.append((course, DATA_INDEX[course][1], DATA_INDEX[course][2], DATA_INDEX[course][3]))
+            index = get_index()
+            for course in results:
+                search_results.append((course, index[course][1], index[course][2], index[course][3]))
 
             return render_template('index.html', search_results=search_results, courses=COURSE_LIST, titles=COURSE_TITLES, errormsg="")
 
@@ -99,14 +104,7 @@ def generate():
     try:
         # Initialize graph
         global COURSE_LIST
-        class_graph = Graph(COURSE_LIST)
-        
-        for c in COURSE_LIST:
-            class_list_no_c = list(COURSE_LIST)
-            class_list_no_c.remove(c)
-            for d in class_list_no_c:
-                if prereq(c,d):
-                    class_graph.addDirectedEdge(c,d)
+        class_graph = prereq_subgraph(COURSE_LIST)
         
         # Run topological sort algorithm
         result_lst, warning_lst = _topological_sort(class_graph, COURSE_LIST)
@@ -116,6 +114,18 @@ def generate():
         return render_template('generate.html', order=["FATAL"], warning="Something very unexpected has occurred. Apologize for the inconvenience.")
 
 
+@app.route('/unlocks')
+def unlocksCourse():
+    """
+    Returns the courses which a course unlocks as JSON (refer to
+    query.unlocks), i.e. /unlocks?course=MATH 2B
+    """
+    course = request.args.get('course', '')
+    if not valid_class(course):
+        return jsonify(error=f"{course} either is invalid or has not been offered recently."), 404
+    return jsonify(unlocks(course))
+
+
 @app.route('/clear')
 def clearCourses():
     """
@@ -0,0 +1,282 @@
+# benchmark.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Benchmarks for the indexer and the search engine. Each benchmark
+# runs offline over the courses in index.txt.
+#
+#   Usage: python benchmark.py [benchmark ...]
+#          (runs every benchmark if none are given)
+
+import index
+from index import Index, Course, tokenize
+from courses import CourseTable
+from postings import POSTINGS_PATH, write_postings
+from boolean_query import is_boolean
+import registry
+import search
+
+import os
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+
+def _load_courses(index_obj: 'Index') -> list:
+    """
+    Returns a Course object for every course in index.txt.
+    """
+    return [Course(course, info[1], info[0], info[2]) for course, info in index_obj.get_index().items()]
+
+
+def _time(function, *args, repeat: int = 3) -> float:
+    """
+    Returns the best time (in seconds) of calling function(*args).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter()-start)
+    return best
+
+
+def _build_postings_by_scan(index_obj: 'Index', analyzed: list) -> dict:
+    """
+    The original posting list build: each course is found in a token's
+    posting list by scanning it, making the build quadratic in the
+    length of each posting list.
+    """
+    inverted_index = {}
+    for course, tokens in analyzed:
+        for token, add in tokens.items():
+            if token not in inverted_index:
+                inverted_index[token] = [[course, *add]]
+            else:
+                for i in range(len(inverted_index[token])):
+                    if inverted_index[token][i][0] == course:
+                        break
+
+                if inverted_index[token][i][0] == course:
+                    inverted_index[token][i][1:] = [x+y for x, y in zip(inverted_index[token][i][1:], add)]
+                else:
+                    inverted_index[token].append([course, *add])
+
+    for token in inverted_index:
+        for page in inverted_index[token]:
+            page.insert(2, index_obj._tf_idf(page[1], len(inverted_index[token]), len(analyzed)))
+
+    return inverted_index
+
+
+def benchmark_postings() -> None:
+    """
+    Times building the posting lists of every course, scanning each
+    posting list (original) versus accumulating in a hash-map.
+        - Courses are tokenized once beforehand, so only the posting
+          list build itself is timed
+    """
+    index_obj = Index()
+    courses = _load_courses(index_obj)
+    analyzed = [(course_obj.course, index_obj._analyze_course(course_obj)) for course_obj in courses]
+
+    assert _build_postings_by_scan(index_obj, analyzed) == index_obj._build_postings(analyzed)
+
+    scan = _time(_build_postings_by_scan, index_obj, analyzed)
+    hashed = _time(index_obj._build_postings, analyzed)
+    print(f"Posting lists of {len(analyzed)} courses:")
+    print(f"    scanning:  {scan*1000:.1f} ms")
+    print(f"    hash-map:  {hashed*1000:.1f} ms ({scan/hashed:.1f}x faster)")
+
+
+def benchmark_lemmatizer() -> None:
+    """
+    Times lemmatizing every token occurrence of every course, without
+    and with the lemmatizer's cache.
+        - Lemmatizing without the cache is timed over a sample only,
+          since every token would otherwise be tagged one by one
+    """
+    index_obj = Index()
+    courses = _load_courses(index_obj)
+    tokens = [token for course_obj in courses
+              for token in tokenize(course_obj.title)+tokenize(course_obj.description)]
+    sample = tokens[:10000]
+
+    uncached = _time(lambda: [index._lemmatize_with_pos.__wrapped__(token) for token in sample], repeat=1)/len(sample)
+    index._lemmatize_with_pos.cache_clear()
+    cold = _time(lambda: [index_obj._lemmatize_with_pos(token) for token in tokens], repeat=1)/len(tokens)
+    warm = _time(lambda: [index_obj._lemmatize_with_pos(token) for token in tokens], repeat=1)/len(tokens)
+
+    cache_info = index_obj.lemma_cache_info()
+    print(f"Lemmatizing {len(tokens)} tokens ({cache_info.currsize} distinct):")
+    print(f"    uncached:     {uncached*1e6:.2f} us/token")
+    print(f"    cache (cold): {cold*1e6:.2f} us/token ({uncached/cold:.1f}x faster)")
+    print(f"    cache (warm): {warm*1e6:.2f} us/token ({uncached/warm:.1f}x faster)")
+    print(f"    hit rate:     {cache_info.hits/(cache_info.hits+cache_info.misses):.1%}")
+
+
+def benchmark_tagging() -> None:
+    """
+    Times tokenizing and lemmatizing every course, one tagger call per
+    token versus one per batch of courses, and checks both give the same
+    tokens.
+        - Both start from empty lemmatizer caches
+    """
+    results = {}
+    analyses = {}
+    for batch_tagging in (False, True):
+        index_obj = Index(batch_tagging=batch_tagging)
+        courses = _load_courses(index_obj)
+
+        index._lemmatize_with_pos.cache_clear()
+        index._lemmatize_tagged.cache_clear()
+        start = perf_counter()
+        analyses[batch_tagging] = list(index_obj._analyze_courses(courses))
+        results[batch_tagging] = perf_counter()-start
+
+    assert analyses[False] == analyses[True]
+
+    print(f"Analyzing {len(courses)} courses:")
+    print(f"    per token: {results[False]:.2f} s")
+    print(f"    batched:   {results[True]:.2f} s ({results[False]/results[True]:.1f}x faster)")
+
+
+def benchmark_workers() -> None:
+    """
+    Times tokenizing and lemmatizing every course (and building the lemma
+    table) in this process versus in a pool of one process per CPU.
+        - Both start from empty lemmatizer caches
+    """
+    workers = os.cpu_count() or 1
+    serial_index = Index()
+    parallel_index = Index(workers=workers)
+    courses = _load_courses(serial_index)
+
+    def serial():
+        index._lemmatize_with_pos.cache_clear()
+        index._lemmatize_tagged.cache_clear()
+        serial_index._lemmas = {}
+        analyses = list(serial_index._analyze_courses(courses))
+        serial_index._add_lemmas(courses)
+        return (analyses, serial_index._lemmas)
+
+    assert serial() == parallel_index._analyze_courses_in_parallel(courses)
+
+    serial_time = _time(serial, repeat=1)
+    parallel_time = _time(parallel_index._analyze_courses_in_parallel, courses, repeat=1)
+    print(f"Analyzing {len(courses)} courses:")
+    print(f"    1 process:   {serial_time:.2f} s")
+    print(f"    {workers} processes: {parallel_time:.2f} s ({serial_time/parallel_time:.1f}x faster)")
+
+
+def benchmark_course_table() -> None:
+    """
+    Measures the memory held by the index as loaded from index.txt
+    versus as a course table, and times looking up a course in each.
+    """
+    tracemalloc.start()
+    index_dict = Index().get_index()
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    table = CourseTable(Index().get_index())
+    table_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert dict(table) == index_dict
+
+    courses = list(index_dict)
+    dict_time = _time(lambda: [index_dict[course][3] for course in courses])/len(courses)
+    table_time = _time(lambda: [table[course][3] for course in courses])/len(courses)
+    id_time = _time(lambda: [table.prereq(table.id_of(course)) for course in courses])/len(courses)
+
+    print(f"Index of {len(courses)} courses:")
+    print(f"    dict:          {dict_size/2**20:.1f} MB, {dict_time*1e9:.0f} ns/lookup")
+    print(f"    course table:  {table_size/2**20:.1f} MB ({1-table_size/dict_size:.0%} less), "
+          f"{table_time*1e9:.0f} ns/lookup ({id_time*1e9:.0f} ns by ID)")
+
+
+def benchmark_pruning() -> None:
+    """
+    Times query_catalogue ranking the top 10 courses of every query in a
+    query log with the binary backend, scoring every posting versus
+    MaxScore, and counts the postings each decodes.
+        - The query log is the title of every 20th course
+        - Timed end to end (lemmatizing, looking up and decoding posting
+          lists, ranking), with the results cache cleared before every
+          query
+    """
+    index_obj = Index()
+    limit = 10
+    queries = [info[1] for info in list(index_obj.get_index().values())[::20] if not is_boolean(info[1])]
+
+    cwd = os.getcwd()
+    backend = registry.BACKEND
+    top_by_max_score = search._top_by_max_score
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        write_postings(index_obj.get_index(), index_obj.get_inverted_index(), os.path.join(directory, POSTINGS_PATH))
+        if os.path.exists("lemmas.txt"):
+            shutil.copy("lemmas.txt", directory)
+
+        os.chdir(directory)
+        registry.BACKEND = "binary"
+        registry.reload()
+        try:
+            postings = registry.get_postings()
+            for name, evaluate in (("exhaustive", search._top_exhaustive), ("max_score", top_by_max_score)):
+                search._top_by_max_score = evaluate
+
+                def run():
+                    for query in queries:
+                        search._QUERY_CACHE.clear()
+                        search.query_catalogue(query, limit)
+
+                touched = 0
+                ranked = []
+                for query in queries:
+                    lists = [postings.postings(registry.lemmatize(token)) for token in tokenize(query)]
+                    ids, count = evaluate([found for found in lists if found is not None], limit)
+                    touched += count
+                    ranked.append(ids)
+                results[name] = (_time(run), touched, ranked)
+        finally:
+            search._top_by_max_score = top_by_max_score
+            registry.BACKEND = backend
+            os.chdir(cwd)
+            registry.reload()
+
+    assert results["exhaustive"][2] == results["max_score"][2]
+
+    exhaustive_time, exhaustive_touched, _ = results["exhaustive"]
+    pruned_time, pruned_touched, _ = results["max_score"]
+    print(f"Top {limit} of {len(queries)} queries (query_catalogue):")
+    print(f"    exhaustive: {exhaustive_time/len(queries)*1000:.3f} ms/query, {exhaustive_touched} postings decoded")
+    print(f"    MaxScore:   {pruned_time/len(queries)*1000:.3f} ms/query ({exhaustive_time/pruned_time:.1f}x faster), "
+          f"{pruned_touched} postings decoded ({1-pruned_touched/exhaustive_touched:.0%} fewer)")
+
+
+BENCHMARKS = {
+    "postings": benchmark_postings,
+    "lemmatizer": benchmark_lemmatizer,
+    "tagging": benchmark_tagging,
+    "workers": benchmark_workers,
+    "course_table": benchmark_course_table,
+    "pruning": benchmark_pruning,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs benchmarks over the courses in index.txt.")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help=f"benchmarks to run, any of: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        print('-'*50)
+        BENCHMARKS[name]()
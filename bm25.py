@@ -0,0 +1,118 @@
+# bm25.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# BM25F ranking over the inverted index.
+#
+#   TF-IDF scores only weigh title tokens 3x higher, and favour courses
+#   with long descriptions. BM25F instead combines the frequency of a
+#   token in the title and in the description, each normalized by the
+#   length of its field relative to the average, and saturates it:
+#
+#       tf = sum(boost * frequency / (1 - b + b * length / average length))
+#       score = sum(idf * tf / (k1 + tf))
+#
+#   Field frequencies are stored in the inverted index and field
+#   lengths in fields.txt at build time (refer to Index.get_field_lengths).
+#   Length normalizations are computed once per course, and the weights
+#   of a token once per token, so queries only sum weights.
+
+from math import log
+
+# Saturation of token frequencies
+K1 = 1.2
+
+# Length normalization of each field, from 0 (none) to 1 (full)
+TITLE_B = 0.75
+DESCRIPTION_B = 0.75
+
+# Boost of each field
+# - Note: Title tokens are weighed 3x higher, as in the inverted index
+TITLE_BOOST = 3.0
+DESCRIPTION_BOOST = 1.0
+
+# Parameters of BM25F which can be given by name (refer to parse_params)
+PARAMS = ("k1", "title_b", "description_b", "title_boost", "description_boost")
+
+
+class FieldStatisticsError(Exception):
+    pass
+
+
+class BM25F:
+    def __init__(self, inverted_index: dict, field_lengths: dict, k1: float = K1,
+                 title_b: float = TITLE_B, description_b: float = DESCRIPTION_B,
+                 title_boost: float = TITLE_BOOST, description_boost: float = DESCRIPTION_BOOST):
+        """
+        Initialize a BM25F scorer over the inverted index and field
+        lengths (refer to Index.get_inverted_index/get_field_lengths).
+
+        Exceptions:
+        FieldStatisticsError if the field lengths have not been built
+        """
+        if not field_lengths:
+            raise FieldStatisticsError("No field lengths, rebuild the inverted index (fields.txt)")
+
+        self._inverted_index = inverted_index
+        self._k1 = k1
+        self._weights = {}
+
+        num_courses = len(field_lengths)
+        average_title = sum(lengths[0] for lengths in field_lengths.values())/num_courses or 1
+        average_description = sum(lengths[1] for lengths in field_lengths.values())/num_courses or 1
+
+        # Boost divided by the length normalization of each field
+        self._num_courses = num_courses
+        self._scales = {course: (title_boost/(1-title_b+title_b*title/average_title),
+                                 description_boost/(1-description_b+description_b*description/average_description))
+                        for course, (title, description) in field_lengths.items()}
+
+
+    def weights(self, token: str) -> list:
+        """
+        Returns the BM25F weight of token within each course it is in.
+            Takes the form of:
+            [
+                [course, weight], ...
+            ]
+            - Computed on first use, then kept
+
+        Exceptions:
+        FieldStatisticsError if the inverted index has no field frequencies
+        """
+        weights = self._weights.get(token)
+        if weights is not None:
+            return weights
+
+        postings = self._inverted_index.get(token, [])
+        if postings and len(postings[0]) < 5:
+            raise FieldStatisticsError("No field frequencies, rebuild the inverted index")
+
+        document_frequency = len(postings)
+        idf = log(1+(self._num_courses-document_frequency+0.5)/(document_frequency+0.5))
+
+        weights = []
+        for course, _, _, title, description in postings:
+            title_scale, description_scale = self._scales[course]
+            tf = title*title_scale+description*description_scale
+            weights.append([course, idf*tf/(self._k1+tf)])
+
+        self._weights[token] = weights
+        return weights
+
+
+def parse_params(text: str) -> dict:
+    """
+    Returns the BM25F parameters given as "name=value,..." (e.g.
+    "k1=1.5,title_boost=2"), to be passed to BM25F.
+
+    Exceptions:
+    ValueError if a parameter is not one of PARAMS or its value is not
+    a number
+    """
+    params = {}
+    for param in filter(None, (param.strip() for param in text.split(","))):
+        name, _, value = param.partition("=")
+        name = name.strip()
+        if name not in PARAMS:
+            raise ValueError(f"Unknown BM25F parameter: {name}")
+        params[name] = float(value)
+    return params
@@ -0,0 +1,393 @@
+# boolean_query.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Boolean and fielded search queries.
+#
+#   A query may combine words with AND, OR, NOT and parentheses, and
+#   filter by field:
+#       dept:COMPSCI            courses of a department
+#       title:learning          courses with a word in their title
+#       prereq:"I&C SCI 33"     courses requiring a course (refer to prereqs.py)
+#       "machine learning"      courses containing a phrase
+#   i.e. (algorithm OR "data structures") AND dept:COMPSCI NOT graduate
+#
+#   Words next to each other are ANDed. Words which are not indexed
+#   (i.e. stopwords) are left out, as they are by searches without
+#   operators, so "introduction to programming" still matches courses
+#   without the word "to" in the index. Every term is evaluated into a
+#   list of course IDs (refer to courses.py) in ascending order, so
+#   lists are combined by merging and intersecting them in order
+#   instead of accumulating every course in a hash-map. Intersections
+#   start from the shortest list and binary search the longer ones, so
+#   selective queries only touch a few postings.
+
+from index import tokenize, is_word
+from query_cache import QueryCache
+
+import re
+from bisect import bisect_left
+
+OPERATORS = ("AND", "OR", "NOT")
+
+# Number of terms whose posting lists (and weights) are kept in memory
+TERM_CACHE_SIZE = 4096
+FIELDS = ("dept", "title", "prereq")
+
+_LEXER = re.compile(r'''
+    (?P<paren>[()])
+  | (?P<field>\w+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+))
+  | "(?P<phrase>[^"]*)"
+  | (?P<word>[^\s()"]+)
+''', re.VERBOSE)
+
+
+class BooleanQueryError(Exception):
+    pass
+
+
+def is_boolean(query: str) -> bool:
+    """
+    Checks if a query uses any operator or field, otherwise it is
+    searched as a list of words.
+    """
+    for match in _LEXER.finditer(query):
+        if match.group("word") in OPERATORS or match.group("field") in FIELDS:
+            return True
+    return False
+
+
+def parse(query: str, lemmatize, is_indexed=None) -> tuple:
+    """
+    Parses a query into a tree of tuples:
+        ("or", node, ...), ("and", node, ...), ("not", node),
+        ("term", token), ("title", token), ("phrase", phrase),
+        ("dept", department), ("prereq", course)
+        - Words are tokenized and lemmatized with lemmatize, phrases are
+          tuples of (token, position within the phrase)
+        - If given, words whose lemma is not is_indexed(lemma) are left
+          out, and so are operands left without any word
+
+    Exceptions:
+    BooleanQueryError if the query is malformed, i.e. unbalanced
+    parentheses, an unknown field or an operator without operand, or if
+    it has no indexed word nor field
+    """
+    tokens = []
+    position = 0
+    for match in _LEXER.finditer(query):
+        if query[position:match.start()].strip():
+            raise BooleanQueryError(f"Unexpected {query[position:match.start()].strip()!r}")
+        tokens.append(match)
+        position = match.end()
+    if query[position:].strip():
+        raise BooleanQueryError(f"Unexpected {query[position:].strip()!r}")
+
+    parser = _Parser(tokens, lemmatize, is_indexed)
+    tree = parser.parse_or()
+    if parser.peek() is not None:
+        raise BooleanQueryError(f"Unexpected {parser.peek().group()!r}")
+    if tree is None:
+        raise BooleanQueryError("No indexed words in query")
+    return tree
+
+
+def positive_tokens(tree: tuple) -> list:
+    """
+    Returns the tokens of every word, title and phrase term which is not
+    under a NOT, in the order of the query (used to rank results).
+    """
+    kind = tree[0]
+    if kind == "not":
+        return []
+    if kind in ("and", "or"):
+        return [token for node in tree[1:] for token in positive_tokens(node)]
+    if kind in ("term", "title"):
+        return [tree[1]]
+    if kind == "phrase":
+        return [token for token, _ in tree[1]]
+    return []
+
+
+def evaluate(tree: tuple, postings: 'IdPostings') -> list:
+    """
+    Returns the IDs of every course matching the tree, in ascending
+    order.
+    """
+    kind = tree[0]
+    if kind == "or":
+        result = []
+        for node in tree[1:]:
+            result = _union(result, evaluate(node, postings))
+        return result
+
+    if kind == "and":
+        included = [evaluate(node, postings) for node in tree[1:] if node[0] != "not"]
+        excluded = [evaluate(node[1], postings) for node in tree[1:] if node[0] == "not"]
+        return _difference_all(_intersect_all(included) if included else postings.all(), excluded)
+
+    if kind == "not":
+        return _difference_all(postings.all(), [evaluate(tree[1], postings)])
+
+    return postings.get(tree)
+
+
+def _intersect_all(lists: list) -> list:
+    """
+    Intersects sorted lists, shortest first, stopping once empty.
+    """
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not result:
+            break
+        result = _intersect(result, other)
+    return result
+
+
+def _intersect(a: list, b: list) -> list:
+    """
+    Returns the IDs in both sorted lists, binary searching the longer
+    list for each ID of the shorter one.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+
+    result = []
+    j = 0
+    for x in a:
+        j = bisect_left(b, x, j)
+        if j == len(b):
+            break
+        if b[j] == x:
+            result.append(x)
+    return result
+
+
+def _union(a: list, b: list) -> list:
+    """
+    Returns the IDs in either sorted list, merging them in one pass.
+    """
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            result.append(a[i])
+            i += 1
+        elif a[i] > b[j]:
+            result.append(b[j])
+            j += 1
+        else:
+            result.append(a[i])
+            i += 1
+            j += 1
+    return result+a[i:]+b[j:]
+
+
+def _difference_all(a: list, lists: list) -> list:
+    """
+    Returns the IDs of sorted list a which are in none of the lists.
+    """
+    for b in lists:
+        if not a:
+            break
+        result = []
+        j = 0
+        for x in a:
+            j = bisect_left(b, x, j)
+            if j == len(b) or b[j] != x:
+                result.append(x)
+        a = result
+    return a
+
+
+class _Parser:
+    def __init__(self, tokens: list, lemmatize, is_indexed):
+        """
+        Recursive descent parser over the tokens of a query, refer to
+        parse.
+            - Each parse_* method returns None if its operand only has
+              words which are not indexed
+        """
+        self._tokens = tokens
+        self._position = 0
+        self._lemmatize = lemmatize
+        self._is_indexed = is_indexed if is_indexed is not None else lambda token: True
+
+
+    def peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+
+    def parse_or(self) -> tuple:
+        nodes = [self.parse_and()]
+        while self._is_word("OR"):
+            self._position += 1
+            nodes.append(self.parse_and())
+        return _join("or", nodes)
+
+
+    def parse_and(self) -> tuple:
+        nodes = [self.parse_not()]
+        while self.peek() is not None and self.peek().group() != ")" and not self._is_word("OR"):
+            if self._is_word("AND"):
+                self._position += 1
+            nodes.append(self.parse_not())
+        return _join("and", nodes)
+
+
+    def parse_not(self) -> tuple:
+        if self._is_word("NOT"):
+            self._position += 1
+            node = self.parse_not()
+            return None if node is None else ("not", node)
+        return self.parse_term()
+
+
+    def parse_term(self) -> tuple:
+        token = self.peek()
+        if token is None:
+            raise BooleanQueryError("Query ends with an operator")
+        self._position += 1
+
+        if token.group() == "(":
+            node = self.parse_or()
+            if self.peek() is None or self.peek().group() != ")":
+                raise BooleanQueryError("Unbalanced parentheses")
+            self._position += 1
+            return node
+        if token.group() == ")" or token.group("word") in OPERATORS:
+            raise BooleanQueryError(f"Unexpected {token.group()!r}")
+
+        if token.group("field") is not None:
+            field = token.group("field")
+            value = token.group("quoted") if token.group("quoted") is not None else token.group("value")
+            if field not in FIELDS:
+                raise BooleanQueryError(f"Unknown field {field!r}, expected one of: {', '.join(FIELDS)}")
+            if field == "dept":
+                return ("dept", value.strip().upper())
+            if field == "prereq":
+                return ("prereq", " ".join(value.upper().split()))
+            return self._words(value, "title")
+
+        if token.group("phrase") is not None:
+            phrase = tuple((lemma, i) for lemma, i in self._lemmas(token.group("phrase")) if self._is_indexed(lemma))
+            if len(phrase) > 1:
+                return ("phrase", phrase)
+            return self._words(token.group("phrase"), "term")
+
+        return self._words(token.group("word"), "term")
+
+
+    def _words(self, text: str, kind: str) -> tuple:
+        """
+        Returns a term of each indexed word of text, ANDed if there are
+        many, or None if none is indexed.
+
+        Exceptions:
+        BooleanQueryError if text has no words
+        """
+        lemmas = self._lemmas(text)
+        if not lemmas:
+            raise BooleanQueryError(f"No words in {text!r}")
+        return _join("and", [(kind, lemma) for lemma, _ in lemmas if self._is_indexed(lemma)])
+
+
+    def _lemmas(self, text: str) -> list:
+        """
+        Returns the (lemma, position) of each word of text.
+        """
+        return [(self._lemmatize(word), i) for i, word in enumerate(tokenize(text)) if is_word(word)]
+
+
+    def _is_word(self, word: str) -> bool:
+        token = self.peek()
+        return token is not None and token.group("word") == word
+
+
+def _join(operator: str, nodes: list):
+    """
+    Returns the nodes which are not None joined by operator, the only
+    one, or None if there are none.
+    """
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else (operator, *nodes)
+
+
+class IdPostings:
+    def __init__(self, table: 'CourseTable', inverted_index: dict, get_positions, get_prereq_graph):
+        """
+        Posting lists of course IDs in ascending order, built from the
+        inverted index on first use of each term.
+            - get_positions returns the positional index (refer to
+              phrases.py), only called for phrases
+            - get_prereq_graph returns the prerequisite graph (refer to
+              prereq_graph.py), only called for prereq: terms. Its IDs
+              are those of the table, both in the order of index.txt
+            - The lists and weights of the last TERM_CACHE_SIZE terms
+              are kept, unless they are empty
+        """
+        self._table = table
+        self._inverted_index = inverted_index
+        self._get_positions = get_positions
+        self._get_prereq_graph = get_prereq_graph
+        self._lists = QueryCache(TERM_CACHE_SIZE)
+        self._weights = QueryCache(TERM_CACHE_SIZE)
+        self._all = list(range(len(table)))
+
+
+    def all(self) -> list:
+        return self._all
+
+
+    def get(self, term: tuple) -> list:
+        """
+        Returns the IDs of the courses matching a term (refer to parse).
+        """
+        ids = self._lists.get(term, 0)
+        if ids is not None:
+            return ids
+
+        kind, value = term
+        if kind == "term":
+            ids = self._ids(page[0] for page in self._inverted_index.get(value, []))
+        elif kind == "title":
+            postings = self._inverted_index.get(value, [])
+            if postings and len(postings[0]) < 5:
+                raise BooleanQueryError("title: needs field frequencies, rebuild the inverted index")
+            ids = self._ids(page[0] for page in postings if page[3])
+        elif kind == "dept":
+            ids = [i for i in self._all if self._table.dept(i) == value]
+        elif kind == "prereq":
+            ids = self._get_prereq_graph().dependents_of(value)
+        elif kind == "phrase":
+            positions = self._get_positions()
+            if len(positions):
+                ids = self._ids(positions.match_phrase(value))
+            else:
+                return _intersect_all([self.get(("term", token)) for token, _ in value])
+
+        if ids:
+            self._lists.put(term, 0, ids)
+        return ids
+
+
+    def weights(self, token: str, scorer: 'BM25F' = None) -> dict:
+        """
+        Returns the TF-IDF weight of token within each course it is in
+        (or its BM25F weight if given a scorer), by course ID.
+        """
+        key = (token, scorer is not None)
+        weights = self._weights.get(key, 0)
+        if weights is None:
+            pages = scorer.weights(token) if scorer is not None else self._inverted_index.get(token, [])
+            weights = {self._table.id_of(page[0]): page[-1] if scorer is not None else page[2]
+                       for page in pages if page[0] in self._table}
+            if weights:
+                self._weights.put(key, 0, weights)
+        return weights
+
+
+    def _ids(self, courses) -> list:
+        table = self._table
+        return sorted(table.id_of(course) for course in courses if course in table)
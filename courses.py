@@ -0,0 +1,100 @@
+# courses.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Table of every course in the index, by integer ID.
+#
+#   index.txt maps each course to a [dept, title, description, prereq]
+#   list, repeating each department's name for every one of its
+#   courses. The course table instead gives every course a dense
+#   integer ID (in the order of index.txt) and keeps its row by ID,
+#   with department names interned and stored once.
+#
+#   Courses have the same IDs in the binary inverted index (refer to
+#   postings.py), the prerequisite trees and graph (refer to prereqs.py)
+#   and the posting lists of boolean queries (refer to boolean_query.py).
+#
+#   The table can still be read as the index, looking a course up
+#   returns its stored row (which must not be modified):
+#   {
+#       class: [department, title, description, prerequisites], ...
+#   }
+
+import ujson
+
+import sys
+from collections.abc import Mapping
+
+INDEX_PATH = "index.txt"
+
+
+class CourseTable(Mapping):
+    def __init__(self, index: dict):
+        """
+        Initialize a course table from the index (refer to
+        Index.get_index).
+        """
+        self._codes = []
+        self._ids = {}
+        self._rows = []
+
+        for course, (dept, title, description, prereq) in index.items():
+            self._ids[course] = len(self._codes)
+            self._codes.append(course)
+            self._rows.append([sys.intern(dept), title, description, prereq])
+
+
+    def __getitem__(self, course: str) -> list:
+        return self._rows[self._ids[course]]
+
+
+    def __contains__(self, course) -> bool:
+        return course in self._ids
+
+
+    def __iter__(self):
+        return iter(self._codes)
+
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+
+    def id_of(self, course: str) -> int:
+        """
+        Returns the ID of course.
+
+        Exceptions:
+        KeyError if course is not in the table
+        """
+        return self._ids[course]
+
+
+    def code(self, course_id: int) -> str:
+        """
+        Returns the course with the given ID (e.g. "I&C SCI 46").
+        """
+        return self._codes[course_id]
+
+
+    def dept(self, course_id: int) -> str:
+        return self._rows[course_id][0]
+
+
+    def title(self, course_id: int) -> str:
+        return self._rows[course_id][1]
+
+
+    def description(self, course_id: int) -> str:
+        return self._rows[course_id][2]
+
+
+    def prereq(self, course_id: int) -> str:
+        return self._rows[course_id][3]
+
+
+def load_course_table(path: str = INDEX_PATH) -> 'CourseTable':
+    """
+    Returns the course table of the index at path.
+        - The index itself is not kept once the table is built
+    """
+    with open(path, 'r') as f:
+        return CourseTable(ujson.load(f))
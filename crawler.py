@@ -0,0 +1,278 @@
+# crawler.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Fetches pages from UCI's catalogue for the indexer.
+#
+#   A single keep-alive session is shared by every request so that
+#   connections to catalogue.uci.edu are pooled and reused. Pages can
+#   be fetched concurrently by a bounded pool of threads, while
+#   results are always handed back in the order they were requested.
+#
+#   Pages may also be kept in an on-disk cache. Cached pages are
+#   revalidated with conditional requests (ETag/Last-Modified), and a
+#   page whose content hash has not changed is not parsed again.
+#   Entries are stamped with the version of the cache format and of the
+#   parser, and ones written by another version are not trusted.
+#
+#   A ReplayCrawler serves pages from a saved snapshot of the catalogue
+#   instead, so that indexes can be built (and timed) without network.
+
+import requests
+from requests.adapters import HTTPAdapter
+import ujson
+
+import os
+import hashlib
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+# Layout of page cache entries; bump whenever their fields change
+CACHE_FORMAT = 1
+
+
+class PageCache:
+    def __init__(self, directory: str, parser_version: int = 0):
+        """
+        Initialize a page cache stored in directory, keyed by URL.
+            Each entry takes the form of:
+            {
+                url, etag, last_modified, sha256, body, parsed, format,
+                parser_version
+            }
+            - parser_version names the parser whose results are cached
+              (refer to index.PARSER_VERSION); results of any other
+              version are parsed again
+        """
+        self._directory = directory
+        self._parser_version = parser_version
+        os.makedirs(directory, exist_ok=True)
+
+
+    def load(self, url: str) -> dict:
+        """
+        Returns the cached entry of url, or None if it is not cached.
+            - Entries written in another cache format are not cached
+            - Entries parsed by another parser version are returned
+              without their parsed result, so that only parsing is
+              repeated (the page is still revalidated, refer to
+              Crawler.get)
+        """
+        try:
+            with open(self._path(url), 'r') as f:
+                entry = ujson.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(entry, dict) or entry.get("format") != CACHE_FORMAT:
+            return None
+        if entry.get("parser_version") != self._parser_version:
+            entry["parsed"] = None
+        return entry
+
+
+    def store(self, url: str, entry: dict) -> None:
+        """
+        Writes the entry of url into the cache, stamped with the cache
+        format and parser version.
+            - Written to a temporary file first, so that a crash never
+              leaves a partially written entry behind
+        """
+        entry = dict(entry, format=CACHE_FORMAT, parser_version=self._parser_version)
+        path = self._path(url)
+        with open(path+".tmp", 'w') as f:
+            ujson.dump(entry, f)
+        os.replace(path+".tmp", path)
+
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self._directory, hashlib.sha1(url.encode()).hexdigest()+".json")
+
+
+class Snapshot:
+    def __init__(self, directory: str):
+        """
+        Initialize a snapshot of saved pages stored in directory.
+            - manifest.json maps each saved URL to its html file
+        """
+        self._directory = directory
+        self._manifest_path = os.path.join(directory, "manifest.json")
+
+        try:
+            with open(self._manifest_path, 'r') as f:
+                self._manifest = ujson.load(f)
+        except FileNotFoundError:
+            self._manifest = {}
+
+
+    def save(self, url: str, body: str) -> None:
+        """
+        Saves the source code of the page at url into the snapshot.
+            - Pages are named by a hash of their URL, so that no two URLs
+              share a file. Snapshots saved under earlier names are still
+              read through their manifest
+        """
+        os.makedirs(self._directory, exist_ok=True)
+
+        filename = hashlib.sha1(url.encode()).hexdigest()+".html"
+        with open(os.path.join(self._directory, filename), 'w', encoding='utf-8') as f:
+            f.write(body)
+
+        self._manifest[url] = filename
+        with open(self._manifest_path, 'w') as f:
+            ujson.dump(self._manifest, f, indent=4)
+
+
+    def load(self, url: str) -> str:
+        """
+        Returns the saved source code of the page at url.
+
+        Exceptions:
+        KeyError if url is not in the snapshot
+        """
+        with open(os.path.join(self._directory, self._manifest[url]), 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+class Crawler:
+    def __init__(self, concurrency: int = 1, timeout: float = 30, cache: 'PageCache' = None):
+        """
+        Initialize a crawler over a pooled HTTP session
+        - concurrency is the maximum number of pages in flight at once
+        - Can be given a PageCache to revalidate pages against
+        """
+        self._concurrency = max(1, concurrency)
+        self._timeout = timeout
+        self._cache = cache
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        self._stats_lock = Lock()
+        self.stats = {"downloaded": 0, "not_modified": 0, "unchanged": 0}
+
+
+    def get(self, url: str, parse=None):
+        """
+        Returns the source code of the page at url.
+            - If given, returns parse(source) instead. When the page is
+              cached and its content has not changed, the cached result
+              of parse is returned without parsing the page again
+
+        Exceptions:
+        requests.RequestException if the page could not be retrieved
+        """
+        entry = self._cache.load(url) if self._cache is not None else None
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self._session.get(url, headers=headers, timeout=self._timeout)
+
+        modified = False
+        if entry is not None and response.status_code == 304:
+            self._count("not_modified")
+        else:
+            response.raise_for_status()
+            body = response.text
+            sha256 = hashlib.sha256(body.encode()).hexdigest()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+            if entry is not None and entry["sha256"] == sha256:
+                # Same content under new validators, keep what was parsed
+                self._count("unchanged")
+                modified = entry["etag"] != etag or entry["last_modified"] != last_modified
+                entry["etag"] = etag
+                entry["last_modified"] = last_modified
+            else:
+                self._count("downloaded")
+                modified = True
+                entry = {
+                    "url": url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "sha256": sha256,
+                    "body": body,
+                    "parsed": None,
+                }
+
+        if parse is not None and entry["parsed"] is None:
+            entry["parsed"] = parse(entry["body"])
+            modified = True
+
+        if modified and self._cache is not None:
+            self._cache.store(url, entry)
+
+        return entry["body"] if parse is None else entry["parsed"]
+
+
+    def get_all(self, urls: list, parse=None):
+        """
+        Fetches every url, yielding (url, result, error) tuples in the
+        same order as urls.
+            - Up to `concurrency` pages are downloaded (and parsed) at once
+            - result is the source code, or parse(source), refer to get
+            - error is None on success, otherwise the raised exception
+        """
+        if self._concurrency == 1:
+            for url in urls:
+                yield self._get_safe(url, parse)
+            return
+
+        with ThreadPoolExecutor(max_workers=self._concurrency) as pool:
+            for result in pool.map(lambda url: self._get_safe(url, parse), urls):
+                yield result
+
+
+    def _get_safe(self, url: str, parse) -> tuple:
+        """
+        Refer to get. Returns the error instead of raising it.
+        """
+        try:
+            return (url, self.get(url, parse), None)
+        except Exception as e:
+            return (url, None, e)
+
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+
+class ReplayCrawler:
+    def __init__(self, directory: str):
+        """
+        Initialize a crawler which replays the pages of a snapshot,
+        refer to Index.capture_snapshot.
+        """
+        self._snapshot = Snapshot(directory)
+        self.stats = {"replayed": 0}
+
+
+    def get(self, url: str, parse=None):
+        """
+        Returns the saved source code of the page at url, or
+        parse(source) if given.
+
+        Exceptions:
+        KeyError if url is not in the snapshot
+        """
+        body = self._snapshot.load(url)
+        self.stats["replayed"] += 1
+        return body if parse is None else parse(body)
+
+
+    def get_all(self, urls: list, parse=None):
+        """
+        Refer to Crawler.get_all. Pages are replayed one at a time.
+        """
+        for url in urls:
+            try:
+                yield (url, self.get(url, parse), None)
+            except Exception as e:
+                yield (url, None, e)
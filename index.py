@@ -8,17 +8,23 @@
 #       class: [department, title, description, prerequisites], ...
 #   }
 
-import requests
 from unidecode import unidecode
 from lxml import html
 import ujson
 
-import nltk
-from nltk.tokenize import wordpunct_tokenize
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords, wordnet
-
+import os
+import re
+import argparse
+from time import perf_counter
 from math import log10
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from crawler import Crawler, PageCache, ReplayCrawler, Snapshot
+from prereqs import build_prereqs, PREREQS_PATH
+from phrases import BinaryPositions, write_positions, POSITIONS_PATH
+from postings import write_postings, POSTINGS_PATH
 
 # Run these lines once to download packages for lemmatization
 # nltk.download('punkt')
@@ -29,6 +35,22 @@ from math import log10
 
 COURSES_URL = "https://catalogue.uci.edu/allcourses/"
 
+# Version of the department page parser (Index._parse_dept_page); bump
+# whenever what it returns changes, so that cached pages are parsed again
+PARSER_VERSION = 1
+
+# Maximum number of distinct tokens whose lemma is memoized
+LEMMA_CACHE_SIZE = 65536
+
+# Number of courses whose tokens are tagged per call when tagging in
+# batches
+TAG_BATCH_SIZE = 256
+
+# Same tokens as nltk.tokenize.wordpunct_tokenize, without importing NLTK
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]+")
+
+_LEMMATIZER = None
+
 
 class DepartmentException(Exception):
     pass
@@ -44,12 +66,33 @@ class Course:
 
 
 class Index:
-    def __init__(self):
+    def __init__(self, crawler: 'Crawler' = None, batch_tagging: bool = False, workers: int = 1, positions: bool = False):
+        """
+        Initialize an empty index
+        - Can be given a crawler to fetch pages with, i.e. a
+          Crawler(concurrency=16) to crawl departments concurrently, or
+          a ReplayCrawler to build from a saved snapshot
+        - If batch_tagging, the tokens of many courses are tagged in one
+          tagger call when indexing, instead of one call per token (the
+          lemmas are the same)
+        - workers is the number of processes courses are tokenized and
+          lemmatized in when building the inverted index
+        - If positions, the position of every token within each course's
+          title and description is also written (positions.bin), for
+          phrase and proximity queries
+        """
         self._index = {}
         self._inverted_index = {}
+        self._field_lengths = {}
+        self._positions = {}
+        self._prereqs = {}
+        self._crawler = crawler if crawler is not None else Crawler()
+        self._batch_tagging = batch_tagging
+        self._workers = max(1, workers)
+        self._store_positions = positions
 
-        self._stopwords = set(stopwords.words('english'))
-        self._lemmatizer = WordNetLemmatizer()
+        self._lemmas = {}
+        self._lemmas_read = False
 
 
     def format_dept(self, course: str) -> str:
@@ -85,6 +128,93 @@ class Index:
         return Course(unidecode(course), unidecode(title), unidecode(dept), unidecode(description))
 
 
+    def parse_course(self, course_info: str) -> Course:
+        """
+        Returns a Course object from the text of a course block,
+        including its prerequisites (if any).
+        """
+        course_obj = self.format_course_info(course_info)
+
+        prereq_index = course_info.find('Prerequisite')
+        if prereq_index != -1:
+            prereq_str = course_info[prereq_index+14:course_info.find('\n', prereq_index+14)]
+            course_obj.prereq_str = unidecode(prereq_str)
+
+        return course_obj
+
+
+    def crawl(self) -> tuple:
+        """
+        Crawls every department page exactly once and parses its courses.
+            Returns (depts, errors):
+                - depts: list of each department's Course objects, in
+                         department order
+                - errors: links that could not be fetched or parsed
+
+        Every index can then be built from the same crawl, refer to
+        create_indexes.
+        """
+        errors = []
+        depts = []
+        for link, courses in self._crawl_departments(errors):
+            depts.append([self.parse_course(c) for c in courses])
+
+        return (depts, errors)
+
+
+    def create_indexes(self, by_dept: bool = False) -> None:
+        """
+        Crawls the catalogue once and creates every index from it:
+            - index.txt, refer to create_index
+            - inverted_index.txt, refer to create_inverted_index
+            - dept/*_index.txt if by_dept, refer to create_index_by_dept
+            - inverted_index.bin and catalogue.db if they exist, refer to
+              _write_binary_indexes
+        """
+        start = perf_counter()
+        depts, errors = self.crawl()
+        crawled = perf_counter()
+
+        self._build_index(depts)
+        self._build_inverted_index(depts)
+        built = perf_counter()
+
+        self._write_index()
+        self._write_inverted_index()
+        self._write_binary_indexes()
+        if by_dept:
+            self._write_index_by_dept(depts)
+
+        print(f"Crawled {sum(len(courses) for courses in depts)} courses in {crawled-start:.2f}s")
+        print(f"Built indexes in {built-crawled:.2f}s")
+        self._report_errors(errors)
+
+
+    def capture_snapshot(self, directory: str) -> None:
+        """
+        Saves the course listing and every department's page into a
+        snapshot directory, which can be crawled offline by passing a
+        ReplayCrawler(directory) to Index.
+        """
+        snapshot = Snapshot(directory)
+
+        print("Obtaining course links of departments...")
+        page_content_get = self._crawler.get(COURSES_URL)
+        snapshot.save(COURSES_URL, page_content_get)
+
+        errors = []
+        for link, course_content_get, error in self._crawler.get_all(self._parse_dept_links(page_content_get)):
+            if error is not None:
+                print("ERROR SAVING PAGE:", link)
+                errors.append(link)
+            else:
+                snapshot.save(link, course_content_get)
+                print("Saved link:", link)
+
+        print("Snapshot completed!")
+        self._report_errors(errors)
+
+
     def create_index(self) -> None:
         """
         Obtains course links of every department and creates index.
@@ -99,58 +229,14 @@ class Index:
             {
                 class: [department, title, description, prerequisites], ...
             }
-        """
-        print("Obtaining course links of departments...")
-
-        # Get the course site source code
-        # - Trims source code to section with department links
-        page_content_get = requests.get(COURSES_URL).text
-        start_index = page_content_get.index('<h2 class="letternav-head" id=\'A\'><a name=\'A\'>A</a></h2>')
-        end_index = page_content_get.index('</div><!--end #textcontainer -->', start_index)
-        page_content = html.fromstring(page_content_get[start_index:end_index])
-        page_content.make_links_absolute(COURSES_URL)
 
-        # Retrieve all department specific links
-        dept_links = []
-        for info in page_content.iterlinks():
-            if info[1] == "href":
-                dept_links.append(info[2])
-
-        # Try to open each link and write index to file
-        errors = []
-        for link in dept_links:   
-            print("Scraping link:", link)         
-            try:
-                # Extracting html content
-                course_content_get = requests.get(link).text
-                start_index = course_content_get.index('<div id="courseinventorycontainer" class="page_content tab_content">')
-                end_index = course_content_get.index('<footer>', start_index)
-                course_content_get = course_content_get[start_index:end_index]
-                courses = [html.fromstring(section).xpath("string()") for section in course_content_get.split('<div class="courseblock">')][1:]
-            except:
-                print("ERROR PARSING PAGE:", link)
-                errors.append(link)
-            else:
-                for c in courses:
-                    course_obj = self.format_course_info(c)
-                    prereq_index = c.find('Prerequisite')
-                    if prereq_index != -1:
-                        prereq_str = c[prereq_index+14:c.find('\n', prereq_index+14)]
-                        course_obj.prereq_str = unidecode(prereq_str)
-                    
-                    self._index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
-                    # print([course_obj.course, course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str])
-                    print("Written", course_obj.course)
-
-        # Dumps index into json
-        print("Writing index into file...")
-        with open("index.txt", 'w') as index:
-            ujson.dump(self._index, index)
-        
-        print("Index completed!")
-        print("Error count:", len(errors))
-        for link in errors:
-            print(link)
+        Writes the prerequisites of every course, parsed into expression
+        trees, into JSON txt file (prereqs.txt), refer to prereqs.py.
+        """
+        depts, errors = self.crawl()
+        self._build_index(depts)
+        self._write_index()
+        self._report_errors(errors)
         
     
     def create_inverted_index(self):
@@ -166,87 +252,20 @@ class Index:
             Index takes the form of:
             {
                 token: [
-                    [course, frequency, tf-idf]
+                    [course, frequency, tf-idf, title frequency, description frequency]
                 ], ...
             }
-        """
-        print("Obtaining course links of departments...")
-        
-        # Get the course site source code
-        # - Trims source code to section with department links
-        page_content_get = requests.get(COURSES_URL).text
-        start_index = page_content_get.index('<h2 class="letternav-head" id=\'A\'><a name=\'A\'>A</a></h2>')
-        end_index = page_content_get.index('</div><!--end #textcontainer -->', start_index)
-        page_content = html.fromstring(page_content_get[start_index:end_index])
-        page_content.make_links_absolute(COURSES_URL)
 
-        # Retrieve all department specific links
-        dept_links = []
-        for info in page_content.iterlinks():
-            if info[1] == "href":
-                dept_links.append(info[2])
+        Writes the length of each course's title and description into
+        JSON txt file (fields.txt), refer to get_field_lengths.
 
-        # Try to open each link and write index to file
-        errors = []
-        num_courses = 0
-        for link in dept_links:   
-            print("Scraping link:", link)         
-            try:
-                # Extracting html content
-                course_content_get = requests.get(link).text
-                start_index = course_content_get.index('<div id="courseinventorycontainer" class="page_content tab_content">')
-                end_index = course_content_get.index('<footer>', start_index)
-                course_content_get = course_content_get[start_index:end_index]
-                courses = [html.fromstring(section).xpath("string()") for section in course_content_get.split('<div class="courseblock">')][1:]
-            except:
-                print("ERROR PARSING PAGE:", link)
-                errors.append(link)
-            else:
-                for c in courses:
-                    course_obj = self.format_course_info(c)
-                    num_courses += 1
-
-                    # Add tokens from title and description into inverted index
-                    # - Note: Title tokens are weighed 3x higher
-                    title_tokens = set(self._lemmatize_with_pos(token) for token in wordpunct_tokenize(course_obj.title))-self._stopwords
-                    tokens = [self._lemmatize_with_pos(token) for token in wordpunct_tokenize(course_obj.title)]
-                    tokens += [self._lemmatize_with_pos(token) for token in wordpunct_tokenize(course_obj.description)]
-                    tokens = set(tokens)-self._stopwords
-                    for token in tokens:
-                        add = 1 if token not in title_tokens else 3
-
-                        if token not in self._inverted_index:
-                            self._inverted_index[token] = [[course_obj.course, add]]
-                        else:
-                            for i in range(len(self._inverted_index[token])):
-                                if self._inverted_index[token][i][0] == course_obj.course:
-                                    break
-                            
-                            if self._inverted_index[token][i][0] == course_obj.course:
-                                self._inverted_index[token][i][1] += add
-                            else:
-                                self._inverted_index[token].append([course_obj.course, add])
-                    
-                    print("Written", course_obj.course)
-        
-        # Writing TF-IDF scores
-        print("Writing TF-IDF scores...")
-        for token in self._inverted_index:
-            print("Writing token:", token)
-            for page in self._inverted_index[token]:
-                tf_idf = 0 if 1+log10(page[1]) <= 0 else \
-                        (1+log10(page[1]))*(log10(num_courses/len(self._inverted_index[token])))
-                page.append(tf_idf)
-
-        # Dumps inverted index into json
-        print("Writing inverted index into file...")
-        with open("inverted_index.txt", 'w') as inverted_index:
-            ujson.dump(self._inverted_index, inverted_index)
-        
-        print("Inverted Index completed!")
-        print("Error count:", len(errors))
-        for link in errors:
-            print(link)
+        If positions, also writes the position of each token into a
+        binary file (positions.bin), refer to get_positions.
+        """
+        depts, errors = self.crawl()
+        self._build_inverted_index(depts)
+        self._write_inverted_index()
+        self._report_errors(errors)
 
 
     def create_index_by_dept(self) -> None:
@@ -264,11 +283,477 @@ class Index:
                 class: [department, title, description, prerequisites], ...
             }
         """
+        depts, errors = self.crawl()
+        self._write_index_by_dept(depts)
+        self._report_errors(errors)
+
+
+    def _build_index(self, depts: list) -> None:
+        """
+        Adds every crawled course into the index.
+        """
+        for courses in depts:
+            for course_obj in courses:
+                self._index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
+                print("Written", course_obj.course)
+
+
+    def _build_inverted_index(self, depts: list) -> None:
+        """
+        Adds the tokens of every crawled course into the inverted index,
+        then writes the TF-IDF score of each posting.
+        """
+        courses = [course_obj for dept in depts for course_obj in dept]
+
+        self._lemmas = {}
+        self._lemmas_read = True
+        if self._workers > 1:
+            analyses, lemmas = self._analyze_courses_in_parallel(courses)
+        else:
+            analyses, lemmas = self._analyze_courses(courses), None
+
+        analyzed = []
+        for course_obj, tokens in zip(courses, analyses):
+            analyzed.append((course_obj.course, tokens))
+            print("Written", course_obj.course)
+
+        if lemmas is None:
+            cache_info = _lemmatize_tagged.cache_info() if self._batch_tagging else self.lemma_cache_info()
+            print(f"Lemmatizer cache: {cache_info.hits} hits, {cache_info.misses} misses")
+
+        print("Writing TF-IDF scores...")
+        self._inverted_index = self._build_postings(analyzed)
+        self._field_lengths = self._build_field_lengths(analyzed)
+
+        print("Writing lemma table...")
+        if lemmas is None:
+            self._add_lemmas(courses)
+        else:
+            self._lemmas = lemmas
+
+        if self._store_positions:
+            print("Writing token positions...")
+            self._positions = self._build_positions(courses)
+
+
+    def _build_postings(self, analyzed: list) -> dict:
+        """
+        Returns the inverted index of analyzed courses, given as a list of
+        (course, {token: (frequency, title frequency, description frequency)}).
+            - Postings are accumulated in a hash-map of each token's
+              courses, so adding a course never scans a posting list
+            - Tokens and postings keep the order they were first seen in
+            - IDF counts each course once, as update_departments does
+        """
+        postings = {}
+        for course, tokens in analyzed:
+            for token, add in tokens.items():
+                pages = postings.get(token)
+                if pages is None:
+                    postings[token] = {course: list(add)}
+                elif course not in pages:
+                    pages[course] = list(add)
+                else:
+                    pages[course] = [x+y for x, y in zip(pages[course], add)]
+
+        num_courses = len(dict.fromkeys(course for course, _ in analyzed))
+        inverted_index = {}
+        for token, pages in postings.items():
+            document_frequency = len(pages)
+            inverted_index[token] = [[course, frequency, self._tf_idf(frequency, document_frequency, num_courses), title, description]
+                                     for course, (frequency, title, description) in pages.items()]
+
+        return inverted_index
+
+
+    def _build_field_lengths(self, analyzed: list) -> dict:
+        """
+        Returns the number of (non-stopword) tokens in the title and
+        description of analyzed courses, refer to _build_postings.
+        """
+        field_lengths = {}
+        for course, tokens in analyzed:
+            lengths = field_lengths.setdefault(course, [0, 0])
+            for _, title, description in tokens.values():
+                lengths[0] += title
+                lengths[1] += description
+
+        return field_lengths
+
+
+    def _build_positions(self, courses: list) -> dict:
+        """
+        Returns the positions of every word (stopwords included) within
+        the titles and descriptions of courses, refer to get_positions.
+            - Positions count every token, punctuation included, so that
+              only words which are next to each other are 1 apart
+            - Words are lemmatized with the lemma table, as query tokens
+              are
+        """
+        positions = {}
+        for course_obj in courses:
+            for field, text in enumerate((course_obj.title, course_obj.description)):
+                for position, token in enumerate(tokenize(text)):
+                    if not is_word(token):
+                        continue
+
+                    pages = positions.setdefault(self._lemmas[token], {})
+                    pages.setdefault(course_obj.course, [[], []])[field].append(position)
+
+        return {token: [[course, title, description] for course, (title, description) in pages.items()]
+                for token, pages in positions.items()}
+
+
+    def _analyze_course(self, course_obj: Course) -> dict:
+        """
+        Returns the frequency of each token in a course, refer to
+        _count_tokens.
+        """
+        return self._count_tokens(
+            [self._lemmatize_with_pos(token) for token in tokenize(course_obj.title)],
+            [self._lemmatize_with_pos(token) for token in tokenize(course_obj.description)])
+
+
+    def _analyze_courses(self, courses: list):
+        """
+        Yields the frequency of each token in every course, refer to
+        _analyze_course.
+            - If batch tagging, the new tokens of up to TAG_BATCH_SIZE
+              courses are added into the lemma table at once (refer to
+              _add_lemmas), then looked up in it
+        """
+        if not self._batch_tagging:
+            for course_obj in courses:
+                yield self._analyze_course(course_obj)
+            return
+
+        for i in range(0, len(courses), TAG_BATCH_SIZE):
+            chunk = courses[i:i+TAG_BATCH_SIZE]
+            self._add_lemmas(chunk)
+            for course_obj in chunk:
+                yield self._count_tokens([self._lemmas[token] for token in tokenize(course_obj.title)],
+                                         [self._lemmas[token] for token in tokenize(course_obj.description)])
+
+
+    def _count_tokens(self, title: list, description: list) -> dict:
+        """
+        Returns the frequency of each token given the lemmatized tokens
+        of a course's title and description.
+            Takes the form of:
+            {
+                token: (frequency, title frequency, description frequency), ...
+            }
+            - Note: Title tokens are weighed 3x higher
+            - Title/description frequencies are the number of times the
+              token occurs in each, used for BM25F (refer to bm25.py)
+        """
+        stopwords = _stopwords()
+        title_counts = Counter(title)
+        description_counts = Counter(description)
+
+        # Tokens are kept in the order they first appear in, so that the
+        # index does not depend on the process' string hashing
+        return {token: (1 if token not in title_counts else 3, title_counts[token], description_counts[token])
+                for token in dict.fromkeys(title+description) if token not in stopwords}
+
+
+    def _analyze_courses_in_parallel(self, courses: list) -> tuple:
+        """
+        Tokenizes and lemmatizes courses in a pool of worker processes.
+            Returns (analyses, lemmas):
+                - analyses: the frequency of each token in every course,
+                            refer to _analyze_courses
+                - lemmas: the lemma table of the courses, refer to
+                          _add_lemmas
+            - Courses are sent in chunks of TAG_BATCH_SIZE and merged in
+              their original order, so the result is identical to
+              analyzing them in this process
+        """
+        chunks = [courses[i:i+TAG_BATCH_SIZE] for i in range(0, len(courses), TAG_BATCH_SIZE)]
+
+        analyses = []
+        lemmas = {}
+        with ProcessPoolExecutor(max_workers=self._workers) as pool:
+            for chunk_analyses, chunk_lemmas in pool.map(_analyze_chunk, [self._batch_tagging]*len(chunks), chunks):
+                analyses += chunk_analyses
+                for token, lemma in chunk_lemmas.items():
+                    lemmas.setdefault(token, lemma)
+
+        return (analyses, lemmas)
+
+
+    def _add_lemmas(self, courses: list) -> None:
+        """
+        Adds the lemma of every token in the courses' titles and
+        descriptions into the lemma table, so that queries can be
+        lemmatized without NLTK.
+            - Lemmas are those of tagging each token on its own, which is
+              how query tokens are lemmatized
+            - If batch tagging, every new token is tagged in one tagger
+              call (each as a sentence of its own), which gives the same
+              tags as tagging them one by one
+        """
+        vocabulary = [token for token in dict.fromkeys(token for course_obj in courses
+                                                       for token in tokenize(course_obj.title)+tokenize(course_obj.description))
+                      if token not in self._lemmas]
+
+        if self._batch_tagging:
+            for (token, tag), in _pos_tag_sents([[token] for token in vocabulary]):
+                self._lemmas[token] = _lemmatize_tagged(token, tag)
+        else:
+            for token in vocabulary:
+                self._lemmas[token] = self._lemmatize_with_pos(token)
+
+
+    def _tf_idf(self, frequency: int, document_frequency: int, num_courses: int) -> float:
+        """
+        Returns the TF-IDF score of a token within a course.
+        """
+        return 0 if 1+log10(frequency) <= 0 else \
+               (1+log10(frequency))*(log10(num_courses/document_frequency))
+
+
+    def update_departments(self, depts: list) -> None:
+        """
+        Re-crawls only the given departments (i.e. ["COMPSCI", "I&C SCI"])
+        and patches both indexes in place, instead of rebuilding them.
+            - The department's courses are replaced in the index, keeping
+              their position in it
+            - Postings of the old courses are removed and postings of the
+              new courses are added
+            - TF-IDF scores are recomputed only for tokens whose postings
+              changed. If the total number of courses changed, every IDF
+              changes with it, so every score is recomputed (without
+              re-tokenizing any other course)
+
+        Writes the patched indexes back into index.txt, prereqs.txt,
+        inverted_index.txt and fields.txt (and positions.bin, dept/,
+        inverted_index.bin and catalogue.db if positions, department
+        indexes, binary postings or the SQLite store exist).
+
+        Exceptions:
+        DepartmentException if a department's page cannot be found
+        """
+        self.get_index()
+        self.get_inverted_index()
+        self.get_field_lengths()
+        self.get_positions()
+        self.get_lemmas()
+        old_num_courses = len(self._index)
+
+        # Crawl the department pages
+        dept_links = self._get_dept_links()
+        links = [self._find_dept_link(dept, dept_links) for dept in depts]
+
+        errors = []
+        crawled = {}
+        for link, courses in self._crawl_departments(errors, links):
+            for course_obj in (self.parse_course(c) for c in courses):
+                crawled.setdefault(course_obj.dept, []).append(course_obj)
+        if errors:
+            self._report_errors(errors)
+            raise DepartmentException(f"Could not crawl: {', '.join(errors)}")
+
+        # Replace each department's block of courses within the index
+        replaced = set(depts) | set(crawled)
+        removed = set(course for course, info in self._index.items() if info[0] in replaced)
+        added = set(course_obj.course for courses in crawled.values() for course_obj in courses)
+
+        index = {}
+        for course, info in self._index.items():
+            if info[0] in replaced:
+                for course_obj in crawled.pop(info[0], []):
+                    index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
+                    print("Written", course_obj.course)
+            else:
+                index[course] = info
+        for courses in crawled.values():
+            for course_obj in courses:
+                index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
+                print("Written", course_obj.course)
+        self._index = index
+
+        # Tokens of the new courses
+        new_pages = {}
+        new_courses = [Course(course, info[1], info[0], info[2]) for course, info in self._index.items() if course in added]
+        analyzed = [(course_obj.course, tokens) for course_obj, tokens in zip(new_courses, self._analyze_courses(new_courses))]
+        for course, tokens in analyzed:
+            for token, add in tokens.items():
+                new_pages.setdefault(token, {})[course] = list(add)
+        self._add_lemmas(new_courses)
+
+        for course in removed:
+            self._field_lengths.pop(course, None)
+        self._field_lengths.update(self._build_field_lengths(analyzed))
+
+        # Replace the positions of the old courses, if positions are kept
+        if self._positions:
+            for token, pages in self._positions.items():
+                pages[:] = [page for page in pages if page[0] not in removed]
+            for token, pages in self._build_positions(new_courses).items():
+                self._positions.setdefault(token, []).extend(pages)
+            self._positions = {token: pages for token, pages in self._positions.items() if pages}
+
+        # Remove the postings of the old courses, unless they are unchanged
+        # (their new posting is then not added again)
+        changed_tokens = set()
+        for token, postings in self._inverted_index.items():
+            if any(page[0] in removed for page in postings):
+                kept = new_pages.get(token, {})
+                pages = []
+                for page in postings:
+                    if page[0] in removed:
+                        if kept.get(page[0]) != [page[1]]+page[3:]:
+                            continue
+                        del kept[page[0]]
+                    pages.append(page)
+                if len(pages) != len(postings):
+                    postings[:] = pages
+                    changed_tokens.add(token)
+
+        # Add the postings of the new courses
+        for token, pages in new_pages.items():
+            for course, (frequency, title, description) in pages.items():
+                self._inverted_index.setdefault(token, []).append([course, frequency, 0, title, description])
+                changed_tokens.add(token)
+
+        for token in [token for token in changed_tokens if not self._inverted_index[token]]:
+            del self._inverted_index[token]
+            changed_tokens.discard(token)
+
+        # Rewriting TF-IDF scores
+        num_courses = len(self._index)
+        if num_courses != old_num_courses:
+            changed_tokens = self._inverted_index.keys()
+        print(f"Rewriting TF-IDF scores of {len(changed_tokens)} tokens...")
+        for token in changed_tokens:
+            postings = self._inverted_index[token]
+            for page in postings:
+                page[2] = self._tf_idf(page[1], len(postings), num_courses)
+
+        self._write_index()
+        self._write_inverted_index()
+        self._write_binary_indexes()
+        if os.path.isdir("dept"):
+            self._write_index_by_dept([[Course(course, info[1], info[0], info[2]) for course, info in self._index.items() if info[0] == dept] for dept in replaced])
+
+
+    def _find_dept_link(self, dept: str, dept_links: list) -> str:
+        """
+        Returns the link of a department's page, i.e. I&C SCI is found at
+        https://catalogue.uci.edu/allcourses/i_c_sci/
+
+        Exceptions:
+        DepartmentException if no link matches the department
+        """
+        name = "".join(x for x in dept.lower() if x.isalnum())
+        for link in dept_links:
+            slug = link.rstrip('/').rsplit('/', 1)[-1]
+            if "".join(x for x in slug.lower() if x.isalnum()) == name:
+                return link
+
+        raise DepartmentException(f"No course page found for {dept}")
+
+
+    def _write_index(self) -> None:
+        """
+        Dumps index into json (index.txt), and the prerequisite trees of
+        its courses (prereqs.txt).
+        """
+        print("Writing index into file...")
+        with open("index.txt", 'w') as index:
+            ujson.dump(self._index, index)
+
+        self._prereqs = build_prereqs(self._index)
+        with open(PREREQS_PATH, 'w') as prereqs:
+            ujson.dump(self._prereqs, prereqs)
+        
+        print("Index completed!")
+
+
+    def _write_inverted_index(self) -> None:
+        """
+        Dumps inverted index into json (inverted_index.txt).
+        """
+        print("Writing inverted index into file...")
+        with open("inverted_index.txt", 'w') as inverted_index:
+            ujson.dump(self._inverted_index, inverted_index)
+
+        with open("lemmas.txt", 'w') as lemmas:
+            ujson.dump(self._lemmas, lemmas)
+
+        with open("fields.txt", 'w') as field_lengths:
+            ujson.dump(self._field_lengths, field_lengths)
+
+        if self._positions:
+            write_positions(self._index, self._positions)
+        
+        print("Inverted Index completed!")
+
+
+    def _write_binary_indexes(self) -> None:
+        """
+        Rewrites the binary inverted index (inverted_index.bin) and the
+        SQLite store (catalogue.db) from the indexes, if they have been
+        written before (refer to postings.py and store.py), so that no
+        backend serves courses which are no longer in the index.
+        """
+        # store.py imports this module
+        from store import build_store, STORE_PATH
+
+        if os.path.exists(POSTINGS_PATH):
+            write_postings(self._index, self._inverted_index)
+        if os.path.exists(STORE_PATH):
+            build_store(self._index, self._inverted_index, self._lemmas)
+
+
+    def _write_index_by_dept(self, depts: list) -> None:
+        """
+        Dumps a separate index of each department into json
+        (dept/DEPT_index.txt).
+        """
+        print("Writing indexes into files...")
+        os.makedirs("dept", exist_ok=True)
+        for courses in depts:
+            if not len(courses):
+                continue
+
+            dept_index = {}
+            for course_obj in courses:
+                dept_index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
+
+            result = ""
+            for x in courses[0].dept:
+                if x.isalnum():
+                    result += x
+            with open(f"dept/{result}_index.txt", 'w') as index:
+                ujson.dump(dept_index, index)
+        
+        print("Department indexes completed!")
+
+
+    def _report_errors(self, errors: list) -> None:
+        """
+        Prints every link which could not be crawled.
+        """
+        print("Error count:", len(errors))
+        for link in errors:
+            print(link)
+
+
+    def _get_dept_links(self) -> list:
+        """
+        Returns the link of every department's course page.
+        """
         print("Obtaining course links of departments...")
+        return self._parse_dept_links(self._crawler.get(COURSES_URL))
 
-        # Get the course site source code
-        # - Trims source code to section with department links
-        page_content_get = requests.get(COURSES_URL).text
+
+    def _parse_dept_links(self, page_content_get: str) -> list:
+        """
+        Returns the department links found in the course site source code.
+        """
+        # Trims source code to section with department links
         start_index = page_content_get.index('<h2 class="letternav-head" id=\'A\'><a name=\'A\'>A</a></h2>')
         end_index = page_content_get.index('</div><!--end #textcontainer -->', start_index)
         page_content = html.fromstring(page_content_get[start_index:end_index])
@@ -280,54 +765,42 @@ class Index:
             if info[1] == "href":
                 dept_links.append(info[2])
 
-        # Try to open each link and write index to file
-        errors = []
-        depts = []
-        dept_indexes = []
-        for link in dept_links:   
-            print("Scraping link:", link)         
-            try:
-                # Extracting html content
-                course_content_get = requests.get(link).text
-                start_index = course_content_get.index('<div id="courseinventorycontainer" class="page_content tab_content">')
-                end_index = course_content_get.index('<footer>', start_index)
-                course_content_get = course_content_get[start_index:end_index]
-                courses = [html.fromstring(section).xpath("string()") for section in course_content_get.split('<div class="courseblock">')][1:]
-            except:
+        return dept_links
+
+
+    def _crawl_departments(self, errors: list, dept_links: list = None):
+        """
+        Crawls every department's page (or only those in dept_links),
+        yielding (link, courses) where courses is the text of each course
+        block on the page.
+            - Pages are fetched and parsed through the crawler, possibly
+              concurrently, but are always yielded in department order
+            - Links which could not be fetched or parsed are appended
+              to errors
+        """
+        if dept_links is None:
+            dept_links = self._get_dept_links()
+
+        for link, courses, error in self._crawler.get_all(dept_links, parse=self._parse_dept_page):
+            print("Scraping link:", link)
+            if error is not None:
                 print("ERROR PARSING PAGE:", link)
                 errors.append(link)
             else:
-                if len(courses):
-                    dept = self.format_course_info(courses[0]).dept
-                    depts.append(dept)
-                    dept_index = {}
-
-                    for c in courses:
-                        course_obj = self.format_course_info(c)
-                        prereq_index = c.find('Prerequisite')
-                        if prereq_index != -1:
-                            prereq_str = c[prereq_index+14:c.find('\n', prereq_index+14)]
-                            course_obj.prereq_str = unidecode(prereq_str)
-                        
-                        dept_index[course_obj.course] = [course_obj.dept, course_obj.title, course_obj.description, course_obj.prereq_str]
-                        print("Written", course_obj.course)
-                    
-                    dept_indexes.append(dept_index)
-
-        # Dumps index into json
-        print("Writing indexes into files...")
-        for i, dept in enumerate(depts):
-            result = ""
-            for x in dept:
-                if x.isalnum():
-                    result += x
-            with open(f"dept/{result}_index.txt", 'w') as index:
-                ujson.dump(dept_indexes[i], index)
-        
-        print("Index completed!")
-        print("Error count:", len(errors))
-        for link in errors:
-            print(link)
+                yield (link, courses)
+
+        print("Pages", ", ".join(f"{stat.replace('_', ' ')}: {count}" for stat, count in self._crawler.stats.items()))
+
+
+    def _parse_dept_page(self, course_content_get: str) -> list:
+        """
+        Returns the text of each course block on a department's page.
+        """
+        # Extracting html content
+        start_index = course_content_get.index('<div id="courseinventorycontainer" class="page_content tab_content">')
+        end_index = course_content_get.index('<footer>', start_index)
+        course_content_get = course_content_get[start_index:end_index]
+        return [html.fromstring(section).xpath("string()") for section in course_content_get.split('<div class="courseblock">')][1:]
 
         
     def get_index(self) -> dict:
@@ -355,23 +828,232 @@ class Index:
             return self._inverted_index
 
 
+    def get_field_lengths(self) -> dict:
+        """
+        Returns the number of tokens in each course's title and
+        description. Refer to get_index.
+            Takes the form of:
+            {
+                class: [title length, description length], ...
+            }
+            - Empty if the lengths have not been built (fields.txt)
+        """
+        if len(self._field_lengths) != 0:
+            return self._field_lengths
+        else:
+            try:
+                with open("fields.txt", 'r') as f:
+                    self._field_lengths = ujson.load(f)
+            except FileNotFoundError:
+                pass
+            return self._field_lengths
+
+
+    def get_positions(self) -> dict:
+        """
+        Returns the positions of every word within each course's title
+        and description. Refer to get_index.
+            Takes the form of:
+            {
+                token: [
+                    [course, [title positions], [description positions]]
+                ], ...
+            }
+            - Empty if positions have not been built (positions.bin),
+              refer to Index(positions=True)
+            - Every token is decoded, searches instead map positions.bin
+              (refer to phrases.py). Positions written as JSON
+              (positions.txt) before they were binary are still read
+        """
+        if len(self._positions) != 0:
+            return self._positions
+        else:
+            try:
+                self._positions = dict(BinaryPositions(POSITIONS_PATH).items())
+            except FileNotFoundError:
+                try:
+                    with open("positions.txt", 'r') as f:
+                        self._positions = ujson.load(f)
+                except FileNotFoundError:
+                    pass
+            return self._positions
+
+
+    def get_prereqs(self) -> dict:
+        """
+        Returns the prerequisites of every course, parsed into expression
+        trees of course IDs (refer to prereqs.py). Refer to get_index.
+            - Parsed from the index if they have not been written
+              (prereqs.txt)
+        """
+        if len(self._prereqs) != 0:
+            return self._prereqs
+        else:
+            try:
+                with open(PREREQS_PATH, 'r') as f:
+                    self._prereqs = ujson.load(f)
+            except FileNotFoundError:
+                self._prereqs = build_prereqs(self.get_index())
+            return self._prereqs
+
+
+    def get_lemmas(self) -> dict:
+        """
+        Returns the lemma table, mapping each token of the catalogue to
+        its lemma. Refer to get_index.
+            - Empty if the table has not been built (lemmas.txt)
+            - lemmas.txt is only read once, so queries do not try to open
+              a missing table again (refer to lemmatize)
+        """
+        if len(self._lemmas) != 0 or self._lemmas_read:
+            return self._lemmas
+        else:
+            try:
+                with open("lemmas.txt", 'r') as f:
+                    self._lemmas = ujson.load(f)
+            except FileNotFoundError:
+                pass
+            self._lemmas_read = True
+            return self._lemmas
+
+
+    def lemmatize(self, token: str) -> str:
+        """
+        Returns the lemma of a query token, looking it up in the lemma
+        table and only lemmatizing it with NLTK if it is not there.
+        """
+        lemma = self.get_lemmas().get(token)
+        if lemma is None:
+            lemma = self._lemmatize_with_pos(token)
+        return lemma
+
+
+    def lemma_cache_info(self):
+        """
+        Returns the hits, misses, maxsize and currsize of the lemmatizer's
+        cache, which is shared by every Index in the process.
+        """
+        return _lemmatize_with_pos.cache_info()
+
+
     def _lemmatize_with_pos(self, token: str) -> str:
         """
         Perform lemmatization with a parts-of-speech tagger.
+            - Memoized per token, refer to lemma_cache_info
         """
-        tag = nltk.pos_tag([token])[0][1][0]
+        return _lemmatize_with_pos(token)
+
+
+def _analyze_chunk(batch_tagging: bool, courses: list) -> tuple:
+    """
+    Runs in a worker process, refer to Index._analyze_courses_in_parallel.
+    """
+    index = Index(batch_tagging=batch_tagging)
+    analyses = list(index._analyze_courses(courses))
+    index._add_lemmas(courses)
+    return (analyses, index._lemmas)
+
 
-        if tag == 'N': tag = wordnet.NOUN
-        elif tag == 'V': tag = wordnet.VERB
-        elif tag == 'R': tag = wordnet.ADV
-        elif tag == 'J': tag = wordnet.ADJ
-        else: return token.lower()
+def tokenize(text: str) -> list:
+    """
+    Splits text into alphanumeric and punctuation tokens.
+    """
+    return _TOKEN_PATTERN.findall(text)
 
-        return self._lemmatizer.lemmatize(token, pos=tag).lower()
+
+def is_word(token: str) -> bool:
+    """
+    Checks if a token (refer to tokenize) is alphanumeric rather than
+    punctuation.
+    """
+    return token[0].isalnum() or token[0] == '_'
+
+
+# NLTK is only imported by the functions below, and only once they are
+# first called, so that the query path can run off the lemma table alone
+
+
+@lru_cache(maxsize=None)
+def _stopwords() -> frozenset:
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
+
+
+def _pos_tag_sents(sentences: list) -> list:
+    import nltk
+
+    return nltk.pos_tag_sents(sentences)
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _lemmatize_with_pos(token: str) -> str:
+    """
+    Refer to Index._lemmatize_with_pos.
+    """
+    import nltk
+
+    return _lemmatize_tagged(token, nltk.pos_tag([token])[0][1])
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _lemmatize_tagged(token: str, tag: str) -> str:
+    """
+    Perform lemmatization of a token given its Penn Treebank tag.
+    """
+    from nltk.corpus import wordnet
+    from nltk.stem import WordNetLemmatizer
+
+    global _LEMMATIZER
+    if _LEMMATIZER is None:
+        _LEMMATIZER = WordNetLemmatizer()
+
+    tag = tag[0]
+
+    if tag == 'N': tag = wordnet.NOUN
+    elif tag == 'V': tag = wordnet.VERB
+    elif tag == 'R': tag = wordnet.ADV
+    elif tag == 'J': tag = wordnet.ADJ
+    else: return token.lower()
+
+    return _LEMMATIZER.lemmatize(token, pos=tag).lower()
 
 
 if __name__ == "__main__":
-    index = Index()
-    index.create_index()
-    index.create_inverted_index()
+    parser = argparse.ArgumentParser(description="Crawls UCI's catalogue and builds the indexes.")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of department pages fetched at once (1 = sequential)")
+    parser.add_argument("--by-dept", action="store_true",
+                        help="also write a separate index of each department into dept/")
+    parser.add_argument("--cache", default=".page_cache",
+                        help="directory of cached pages, revalidated on every crawl")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="download every page without using the cache")
+    parser.add_argument("--snapshot", metavar="DIR",
+                        help="save the catalogue's pages into DIR instead of building the indexes")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="build the indexes offline from a snapshot saved with --snapshot")
+    parser.add_argument("--batch-tagging", action="store_true",
+                        help="tag the tokens of many courses per tagger call instead of one call per token")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes courses are tokenized and lemmatized in")
+    parser.add_argument("--positions", action="store_true",
+                        help="also write the position of every token (positions.bin) for phrase and proximity queries")
+    parser.add_argument("--update", metavar="DEPT", nargs="+",
+                        help="re-crawl only these departments (i.e. COMPSCI \"I&C SCI\") and patch the existing indexes")
+    args = parser.parse_args()
+
+    if args.replay:
+        crawler = ReplayCrawler(args.replay)
+    else:
+        cache = None if args.no_cache else PageCache(args.cache, parser_version=PARSER_VERSION)
+        crawler = Crawler(concurrency=args.concurrency, cache=cache)
+
+    index = Index(crawler, batch_tagging=args.batch_tagging, workers=args.workers, positions=args.positions)
+    if args.snapshot:
+        index.capture_snapshot(args.snapshot)
+    elif args.update:
+        index.update_departments(args.update)
+    else:
+        index.create_indexes(by_dept=args.by_dept)
 
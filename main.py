@@ -5,8 +5,7 @@
 # A.K.A. an ordering of classes such that if taken in order,
 # prerequisites will not be violated.
 
-from query import prereq, valid_class, check_for_unlisted_prereqs
-from graph import Graph
+from query import prereq_subgraph, valid_class, check_for_unlisted_prereqs
 
 
 def _topological_sort(graph: 'Graph', nodes: list) -> None:
@@ -148,15 +147,7 @@ def run() -> None:
     print("----------------------------------------------------------------------")
     
     # Initialize graph
-    class_graph = Graph(class_list)
-    
-    for c in class_list:
-        class_list_no_c = list(class_list)
-        class_list_no_c.remove(c)
-        for d in class_list_no_c:
-            print(f"Checking if {c} is a prerequisite to {d}...")
-            if prereq(c,d):
-                class_graph.addDirectedEdge(c,d)
+    class_graph = prereq_subgraph(class_list)
 
     # Run topological sort algorithm
     print("----------------------------------------------------------------------")
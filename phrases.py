@@ -0,0 +1,338 @@
+# phrases.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Phrase and proximity matching over the positions of tokens.
+#
+#   When the inverted index is built with positions (positions.txt,
+#   refer to Index.get_positions), a quoted phrase such as
+#   "machine learning" only matches courses where its words appear
+#   next to each other, in order, within the title or the description.
+#
+#   Courses where consecutive query words appear close together are
+#   also ranked higher than courses which mention them far apart.
+#
+#   Positions are written into positions.bin, in the same layout as the
+#   binary inverted index (refer to postings.py), and mapped into
+#   memory: a token's positions are only decoded when it is queried.
+#       header:         magic, version, number of courses/tokens and
+#                       the offset of each section below
+#       course table:   offsets into a blob of course names, courses
+#                       having the IDs of the course table
+#       token table:    (name offset, name length, positions offset,
+#                       number of courses) of every token, sorted by
+#                       name so that a token is found by binary search
+#       positions:      per token, for each course in ascending order
+#                       of ID: its ID (delta), the number of positions
+#                       in its title and description, then the
+#                       positions of each (delta), all varint encoded
+
+from postings import encode_varint, decode_varints
+from query_cache import QueryCache
+
+import os
+import mmap
+import struct
+
+POSITIONS_PATH = "positions.bin"
+
+# Number of tokens whose decoded positions are kept in memory
+TOKEN_CACHE_SIZE = 4096
+
+_MAGIC = b"ACPO"
+_VERSION = 1
+
+_HEADER = struct.Struct("<4sIIIQQQQ")
+_OFFSET = struct.Struct("<I")
+_TOKEN_ENTRY = struct.Struct("<IIQI")
+
+# Maximum distance between two words for a course to be boosted
+PROXIMITY_WINDOW = 5
+
+# Score boost of two words d positions apart: score *= 1 + boost/d
+PROXIMITY_BOOST = 0.5
+
+
+class PositionsFormatError(Exception):
+    pass
+
+
+class PositionalIndex:
+    def __init__(self, positions):
+        """
+        Initialize a positional index over the positions of tokens
+        (refer to Index.get_positions), which may be empty.
+            - positions may also be BinaryPositions
+            - The positions of the last TOKEN_CACHE_SIZE tokens queried
+              are kept, unless they are empty
+        """
+        self._positions = positions
+        self._courses = QueryCache(TOKEN_CACHE_SIZE)
+
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+
+    def courses(self, token: str) -> dict:
+        """
+        Returns the positions of token in every course it is in.
+            Takes the form of:
+            {
+                course: ([title positions], [description positions]), ...
+            }
+            - Built on first use, then kept (refer to __init__)
+        """
+        courses = self._courses.get(token, 0)
+        if courses is None:
+            courses = {page[0]: (page[1], page[2]) for page in self._positions.get(token, [])}
+            if courses:
+                self._courses.put(token, 0, courses)
+        return courses
+
+
+    def match_phrase(self, phrase: tuple) -> set:
+        """
+        Returns every course containing the phrase in its title or its
+        description.
+            - phrase is a tuple of (token, offset), where offset is the
+              position of the token within the phrase
+            - Courses are first intersected starting from the rarest
+              token, then positions are only checked within those
+        """
+        lists = [self.courses(token) for token, _ in phrase]
+        order = sorted(range(len(phrase)), key=lambda i: len(lists[i]))
+
+        candidates = set(lists[order[0]])
+        for i in order[1:]:
+            candidates.intersection_update(lists[i])
+            if not candidates:
+                return candidates
+
+        matches = set()
+        for course in candidates:
+            for field in (0, 1):
+                rarest = lists[order[0]][course][field]
+                others = [(set(lists[i][course][field]), phrase[i][1]) for i in order[1:]]
+                if any(all(start+offset in positions for positions, offset in others)
+                       for start in (position-phrase[order[0]][1] for position in rarest)):
+                    matches.add(course)
+                    break
+
+        return matches
+
+
+    def boost(self, course_to_score: dict, pairs: list) -> None:
+        """
+        Boosts the score of every course in which both tokens of a pair
+        are within PROXIMITY_WINDOW of each other (in the same field).
+            - pairs are (token, token) of consecutive query words
+        """
+        for a, b in pairs:
+            if a == b:
+                continue
+
+            a_courses = self.courses(a)
+            b_courses = self.courses(b)
+            if len(a_courses) > len(b_courses):
+                a_courses, b_courses = b_courses, a_courses
+
+            for course, a_fields in a_courses.items():
+                b_fields = b_courses.get(course)
+                if b_fields is None or course not in course_to_score:
+                    continue
+
+                distance = min(_distance(a_fields[0], b_fields[0]), _distance(a_fields[1], b_fields[1]))
+                if distance <= PROXIMITY_WINDOW:
+                    course_to_score[course] *= 1+PROXIMITY_BOOST/distance
+
+
+class BinaryPositions:
+    def __init__(self, path: str = POSITIONS_PATH):
+        """
+        Maps the positions of tokens written by write_positions into
+        memory, read as the positions of Index.get_positions.
+
+        Exceptions:
+        FileNotFoundError if the file does not exist
+        PositionsFormatError if the file is not a positions file
+        """
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size:
+            raise PositionsFormatError(path)
+        (magic, version, self._num_courses, self._num_tokens,
+         self._course_offsets, self._course_blob, self._token_entries, self._token_blob) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise PositionsFormatError(path)
+
+
+    def __len__(self) -> int:
+        return self._num_tokens
+
+
+    def __contains__(self, token: str) -> bool:
+        return self._find(token) is not None
+
+
+    def get(self, token: str, default=None) -> list:
+        """
+        Returns the positions of token in every course it is in, or
+        default if it is in none.
+            Takes the form of:
+            [
+                [course, [title positions], [description positions]], ...
+            ]
+        """
+        entry = self._find(token)
+        if entry is None:
+            return default
+
+        offset, count = entry
+        pages = []
+        course_id = 0
+        for _ in range(count):
+            (delta, num_title, num_description), offset = decode_varints(self._mm, offset, 3)
+            course_id += delta
+            title, offset = _decode_positions(self._mm, offset, num_title)
+            description, offset = _decode_positions(self._mm, offset, num_description)
+            pages.append([self._course(course_id), title, description])
+        return pages
+
+
+    def items(self):
+        """
+        Yields (token, positions) of every token, refer to get.
+        """
+        for i in range(self._num_tokens):
+            token = self._token(i)[0]
+            yield (token, self.get(token))
+
+
+    def _course(self, course_id: int) -> str:
+        start, end = struct.unpack_from("<II", self._mm, self._course_offsets+4*course_id)
+        return self._mm[self._course_blob+start:self._course_blob+end].decode()
+
+
+    def _token(self, i: int) -> tuple:
+        """
+        Returns the (name, positions offset, number of courses) of the
+        token at position i of the token table.
+        """
+        start, length, offset, count = _TOKEN_ENTRY.unpack_from(self._mm, self._token_entries+_TOKEN_ENTRY.size*i)
+        return (self._mm[self._token_blob+start:self._token_blob+start+length].decode(), offset, count)
+
+
+    def _find(self, token: str) -> tuple:
+        """
+        Binary searches the token table, returning the (offset, number
+        of courses) of token's positions or None.
+        """
+        key = token.encode()
+        low, high = 0, self._num_tokens
+        while low < high:
+            mid = (low+high)//2
+            start, length, offset, count = _TOKEN_ENTRY.unpack_from(self._mm, self._token_entries+_TOKEN_ENTRY.size*mid)
+            name = self._mm[self._token_blob+start:self._token_blob+start+length]
+            if name < key:
+                low = mid+1
+            elif name > key:
+                high = mid
+            else:
+                return (offset, count)
+        return None
+
+
+def write_positions(index: dict, positions: dict, path: str = POSITIONS_PATH) -> None:
+    """
+    Writes the positions of tokens (refer to Index.get_positions) into
+    the binary format at path.
+        - Courses are given IDs in the order of the index, courses which
+          are only found in the positions come after
+        - The file is replaced atomically, so running processes keep
+          reading the old one until they reopen it
+    """
+    course_ids = {course: i for i, course in enumerate(index)}
+    for pages in positions.values():
+        for page in pages:
+            if page[0] not in course_ids:
+                course_ids[page[0]] = len(course_ids)
+
+    course_blob = bytearray()
+    course_offsets = bytearray(_OFFSET.pack(0))
+    for course in course_ids:
+        course_blob += course.encode()
+        course_offsets += _OFFSET.pack(len(course_blob))
+
+    tokens = sorted(positions, key=lambda token: token.encode())
+    token_blob = bytearray()
+    token_names = []
+    blocks = []
+    for token in tokens:
+        name = token.encode()
+        token_names.append((len(token_blob), len(name)))
+        token_blob += name
+
+        pages = sorted((course_ids[page[0]], page[1], page[2]) for page in positions[token])
+        block = bytearray()
+        previous = 0
+        for course_id, title, description in pages:
+            block += encode_varint(course_id-previous)+encode_varint(len(title))+encode_varint(len(description))
+            block += _encode_positions(title)+_encode_positions(description)
+            previous = course_id
+        blocks.append((block, len(pages)))
+
+    course_offsets_offset = _HEADER.size
+    course_blob_offset = course_offsets_offset+len(course_offsets)
+    token_entries_offset = course_blob_offset+len(course_blob)
+    token_blob_offset = token_entries_offset+_TOKEN_ENTRY.size*len(tokens)
+    data_offset = token_blob_offset+len(token_blob)
+
+    token_entries = bytearray()
+    offset = data_offset
+    for (start, length), (block, count) in zip(token_names, blocks):
+        token_entries += _TOKEN_ENTRY.pack(start, length, offset, count)
+        offset += len(block)
+
+    with open(path+".tmp", 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(course_ids), len(tokens), course_offsets_offset,
+                             course_blob_offset, token_entries_offset, token_blob_offset))
+        f.write(course_offsets)
+        f.write(course_blob)
+        f.write(token_entries)
+        f.write(token_blob)
+        for block, _ in blocks:
+            f.write(block)
+    os.replace(path+".tmp", path)
+
+
+def _encode_positions(positions: list) -> bytes:
+    result = bytearray()
+    previous = 0
+    for position in positions:
+        result += encode_varint(position-previous)
+        previous = position
+    return bytes(result)
+
+
+def _decode_positions(buffer, offset: int, count: int) -> tuple:
+    positions, offset = decode_varints(buffer, offset, count)
+    for i in range(1, count):
+        positions[i] += positions[i-1]
+    return (positions, offset)
+
+
+def _distance(a: list, b: list) -> float:
+    """
+    Returns the smallest distance between positions of two sorted lists,
+    merging them in one pass.
+    """
+    distance = float("inf")
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            distance = min(distance, b[j]-a[i])
+            i += 1
+        else:
+            distance = min(distance, a[i]-b[j])
+            j += 1
+    return distance
@@ -0,0 +1,395 @@
+# postings.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Compact binary format of the inverted index, read through mmap.
+#
+#   Loading inverted_index.txt creates millions of small lists, floats
+#   and strings in every process. Instead, the inverted index can be
+#   written into inverted_index.bin, which is mapped into memory as is:
+#   nothing is parsed when it is opened, and its pages are shared by
+#   every process reading it.
+#
+#   File layout (little-endian):
+#       header:         magic, version, number of courses/tokens and
+#                       the offset of each section below
+#       course table:   offsets into a blob of course names, so that
+#                       every course has a dense integer ID
+#       token table:    (name offset, name length, postings offset,
+#                       postings count, max weight) of every token,
+#                       sorted by name so that a token is found by
+#                       binary search
+#       postings:       per token, a skip table of (last course ID,
+#                       offset, max weight) of each block, then the
+#                       blocks of BLOCK_SIZE postings in ascending order
+#                       of course ID
+#       block:          tf-idf weights (float32), then course IDs (delta
+#                       and varint encoded, from the last ID of the
+#                       previous block), then frequencies (varint)
+#
+#   Blocks are decoded on their own, only once they are needed: looking
+#   up a course in a posting list binary searches the skip table, then
+#   decodes the one block which may hold it. The max weight of each
+#   block bounds the weight of any course within it without decoding
+#   it (refer to search._top_by_max_score).
+
+import os
+import mmap
+import struct
+import argparse
+from bisect import bisect_left
+
+POSTINGS_PATH = "inverted_index.bin"
+
+_MAGIC = b"ACPI"
+_VERSION = 3
+
+# Number of postings per block
+BLOCK_SIZE = 64
+
+_HEADER = struct.Struct("<4sIIIQQQQ")
+_OFFSET = struct.Struct("<I")
+_TOKEN_ENTRY = struct.Struct("<IIQIf")
+_BLOCK_ENTRY = struct.Struct("<IIf")
+
+
+class PostingsFormatError(Exception):
+    pass
+
+
+class BinaryPostings:
+    def __init__(self, path: str = POSTINGS_PATH):
+        """
+        Maps a binary inverted index into memory.
+
+        Exceptions:
+        FileNotFoundError if the file does not exist
+        PostingsFormatError if the file is not a binary inverted index
+        """
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size:
+            raise PostingsFormatError(path)
+        (magic, version, self._num_courses, self._num_tokens,
+         self._course_offsets, self._course_blob, self._token_entries, self._token_blob) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise PostingsFormatError(path)
+
+
+    def __len__(self) -> int:
+        return self._num_tokens
+
+
+    def __contains__(self, token: str) -> bool:
+        return self._find(token) is not None
+
+
+    def __getitem__(self, token: str) -> list:
+        """
+        Returns the postings of token in the form of the inverted index:
+            [
+                [course, frequency, tf-idf], ...
+            ]
+
+        Exceptions:
+        KeyError if token is not in the inverted index
+        """
+        found = self.get(token)
+        if found is None:
+            raise KeyError(token)
+
+        ids, frequencies, weights = found
+        return [[self.course(i), frequency, weight] for i, frequency, weight in zip(ids, frequencies, weights)]
+
+
+    def num_courses(self) -> int:
+        return self._num_courses
+
+
+    def course(self, course_id: int) -> str:
+        """
+        Returns the name of the course with the given ID.
+        """
+        start, end = struct.unpack_from("<II", self._mm, self._course_offsets+4*course_id)
+        return self._mm[self._course_blob+start:self._course_blob+end].decode()
+
+
+    def get(self, token: str) -> tuple:
+        """
+        Returns the postings of token as (ids, frequencies, weights),
+        with course IDs in ascending order, or None if token is not in
+        the inverted index.
+            - Decodes every block, refer to postings for decoding only
+              what is needed
+        """
+        posting_list = self.postings(token)
+        if posting_list is None:
+            return None
+
+        ids, frequencies, weights = [], [], []
+        for block in range(posting_list.num_blocks()):
+            block_ids, block_frequencies, block_weights = posting_list.decode(block, frequencies=True)
+            ids += block_ids
+            frequencies += block_frequencies
+            weights += block_weights
+        return (ids, frequencies, weights)
+
+
+    def postings(self, token: str) -> 'PostingList':
+        """
+        Returns the posting list of token, or None if token is not in
+        the inverted index.
+            - Only its skip table is read, blocks are decoded on use
+        """
+        entry = self._find(token)
+        if entry is None:
+            return None
+        return PostingList(self._mm, *entry)
+
+
+    def max_weight(self, token: str) -> float:
+        """
+        Returns the highest tf-idf weight in token's postings, or None if
+        token is not in the inverted index.
+        """
+        entry = self._find(token)
+        return None if entry is None else entry[2]
+
+
+    def _find(self, token: str) -> tuple:
+        """
+        Binary searches the token table, returning the (offset, count,
+        max weight) of token's postings or None.
+        """
+        key = token.encode()
+        low, high = 0, self._num_tokens
+        while low < high:
+            mid = (low+high)//2
+            start, length, offset, count, max_weight = _TOKEN_ENTRY.unpack_from(self._mm, self._token_entries+_TOKEN_ENTRY.size*mid)
+            name = self._mm[self._token_blob+start:self._token_blob+start+length]
+            if name < key:
+                low = mid+1
+            elif name > key:
+                high = mid
+            else:
+                return (offset, count, max_weight)
+        return None
+
+
+class PostingList:
+    def __init__(self, buffer, offset: int, count: int, max_weight: float):
+        """
+        Initialize the posting list of count postings at offset, reading
+        its skip table (refer to the top of this file).
+        """
+        self.max_weight = max_weight
+        self._buffer = buffer
+        self._count = count
+
+        num_blocks = -(-count//BLOCK_SIZE)
+        skips = list(_BLOCK_ENTRY.iter_unpack(buffer[offset:offset+_BLOCK_ENTRY.size*num_blocks]))
+        self._last_ids = [last_id for last_id, _, _ in skips]
+        self._offsets = [offset+block_offset for _, block_offset, _ in skips]
+        self._block_maxes = [block_max for _, _, block_max in skips]
+        self._blocks = {}
+        self._decoded = 0
+
+
+    def __len__(self) -> int:
+        return self._count
+
+
+    def num_blocks(self) -> int:
+        return len(self._offsets)
+
+
+    def decoded(self) -> int:
+        """
+        Returns the number of postings decoded so far.
+        """
+        return self._decoded
+
+
+    def blocks(self):
+        """
+        Yields the (ids, weights) of every block, in order.
+        """
+        for block in range(len(self._offsets)):
+            yield self._block(block)
+
+
+    def block_max(self, course_id: int) -> float:
+        """
+        Returns the max weight of the block which may hold course_id
+        (an upper bound of its weight), without decoding it.
+        """
+        block = bisect_left(self._last_ids, course_id)
+        return self._block_maxes[block] if block < len(self._block_maxes) else 0
+
+
+    def weights_of(self, course_ids: list) -> list:
+        """
+        Returns the weight of each course ID, given in ascending order,
+        or None for those not in the posting list.
+            - Only decodes the blocks which may hold them
+        """
+        found = []
+        block = 0
+        last_ids = self._last_ids
+        for course_id in course_ids:
+            block = bisect_left(last_ids, course_id, block)
+            if block == len(last_ids):
+                return found+[None]*(len(course_ids)-len(found))
+
+            ids, weights = self._blocks.get(block) or self._block(block)
+            position = bisect_left(ids, course_id)
+            found.append(weights[position] if ids[position] == course_id else None)
+        return found
+
+
+    def decode(self, block: int, frequencies: bool = False) -> tuple:
+        """
+        Decodes a block into (ids, weights), or (ids, frequencies,
+        weights) if frequencies is set.
+        """
+        count = min(BLOCK_SIZE, self._count-BLOCK_SIZE*block)
+        offset = self._offsets[block]
+        weights = list(struct.unpack_from(f"<{count}f", self._buffer, offset))
+        ids, offset = decode_varints(self._buffer, offset+4*count, count)
+
+        ids[0] += self._last_ids[block-1] if block else 0
+        for i in range(1, count):
+            ids[i] += ids[i-1]
+
+        if not frequencies:
+            return (ids, weights)
+        return (ids, decode_varints(self._buffer, offset, count)[0], weights)
+
+
+    def _block(self, block: int) -> tuple:
+        found = self._blocks.get(block)
+        if found is None:
+            found = self.decode(block)
+            self._blocks[block] = found
+            self._decoded += len(found[0])
+        return found
+
+
+def write_postings(index: dict, inverted_index: dict, path: str = POSTINGS_PATH) -> None:
+    """
+    Writes the inverted index into the binary format at path.
+        - Courses are given IDs in the order of the index, courses which
+          are only found in the inverted index come after
+        - The file is replaced atomically, so running processes keep
+          reading the old one until they reopen it (refer to
+          registry.reload), instead of reading it while it is rewritten
+    """
+    course_ids = {course: i for i, course in enumerate(index)}
+    for postings in inverted_index.values():
+        for page in postings:
+            if page[0] not in course_ids:
+                course_ids[page[0]] = len(course_ids)
+
+    # Course table
+    course_blob = bytearray()
+    course_offsets = bytearray(_OFFSET.pack(0))
+    for course in course_ids:
+        course_blob += course.encode()
+        course_offsets += _OFFSET.pack(len(course_blob))
+
+    # Postings, and the token table pointing into them
+    tokens = sorted(inverted_index, key=lambda token: token.encode())
+    token_blob = bytearray()
+    token_names = []
+    blocks = []
+    for token in tokens:
+        name = token.encode()
+        token_names.append((len(token_blob), len(name)))
+        token_blob += name
+
+        pages = sorted((course_ids[page[0]], page[1], page[2]) for page in inverted_index[token])
+        skips = bytearray()
+        data = bytearray()
+        previous = 0
+        starts = range(0, len(pages), BLOCK_SIZE)
+        for start in starts:
+            block_pages = pages[start:start+BLOCK_SIZE]
+            skips += _BLOCK_ENTRY.pack(block_pages[-1][0], _BLOCK_ENTRY.size*len(starts)+len(data),
+                                       max(page[2] for page in block_pages))
+            data += struct.pack(f"<{len(block_pages)}f", *(page[2] for page in block_pages))
+            for course_id, _, _ in block_pages:
+                data += encode_varint(course_id-previous)
+                previous = course_id
+            for _, frequency, _ in block_pages:
+                data += encode_varint(frequency)
+            data += bytes(-len(data) % 4)
+        blocks.append((skips+data, len(pages), max(page[2] for page in pages)))
+
+    course_offsets_offset = _HEADER.size
+    course_blob_offset = course_offsets_offset+len(course_offsets)
+    token_entries_offset = _align(course_blob_offset+len(course_blob))
+    token_blob_offset = token_entries_offset+_TOKEN_ENTRY.size*len(tokens)
+    data_offset = _align(token_blob_offset+len(token_blob))
+
+    token_entries = bytearray()
+    offset = data_offset
+    for (start, length), (block, count, max_weight) in zip(token_names, blocks):
+        token_entries += _TOKEN_ENTRY.pack(start, length, offset, count, max_weight)
+        offset += len(block)
+
+    print("Writing binary inverted index into file...")
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(course_ids), len(tokens), course_offsets_offset,
+                             course_blob_offset, token_entries_offset, token_blob_offset))
+        f.write(course_offsets)
+        f.write(course_blob)
+        f.write(bytes(token_entries_offset-f.tell()))
+        f.write(token_entries)
+        f.write(token_blob)
+        f.write(bytes(data_offset-f.tell()))
+        for block, _, _ in blocks:
+            f.write(block)
+    os.replace(f"{path}.tmp", path)
+
+
+def _align(offset: int) -> int:
+    return offset+(-offset % 4)
+
+
+def encode_varint(value: int) -> bytes:
+    result = bytearray()
+    while value >= 0x80:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def decode_varints(buffer, offset: int, count: int) -> tuple:
+    """
+    Decodes count varints starting at offset, returning (values, offset
+    after the last value).
+    """
+    values = []
+    for _ in range(count):
+        value = 0
+        shift = 0
+        while True:
+            byte = buffer[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values.append(value)
+    return (values, offset)
+
+
+if __name__ == "__main__":
+    from index import Index
+
+    parser = argparse.ArgumentParser(description="Writes inverted_index.txt into the binary format.")
+    parser.add_argument("--path", default=POSTINGS_PATH, help="file to write the binary inverted index into")
+    args = parser.parse_args()
+
+    index_obj = Index()
+    write_postings(index_obj.get_index(), index_obj.get_inverted_index(), args.path)
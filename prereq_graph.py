@@ -0,0 +1,197 @@
+# prereq_graph.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Prerequisite graph of the whole catalogue.
+#
+#   Every course is a vertex (by its ID, refer to prereqs.py), with an
+#   edge a->b if a is in the prerequisite tree of b. The graph is built
+#   once, when it is first loaded, so that planning only takes the
+#   subgraph induced by the selected courses: each selected course's
+#   prerequisites are looked up among the selection, instead of checking
+#   every ordered pair of courses.
+#
+#   Its transitive closure is also precomputed as bitsets (Python ints,
+#   where bit i is the course of ID i): the ancestors of a course are
+#   every course it transitively requires, and its descendants every
+#   course which transitively requires it. Bitsets are ORed together in
+#   topological order, so the closure takes one pass over the edges, and
+#   checking if a course is transitively required is a single bit test.
+#   The number of descendants of every course (how many courses it
+#   unlocks) is counted from them once.
+#   - Note: Alternatives are all edges, so the ancestors of a course are
+#     every course which may be needed before it, not only required ones
+
+from graph import Graph
+
+
+class PrereqGraph:
+    def __init__(self, prereqs: 'PrereqTable'):
+        """
+        Initialize the prerequisite graph of every course in the
+        prerequisite table.
+            - Edges into each course are its prerequisite tree's set of
+              courses, edges out of it are listed when built
+        """
+        self._prereqs = prereqs
+        self._dependents = [[] for _ in range(len(prereqs))]
+        self._num_edges = 0
+
+        for course_id in range(len(prereqs)):
+            for prereq_id in sorted(prereqs.leaves(course_id)):
+                if prereq_id != course_id:
+                    self._dependents[prereq_id].append(course_id)
+                    self._num_edges += 1
+
+        order, acyclic = self._topological_order()
+        self._ancestors = _closure(order, self.prerequisites, len(self), acyclic)
+        self._descendants = _closure(order[::-1], self.dependents, len(self), acyclic)
+        self._num_descendants = [bitset.bit_count() for bitset in self._descendants]
+
+
+    def __len__(self) -> int:
+        return len(self._dependents)
+
+
+    def num_edges(self) -> int:
+        return self._num_edges
+
+
+    def prerequisites(self, course_id: int) -> frozenset:
+        """
+        Returns the IDs of the courses with an edge into course_id.
+        """
+        return self._prereqs.leaves(course_id) - {course_id}
+
+
+    def dependents(self, course_id: int) -> list:
+        """
+        Returns the IDs of the courses with an edge out of course_id, in
+        ascending order.
+        """
+        return self._dependents[course_id]
+
+
+    def dependents_of(self, course: str) -> list:
+        """
+        Returns the IDs of the courses requiring course (refer to
+        dependents), or an empty list if course has no ID.
+        """
+        course_id = self._prereqs.id_of(course)
+        return [] if course_id is None else self._dependents[course_id]
+
+
+    def ancestors(self, course_id: int) -> int:
+        """
+        Returns the bitset of every course which course_id transitively
+        requires.
+        """
+        return self._ancestors[course_id]
+
+
+    def descendants(self, course_id: int) -> int:
+        """
+        Returns the bitset of every course which transitively requires
+        course_id.
+        """
+        return self._descendants[course_id]
+
+
+    def num_descendants(self, course_id: int) -> int:
+        """
+        Returns the number of courses which transitively require
+        course_id.
+        """
+        return self._num_descendants[course_id]
+
+
+    def reaches(self, a: int, b: int) -> bool:
+        """
+        Checks if course a is transitively a prerequisite to course b.
+        """
+        return self._ancestors[b] >> a & 1 == 1
+
+
+    def subgraph(self, courses: list) -> 'Graph':
+        """
+        Returns the graph of the given courses, with an edge c->d for
+        every course c which is a prerequisite to course d.
+            - Only looks at the prerequisites of the given courses, so it
+              takes time linear in their number of edges
+            - Courses without an ID have no edges
+            - As with Graph, the list of courses is kept as its keys
+        """
+        ids = {}
+        for course in courses:
+            course_id = self._prereqs.id_of(course)
+            if course_id is not None:
+                ids[course_id] = course
+
+        graph = Graph(courses)
+        for course_id, course in ids.items():
+            for prereq_id in self.prerequisites(course_id):
+                prereq = ids.get(prereq_id)
+                if prereq is not None:
+                    graph.addDirectedEdge(prereq, course)
+        return graph
+
+
+    def _topological_order(self) -> tuple:
+        """
+        Returns the course IDs with every prerequisite before the courses
+        requiring it (Kahn's algorithm), followed by any courses on or
+        after a cycle of prerequisites, and whether there were none.
+        """
+        in_degree = [len(self.prerequisites(course_id)) for course_id in range(len(self))]
+        order = [course_id for course_id in range(len(self)) if in_degree[course_id] == 0]
+        for course_id in order:
+            for dependent in self._dependents[course_id]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    order.append(dependent)
+
+        acyclic = len(order) == len(self)
+        if not acyclic:
+            ordered = set(order)
+            order += [course_id for course_id in range(len(self)) if course_id not in ordered]
+        return order, acyclic
+
+
+def bits(bitset: int) -> list:
+    """
+    Returns the position of every set bit (course ID) of a bitset, in
+    ascending order.
+    """
+    positions = []
+    while bitset:
+        low = bitset & -bitset
+        positions.append(low.bit_length()-1)
+        bitset ^= low
+    return positions
+
+
+def _closure(order: list, edges, size: int, acyclic: bool) -> list:
+    """
+    Returns the bitset of every vertex transitively reachable through
+    edges from each vertex, given vertices in an order where edges(v)
+    come before v.
+        - If there are cycles, edges(v) may come after v, so every
+          bitset is recomputed until none changes
+    """
+    closure = [0]*size
+    for vertex in order:
+        bitset = 0
+        for other in edges(vertex):
+            bitset |= closure[other] | 1 << other
+        closure[vertex] = bitset
+
+    changed = not acyclic
+    while changed:
+        changed = False
+        for vertex in order:
+            bitset = closure[vertex]
+            for other in edges(vertex):
+                bitset |= closure[other] | 1 << other
+            if bitset != closure[vertex]:
+                closure[vertex] = bitset
+                changed = True
+
+    return closure
@@ -0,0 +1,439 @@
+# prereqs.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Parses prerequisite strings into AND/OR expression trees.
+#
+#   The prerequisites of a course are written as, i.e.:
+#       CHEM H2B and (CHEM H2LB or CHEM M2LB). CHEM H2B with a grade...
+#       MATH 2A or MATH 5A
+#       Recommended: ART 11B.
+#   Only the first sentence is required, the rest are conditions on
+#   it (grades, placement) or recommendations. It is parsed into a tree
+#   where, as in the catalogue, "or" binds tighter than "and":
+#       ["and", CHEM H2B, ["or", CHEM H2LB, CHEM M2LB]]
+#   A bare number after a course is a course of the same department
+#   (i.e. "PSYCH 10A and 10B"), and a trailing grade condition ("... with
+#   a grade of C or better") is left out. Other text between "and", "or"
+#   and parentheses which mentions no course (i.e. "SAT Mathematics",
+#   "audition") is an unparsed node, which no courses satisfy:
+#       ["or", MATH 1B, AP Calculus AB, ["unparsed"], ["unparsed"]]
+#   Requirements whose text mentions courses (i.e. "Three courses
+#   selected from ENGLISH 8, ENGLISH 9, ...") or which are malformed are
+#   one unparsed node of every course they mention, so that the courses
+#   are known, but never read as met:
+#       ["unparsed", ENGLISH 8, ENGLISH 9, ...]
+#   Courses a student is placed into are not requirements, and are left
+#   out.
+#
+#   Trees are built once, when the index is written, and saved into
+#   prereqs.txt with every course replaced by an integer ID:
+#   {
+#       "courses": [course, ...],
+#       "trees": [tree or null, ...]
+#   }
+#   IDs are positions in "courses", which lists the courses of the index
+#   in order (so that the tree of a course is at its own ID), followed
+#   by prerequisites which are not in the index (i.e. AP Calculus AB).
+#
+#   To check every course at once, each tree is also compiled into
+#   clauses (an AND of ORs), each clause a bitmask of its courses' IDs.
+#   A course can be taken if every one of its clauses shares a bit with
+#   the bitmask of completed courses, so the whole catalogue is checked
+#   with one AND per clause. Trees which would need more than
+#   MAX_CLAUSES clauses (an "or" of many "and"s) are evaluated as trees.
+
+import re
+from itertools import product
+from math import prod
+
+PREREQS_PATH = "prereqs.txt"
+
+# Maximum number of clauses a course's tree is compiled into
+MAX_CLAUSES = 64
+
+# A course, i.e. I&C SCI 31, IN4MATX 43, CRM/LAW C260C, or an AP exam,
+# i.e. AP36, AP Calculus AB
+_COURSE = r"(?:[A-Z][A-Z0-9&/]*\s)+[A-Z]*\d+[A-Z0-9]*|AP\d+|AP(?:\s[A-Z][A-Za-z]*:?)+"
+_COURSE_PATTERN = re.compile(r"\b(?:"+_COURSE+r")\b")
+_TOKEN_PATTERN = re.compile(r"\s*(?:(\()|(\))|\b(and|or)\b|("+_COURSE+r")\b|\b([A-Z]?\d+[A-Z0-9]*)\b|([^\s()]+))")
+
+# Kinds of tokens, the groups of _TOKEN_PATTERN
+_OPERATOR_TOKEN = 2
+_COURSE_TOKEN = 3
+_NUMBER_TOKEN = 4
+_WORD_TOKEN = 5
+
+# A grade condition on the requirement, i.e. "with an average grade of B
+# or better"
+_CONDITION_PATTERN = re.compile(r"\s+with\s+(?:an?\s+)?(?:average\s+|minimum\s+)*grade\b.*$", re.IGNORECASE)
+
+# Courses a student is placed into, rather than having taken
+_PLACEMENT_PATTERN = re.compile(r"\bplacement\s+into\s+(?:"+_COURSE+r")\b(?:,?\s+(?:or\s+|and\s+)?(?:"+_COURSE+r")\b)*",
+                                re.IGNORECASE)
+
+# Prefixes before the requirement, i.e. "Prerequisite or corequisite: "
+# is indexed as "r corequisite: "
+_PREFIX_PATTERN = re.compile(r"^\s*(?:r\s+)?(?:corequisite|concurrent[^:]*):\s*", re.IGNORECASE)
+
+
+class PrereqParseError(Exception):
+    pass
+
+
+def parse_prereq(prereq_str: str):
+    """
+    Returns the expression tree of a prerequisite string, with courses
+    as strings, or None if it does not require any course.
+        Takes the form of:
+            course | ["and", tree, ...] | ["or", tree, ...]
+                   | ["unparsed", course, ...]
+        - Text which is not a course is kept as an unparsed node (refer
+          to the top of this file)
+    """
+    requirement = _PREFIX_PATTERN.sub("", prereq_str)
+    if requirement.lower().startswith(("recommended", "required:")):
+        return None
+
+    requirement = re.split(r"\.(?:\s|$)", requirement, 1)[0]
+    courses = list(dict.fromkeys(_normalize(course) for course in _COURSE_PATTERN.findall(requirement)))
+    if not courses:
+        return None
+
+    placed = {_normalize(course) for match in _PLACEMENT_PATTERN.finditer(requirement)
+              for course in _COURSE_PATTERN.findall(match.group())}
+    try:
+        return _Parser(_CONDITION_PATTERN.sub("", requirement), placed).parse()
+    except PrereqParseError:
+        return ["unparsed", *(course for course in courses if course not in placed)]
+
+
+def build_prereqs(index: dict) -> dict:
+    """
+    Returns the prerequisite trees of every course in the index, with
+    courses replaced by IDs (refer to the top of this file).
+    """
+    ids = {course: i for i, course in enumerate(index)}
+
+    def to_ids(tree, course: str):
+        if isinstance(tree, str):
+            if tree not in ids:
+                ids[tree] = len(ids)
+            return ids[tree]
+        if tree[0] == "unparsed":
+            # Text mentioning the course itself does not require it
+            return ["unparsed", *(to_ids(node, course) for node in tree[1:] if node != course)]
+        return [tree[0], *(to_ids(node, course) for node in tree[1:])]
+
+    trees = []
+    for course, info in index.items():
+        tree = parse_prereq(info[3])
+        trees.append(None if tree is None else to_ids(tree, course))
+
+    return {"courses": list(ids), "trees": trees}
+
+
+class PrereqTable:
+    def __init__(self, prereqs: dict):
+        """
+        Initialize the prerequisite trees saved in prereqs.txt (refer to
+        build_prereqs).
+            - The courses of every tree are kept as a set, so checking
+              whether a course is a prerequisite is a set look-up
+        """
+        self._courses = prereqs["courses"]
+        self._ids = {course: i for i, course in enumerate(self._courses)}
+        self._trees = prereqs["trees"]
+        self._leaves = [frozenset() if tree is None else frozenset(_leaves(tree)) for tree in self._trees]
+        self._restricted = [course_id for course_id, tree in enumerate(self._trees) if tree is not None]
+        self._compiled = None
+
+
+    def __len__(self) -> int:
+        """
+        Returns the number of course IDs, including prerequisites which
+        are not in the index.
+        """
+        return len(self._courses)
+
+
+    def id_of(self, course: str) -> int:
+        """
+        Returns the ID of course, or None if no course requires it and
+        it is not in the index.
+        """
+        return self._ids.get(course)
+
+
+    def name(self, course_id: int) -> str:
+        return self._courses[course_id]
+
+
+    def tree(self, course_id: int):
+        """
+        Returns the prerequisite tree of a course (of IDs), or None.
+        """
+        return self._trees[course_id] if course_id < len(self._trees) else None
+
+
+    def leaves(self, course_id: int) -> frozenset:
+        """
+        Returns the ID of every course in a course's prerequisite tree.
+        """
+        return self._leaves[course_id] if course_id < len(self._leaves) else frozenset()
+
+
+    def requires(self, a: str, b: str) -> bool:
+        """
+        Checks if course a is in the prerequisites of course b.
+        """
+        a_id = self._ids.get(a)
+        b_id = self._ids.get(b)
+        return a_id is not None and b_id is not None and a_id in self.leaves(b_id)
+
+
+    def unmet(self, course: str, taken: set) -> list:
+        """
+        Returns each requirement of course which none of the taken course
+        IDs satisfy, as a list of its alternatives.
+            e.g. [["I&C SCI 32", "CSE 42"], ["MATH 2B"]]
+            - Requirements are the children of the tree's top "and",
+              alternatives the children of each requirement's "or"
+            - Every course an unparsed tree mentions is read as a
+              requirement of its own, and unparsed alternatives are left
+              out (refer to the top of this file)
+        """
+        tree = self.tree(self._ids.get(course, len(self._trees)))
+        if tree is None:
+            return []
+
+        requirements = tree[1:] if isinstance(tree, list) and tree[0] in ("and", "unparsed") else [tree]
+
+        unmet = []
+        for requirement in requirements:
+            if not _satisfied(requirement, taken):
+                alternatives = requirement[1:] if isinstance(requirement, list) and requirement[0] == "or" else [requirement]
+                unmet.append([self._describe(alternative) for alternative in alternatives if not _unparsed(alternative)])
+        return [alternatives for alternatives in unmet if alternatives]
+
+
+    def eligible(self, taken: set, unrestricted: bool = False) -> list:
+        """
+        Returns the ID of every course with prerequisites which the taken
+        course IDs satisfy, in ascending order.
+            - Checks the clauses of every course in one pass, compiling
+              them on first use
+            - Courses whose prerequisites could not be parsed are never
+              returned
+            - If unrestricted, also returns courses without prerequisites
+        """
+        if self._compiled is None:
+            self._compiled = self._compile()
+        clauses, clause_courses, uncompiled = self._compiled
+
+        mask = 0
+        for course_id in taken:
+            if course_id is not None:
+                mask |= 1 << course_id
+
+        blocked = {course_id for clause, course_id in zip(clauses, clause_courses) if not mask & clause}
+        blocked.update(course_id for course_id in uncompiled if not _satisfied(self._trees[course_id], taken))
+        courses = range(len(self._trees)) if unrestricted else self._restricted
+        return [course_id for course_id in courses if course_id not in blocked]
+
+
+    def _compile(self) -> tuple:
+        """
+        Returns the clauses of every course with prerequisites, flattened
+        into a list of bitmasks and a list of the course of each, and the
+        courses whose trees are not compiled.
+        """
+        clauses = []
+        clause_courses = []
+        uncompiled = []
+        for course_id in self._restricted:
+            course_clauses = _clauses(self._trees[course_id])
+            if course_clauses is None:
+                uncompiled.append(course_id)
+                continue
+            clauses += course_clauses
+            clause_courses += [course_id]*len(course_clauses)
+        return clauses, clause_courses, uncompiled
+
+
+    def _describe(self, tree) -> str:
+        if isinstance(tree, int):
+            return self._courses[tree]
+        return "("+f" {tree[0]} ".join(self._describe(node) for node in tree[1:] if not _unparsed(node))+")"
+
+
+def _unparsed(tree) -> bool:
+    return isinstance(tree, list) and tree[0] == "unparsed"
+
+
+def _leaves(tree):
+    if isinstance(tree, int):
+        yield tree
+    else:
+        for node in tree[1:]:
+            yield from _leaves(node)
+
+
+def _clauses(tree) -> list:
+    """
+    Returns the clauses of a tree as bitmasks of course IDs, so that the
+    tree is satisfied if every clause shares a bit with the taken
+    courses, or None if there would be more than MAX_CLAUSES.
+        - An "or" of "and"s is distributed, i.e. (A and B) or C becomes
+          (A or C) and (B or C)
+        - Clauses containing another clause are dropped
+        - An unparsed tree is one empty clause, which no courses satisfy
+    """
+    if isinstance(tree, int):
+        return [1 << tree]
+    if tree[0] == "unparsed":
+        return [0]
+
+    nodes = [_clauses(node) for node in tree[1:]]
+    if any(node is None for node in nodes):
+        return None
+    if tree[0] == "and":
+        if sum(len(node) for node in nodes) > MAX_CLAUSES:
+            return None
+        clauses = [clause for node in nodes for clause in node]
+    else:
+        if prod(len(node) for node in nodes) > MAX_CLAUSES:
+            return None
+        clauses = [_or(combination) for combination in product(*nodes)]
+
+    clauses = sorted(set(clauses), key=int.bit_count)
+    kept = []
+    for clause in clauses:
+        if not any(clause & other == other for other in kept):
+            kept.append(clause)
+    return kept
+
+
+def _or(masks: tuple) -> int:
+    result = 0
+    for mask in masks:
+        result |= mask
+    return result
+
+
+def _satisfied(tree, taken: set) -> bool:
+    """
+    Checks if the taken course IDs satisfy a tree.
+    """
+    if isinstance(tree, int):
+        return tree in taken
+    if tree[0] == "unparsed":
+        return False
+    if tree[0] == "and":
+        return all(_satisfied(node, taken) for node in tree[1:])
+    return any(_satisfied(node, taken) for node in tree[1:])
+
+
+def _normalize(course: str) -> str:
+    return " ".join(course.split())
+
+
+class _Parser:
+    def __init__(self, text: str, placed: set = frozenset()):
+        """
+        Recursive descent parser of a requirement, refer to parse_prereq.
+            - Courses in placed are not requirements (students are placed
+              into them)
+
+        Exceptions:
+        PrereqParseError if the "and"s, "or"s and parentheses of text
+        are malformed
+        """
+        self._tokens = []
+        self._placed = placed
+        position = 0
+        dept = None
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN_PATTERN.match(text, position)
+            if match is None or match.end() == position:
+                raise PrereqParseError(text[position:])
+            token, kind = next((group, kind) for kind, group in enumerate(match.groups()) if group is not None)
+            if kind == _COURSE_TOKEN:
+                token = _normalize(token)
+                dept = token.rpartition(" ")[0]
+            elif kind == _NUMBER_TOKEN:
+                # Shorthand for a course of the department before it
+                token, kind = (dept+" "+token, _NUMBER_TOKEN) if dept else (token, _WORD_TOKEN)
+            self._tokens.append((token, kind))
+            position = match.end()
+        self._position = 0
+
+
+    def parse(self):
+        if not self._tokens:
+            raise PrereqParseError("No requirement")
+        tree = self._parse_and()
+        if self._position != len(self._tokens):
+            raise PrereqParseError(self._tokens[self._position][0])
+        return tree
+
+
+    def _parse_and(self):
+        nodes = [self._parse_or()]
+        while self._peek() == "and":
+            self._position += 1
+            nodes.append(self._parse_or())
+        return _flatten("and", nodes)
+
+
+    def _parse_or(self):
+        nodes = [self._parse_atom()]
+        while self._peek() == "or":
+            self._position += 1
+            nodes.append(self._parse_atom())
+        return _flatten("or", nodes)
+
+
+    def _parse_atom(self):
+        if self._position == len(self._tokens):
+            raise PrereqParseError("Ends with an operator")
+        token, kind = self._tokens[self._position]
+        self._position += 1
+
+        if token == "(":
+            tree = self._parse_and()
+            if self._peek() != ")":
+                raise PrereqParseError("Unbalanced parentheses")
+            self._position += 1
+            return tree
+        if token == ")" or kind == _OPERATOR_TOKEN:
+            raise PrereqParseError(token)
+
+        # A course, or text up to the next operator or parenthesis
+        run = [(token, kind)]
+        while self._position < len(self._tokens) and self._tokens[self._position][1] >= _COURSE_TOKEN:
+            run.append(self._tokens[self._position])
+            self._position += 1
+        courses = [token for token, kind in run if kind != _WORD_TOKEN and token not in self._placed]
+        if len(run) == 1 and courses:
+            return token
+        if courses:
+            raise PrereqParseError("Text around "+courses[0])
+        return ["unparsed"]
+
+
+    def _peek(self):
+        return self._tokens[self._position][0] if self._position < len(self._tokens) else None
+
+
+def _flatten(operator: str, nodes: list):
+    """
+    Returns nodes joined by operator, merging nested nodes of the same
+    operator, or the only node.
+    """
+    flat = []
+    for node in nodes:
+        if isinstance(node, list) and node[0] == operator:
+            flat += node[1:]
+        elif node not in flat:
+            flat.append(node)
+    return flat[0] if len(flat) == 1 else [operator, *flat]
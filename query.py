@@ -2,23 +2,106 @@
 # ------------------------------------------------------------------
 # Retrieves information from the index.
 
-from index import Index
-
-INDEX = Index().get_index()
+from registry import get_index, get_prereqs, get_prereq_graph
+from prereq_graph import bits
 
 
 def prereq(a: str, b: str) -> bool:
     """
     Checks if course a is a prerequisite to course b.
+        - Looks a up in the set of courses of b's prerequisite tree
+          (refer to prereqs.py)
+    """
+    return get_prereqs().requires(a, b)
+
+
+def prereq_subgraph(class_list: list) -> 'Graph':
+    """
+    Returns the graph of the given courses, with an edge c->d for every
+    course c which is a prerequisite to course d.
+        - Taken from the prerequisite graph of every course (refer to
+          prereq_graph.py), rather than checking every pair with prereq
+    """
+    return get_prereq_graph().subgraph(class_list)
+
+
+def transitive_prereq(a: str, b: str) -> bool:
     """
-    return INDEX[b][3].find(a) != -1
+    Checks if course a is a prerequisite to course b, or to any of its
+    prerequisites, and so on.
+    """
+    prereqs = get_prereqs()
+    a_id = prereqs.id_of(a)
+    b_id = prereqs.id_of(b)
+    return a_id is not None and b_id is not None and get_prereq_graph().reaches(a_id, b_id)
+
+
+def ancestors(course: str) -> list:
+    """
+    Returns every course which may have to be taken before course, i.e.
+    its prerequisites, their prerequisites, and so on (in the order of
+    the index).
+    """
+    return _courses(course, get_prereq_graph().ancestors)
+
+
+def descendants(course: str) -> list:
+    """
+    Returns every course which course may have to be taken before, i.e.
+    the courses requiring it, the courses requiring those, and so on (in
+    the order of the index).
+    """
+    return _courses(course, get_prereq_graph().descendants)
+
+
+def unlocks(course: str) -> dict:
+    """
+    Returns the courses which course opens up, directly (it is one of
+    their prerequisites) and transitively (it is one of their ancestors,
+    including direct ones), in the order of the index.
+        Takes the form of:
+        {
+            "course": course,
+            "direct": [course, ...],
+            "transitive": [course, ...],
+            "num_direct": int,
+            "num_transitive": int
+        }
+    """
+    prereqs = get_prereqs()
+    graph = get_prereq_graph()
+    course_id = prereqs.id_of(course)
+    if course_id is None:
+        return {"course": course, "direct": [], "transitive": [], "num_direct": 0, "num_transitive": 0}
+
+    direct = graph.dependents(course_id)
+    return {
+        "course": course,
+        "direct": [prereqs.name(i) for i in direct],
+        "transitive": [prereqs.name(i) for i in bits(graph.descendants(course_id))],
+        "num_direct": len(direct),
+        "num_transitive": graph.num_descendants(course_id)
+    }
+
+
+def eligible(class_list: list, unrestricted: bool = False) -> list:
+    """
+    Returns every course whose prerequisites are satisfied by the
+    completed courses of class_list, other than those courses (in the
+    order of the index).
+        - If unrestricted, also returns courses without prerequisites
+    """
+    prereqs = get_prereqs()
+    completed = set(class_list)
+    courses = (prereqs.name(i) for i in prereqs.eligible({prereqs.id_of(c) for c in class_list}, unrestricted))
+    return [c for c in courses if c not in completed]
 
 
 def valid_class(x: str) -> bool:
     """
     Checks if course x is a valid course.
     """
-    return x in INDEX
+    return x in get_index()
 
 
 def check_for_unlisted_prereqs(course: str, class_list: list):
@@ -27,19 +110,20 @@ def check_for_unlisted_prereqs(course: str, class_list: list):
         e.g. Input is ICS 33 and ICS 6B -- the program will
              warn them that ICS 32 is a prerequisite to 33,
              since they did not input it themselves.
+        - Returns each unmet requirement as a list of its alternatives
     """
-    if not INDEX[course][3]:
-        return []
-    
-    prereq_str = INDEX[course][3]
-    prereq_list_before_OR = prereq_str.split(" and ")
-    prereq_list = [c.split(" or ") for c in prereq_list_before_OR]
-
-    for course in class_list:
-        for i in range(len(prereq_list)):
-            if any( True if c.find(course) != -1 else False for c in prereq_list[i] ):
-                prereq_list[i] = []
-    
-    prereq_list = [x for x in prereq_list if x != [] and x != ['']]
-    return prereq_list
+    prereqs = get_prereqs()
+    taken = {prereqs.id_of(c) for c in class_list}
+    return prereqs.unmet(course, taken)
+
 
+def _courses(course: str, bitset) -> list:
+    """
+    Returns the courses in bitset(ID of course), or an empty list if
+    course has no ID.
+    """
+    prereqs = get_prereqs()
+    course_id = prereqs.id_of(course)
+    if course_id is None:
+        return []
+    return [prereqs.name(i) for i in bits(bitset(course_id))]
@@ -0,0 +1,95 @@
+# query_cache.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Bounded LRU cache of search results.
+#
+#   The same few searches are made over and over, so their results are
+#   kept in memory, keyed by the lemmatized tokens of the query. Every
+#   entry is tagged with the version of the indexes it was computed
+#   from (refer to registry.version), so reloading the indexes drops
+#   every stale result. The cache is shared by every thread.
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class QueryCache:
+    def __init__(self, maxsize: int):
+        """
+        Initialize a cache of at most maxsize results.
+        """
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+
+    def get(self, key: tuple, version: int):
+        """
+        Returns the result cached under key, or None if there is none.
+            - If the indexes have been reloaded since the cached results
+              were computed (version differs), every result is dropped
+        """
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+
+            result = self._entries.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return result
+
+
+    def put(self, key: tuple, version: int, result) -> None:
+        """
+        Caches result under key, evicting the least recently used result
+        if the cache is full.
+            - Results of an older version of the indexes are not cached
+        """
+        if self._maxsize <= 0:
+            return
+
+        with self._lock:
+            if version != self._version:
+                return
+
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        """
+        Drops every cached result and resets the stats.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+    def info(self) -> dict:
+        """
+        Returns the stats of the cache.
+            Takes the form of:
+            {
+                "hits": int, "misses": int, "hit_rate": float,
+                "size": int, "maxsize": int
+            }
+        """
+        with self._lock:
+            lookups = self._hits+self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits/lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self._maxsize,
+            }
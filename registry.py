@@ -0,0 +1,338 @@
+# registry.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Process-wide registry of the indexes.
+#
+#   Each index is loaded from disk once, the first time it is used,
+#   and the same object is then shared by query.py, search.py and
+#   app.py (and every thread serving requests). The time taken to load
+#   each index is recorded, and so is its memory if ANTCHECK_PROFILE=1
+#   (measured with tracemalloc, which slows every allocation down).
+#
+#   Indexes are read from the JSON files by default, or from the SQLite
+#   store (refer to store.py) if ANTCHECK_BACKEND=sqlite. If
+#   ANTCHECK_BACKEND=binary, the inverted index is mapped from its binary
+#   format instead (refer to postings.py). Both files are rewritten along
+#   with the JSON files once they exist (refer to
+#   Index._write_binary_indexes).
+#
+#   Boolean queries (refer to boolean_query.py) are still evaluated over
+#   the JSON inverted index whichever the backend, and so are BM25F
+#   rankings with the binary backend, so the whole JSON inverted index
+#   is loaded into every process which serves one. Only plain queries
+#   are served from the store (or the binary inverted index) alone.
+#
+#   BM25F rankings use the parameters of bm25.py unless given in
+#   ANTCHECK_BM25F, e.g. ANTCHECK_BM25F="k1=1.5,title_boost=2" (refer
+#   to BM25F_PARAMS).
+#
+#   The files are checked for changes at most once every CHECK_INTERVAL
+#   seconds, whenever an index is used. Once any of them is rewritten
+#   (i.e. by create_indexes or update_departments, in this process or
+#   another), every loaded index is reloaded, which also drops every
+#   cached search result (refer to version).
+
+from index import Index
+from courses import CourseTable, load_course_table, INDEX_PATH
+from store import CourseStore, STORE_PATH
+from postings import BinaryPostings, PostingsFormatError, POSTINGS_PATH
+from bm25 import BM25F, parse_params
+from phrases import BinaryPositions, PositionalIndex, PositionsFormatError, POSITIONS_PATH
+from boolean_query import IdPostings
+from prereqs import PrereqTable, PREREQS_PATH
+from prereq_graph import PrereqGraph
+
+import os
+import tracemalloc
+from threading import RLock, local
+from time import perf_counter
+
+_LOCK = RLock()
+_INDEX_OBJ = Index()
+_ARTIFACTS = {}
+_LOADERS = {}
+_STATS = {}
+_VERSION = 0
+_LOADING = local()
+
+# Files which the indexes are loaded from
+_FILES = (INDEX_PATH, "inverted_index.txt", "fields.txt", POSITIONS_PATH, "positions.txt", "lemmas.txt",
+          PREREQS_PATH, POSTINGS_PATH, STORE_PATH)
+_MTIMES = None
+_CHECKED = 0.0
+
+# Minimum number of seconds between checks of the files for changes
+CHECK_INTERVAL = 1.0
+
+# Which files the indexes are read from: "json", "sqlite" or "binary"
+BACKEND = os.environ.get("ANTCHECK_BACKEND", "json")
+
+# Parameters of the BM25F scorer which differ from the defaults of
+# bm25.py, by name of BM25F's arguments (e.g. {"k1": 1.5})
+# - Note: Applied when the scorer is next created, i.e. after reload()
+BM25F_PARAMS = parse_params(os.environ.get("ANTCHECK_BM25F", ""))
+
+# Whether the memory taken to load each index is measured
+PROFILE = os.environ.get("ANTCHECK_PROFILE", "0") != "0"
+
+
+def get_index_obj() -> 'Index':
+    """
+    Returns the Index object which every index is loaded through.
+    """
+    return _INDEX_OBJ
+
+
+def get_index() -> 'CourseTable':
+    """
+    Returns the index (index.txt) as a course table, loading it on
+    first use.
+        - With the SQLite backend, returns the store's courses instead
+    """
+    if BACKEND == "sqlite":
+        return get_store()
+    return get_course_table()
+
+
+def get_course_table() -> 'CourseTable':
+    """
+    Returns the course table of index.txt, loading it on first use,
+    whichever the backend.
+    """
+    return _load("index", load_course_table)
+
+
+def get_prereqs() -> 'PrereqTable':
+    """
+    Returns the prerequisite trees of every course (prereqs.txt),
+    loading them on first use, whichever the backend.
+    """
+    return _load("prereqs", lambda: PrereqTable(_INDEX_OBJ.get_prereqs()))
+
+
+def get_prereq_graph() -> 'PrereqGraph':
+    """
+    Returns the prerequisite graph of every course (refer to
+    prereq_graph.py), building it on first use.
+    """
+    return _load("prereq_graph", lambda: PrereqGraph(get_prereqs()))
+
+
+def get_store() -> 'CourseStore':
+    """
+    Returns the SQLite store (catalogue.db), opening it on first use.
+    """
+    return _load("store", CourseStore)
+
+
+def get_inverted_index() -> dict:
+    """
+    Returns the inverted index (inverted_index.txt), loading it on
+    first use.
+    """
+    return _load("inverted_index", lambda: _INDEX_OBJ.get_inverted_index())
+
+
+def get_field_lengths() -> dict:
+    """
+    Returns the title/description lengths of every course (fields.txt),
+    loading them on first use.
+    """
+    return _load("field_lengths", lambda: _INDEX_OBJ.get_field_lengths())
+
+
+def get_bm25f() -> 'BM25F':
+    """
+    Returns the BM25F scorer over the inverted index, creating it on
+    first use (with BM25F_PARAMS, otherwise the defaults of bm25.py).
+    """
+    return _load("bm25f", lambda: BM25F(get_inverted_index(), get_field_lengths(), **BM25F_PARAMS))
+
+
+def get_positions() -> 'PositionalIndex':
+    """
+    Returns the positions of tokens (positions.bin), mapping them on
+    first use.
+        - Read from positions.txt if they were written before positions
+          were binary
+        - Empty if the inverted index was built without positions
+    """
+    return _load("positions", lambda: PositionalIndex(_open_positions()))
+
+
+def get_id_postings() -> 'IdPostings':
+    """
+    Returns the posting lists of course IDs which boolean queries are
+    evaluated over (refer to boolean_query.py), creating them on first
+    use.
+    """
+    return _load("id_postings", lambda: IdPostings(get_course_table(), get_inverted_index(), get_positions, get_prereq_graph))
+
+
+def get_postings() -> 'BinaryPostings':
+    """
+    Returns the binary inverted index (inverted_index.bin), mapping it
+    on first use.
+    """
+    return _load("postings", BinaryPostings)
+
+
+def get_lemmas() -> dict:
+    """
+    Returns the lemma table (lemmas.txt), loading it on first use.
+        - With the SQLite backend, returns the store's lemmas instead
+    """
+    if BACKEND == "sqlite":
+        return get_store().lemmas
+    return _load("lemmas", lambda: _INDEX_OBJ.get_lemmas())
+
+
+def lemmatize(token: str) -> str:
+    """
+    Returns the lemma of a query token, refer to Index.lemmatize.
+    """
+    lemma = get_lemmas().get(token)
+    if lemma is None:
+        lemma = _INDEX_OBJ._lemmatize_with_pos(token)
+    return lemma
+
+
+def version() -> int:
+    """
+    Returns the version of the loaded indexes, which changes on every
+    reload.
+        - Reloads the indexes first if their files have changed
+    """
+    _check_files()
+    return _VERSION
+
+
+def reload() -> None:
+    """
+    Drops every loaded index and loads each of them from disk again.
+        - The lock is held throughout, so no thread loads an index (or
+          one built from it) from the files before the reload
+        - An index which cannot be loaded is reported and left out, it
+          is then loaded on its next use
+    """
+    global _INDEX_OBJ, _VERSION, _MTIMES
+    with _LOCK:
+        names = list(_ARTIFACTS)
+        _MTIMES = _mtimes()
+        _INDEX_OBJ = Index()
+        _ARTIFACTS.clear()
+        _STATS.clear()
+        _VERSION += 1
+
+        for name in names:
+            try:
+                _load(name, _LOADERS[name])
+            except (OSError, ValueError, PostingsFormatError, PositionsFormatError) as e:
+                print(f"Could not reload {name}: {e}")
+
+
+def stats() -> dict:
+    """
+    Returns the load time and memory of every loaded index.
+        Takes the form of:
+        {
+            name: {"seconds": float, "bytes": int or None}, ...
+        }
+        - Memory is only measured if PROFILE, and includes any index
+          loaded to build it
+    """
+    with _LOCK:
+        return {name: dict(stat) for name, stat in _STATS.items()}
+
+
+def _load(name: str, loader):
+    """
+    Returns the index called name, calling loader to load it if it has
+    not been loaded yet.
+        - Only one thread loads indexes at a time; any others wait for
+          it. Loaders may load the indexes they are built from, and
+          look them up when called so that they are never built from
+          indexes dropped by reload
+    """
+    _check_files()
+    artifact = _ARTIFACTS.get(name)
+    if artifact is not None:
+        return artifact
+
+    global _MTIMES
+    with _LOCK:
+        artifact = _ARTIFACTS.get(name)
+        if artifact is not None:
+            return artifact
+        if _MTIMES is None:
+            _MTIMES = _mtimes()
+
+        measure = PROFILE or tracemalloc.is_tracing()
+        started = measure and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0] if measure else 0
+        start = perf_counter()
+
+        _LOADING.depth = getattr(_LOADING, "depth", 0)+1
+        try:
+            artifact = loader()
+        finally:
+            _LOADING.depth -= 1
+
+        seconds = perf_counter()-start
+        size = tracemalloc.get_traced_memory()[0]-before if measure else None
+        if started:
+            tracemalloc.stop()
+
+        _ARTIFACTS[name] = artifact
+        _LOADERS[name] = loader
+        _STATS[name] = {"seconds": seconds, "bytes": size}
+        if size is None:
+            print(f"Loaded {name} in {seconds:.2f}s")
+        else:
+            print(f"Loaded {name} in {seconds:.2f}s ({size/2**20:.1f} MB)")
+
+        return artifact
+
+
+def _open_positions():
+    """
+    Returns the positions of tokens, refer to get_positions.
+    """
+    try:
+        return BinaryPositions(POSITIONS_PATH)
+    except FileNotFoundError:
+        return _INDEX_OBJ.get_positions()
+
+
+def _check_files() -> None:
+    """
+    Reloads the indexes if any of their files has changed since they
+    were loaded, checking at most once every CHECK_INTERVAL seconds.
+        - Not checked while an index is being loaded by this thread, so
+          that an index is never dropped while it is being built
+    """
+    global _CHECKED
+    now = perf_counter()
+    if now-_CHECKED < CHECK_INTERVAL or getattr(_LOADING, "depth", 0):
+        return
+    _CHECKED = now
+
+    if _MTIMES is not None and _ARTIFACTS and _mtimes() != _MTIMES:
+        with _LOCK:
+            if _mtimes() != _MTIMES:
+                print("Index files changed, reloading")
+                reload()
+
+
+def _mtimes() -> dict:
+    """
+    Returns the modification time of each file which exists.
+    """
+    mtimes = {}
+    for path in _FILES:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return mtimes
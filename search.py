@@ -2,31 +2,318 @@
 # ------------------------------------------------------------------
 # Shell implementation of the catalogue search.
 
-from index import Index
+from index import tokenize, is_word
+import registry
+from registry import get_bm25f, get_course_table, get_id_postings, get_index, get_inverted_index, get_positions, get_postings, get_store, lemmatize
+from query_cache import QueryCache
+from boolean_query import BooleanQueryError, evaluate, is_boolean, parse, positive_tokens
 
-from nltk.tokenize import wordpunct_tokenize
+import re
+import heapq
 
-INDEX_OBJ = Index()
-DATA_INDEX = INDEX_OBJ.get_index()
-DATA_INVERTED_INDEX = INDEX_OBJ.get_inverted_index()
+# Number of results shown by the shell and the website
+RESULT_LIMIT = 100
 
+# Margin kept when pruning by score bounds, so that rounding in the sums
+# of weights never prunes a course which belongs in the top results
+_PRUNING_SLACK = 1e-9
 
-def query_catalogue(query: str) -> list[str]:
+# How results are ranked: by TF-IDF or by BM25F (refer to bm25.py)
+RANKINGS = ("tfidf", "bm25f")
+
+# Quoted phrases of a query, i.e. "machine learning"
+_PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+
+# Number of search results kept in memory, refer to query_cache.py
+QUERY_CACHE_SIZE = 1024
+_QUERY_CACHE = QueryCache(QUERY_CACHE_SIZE)
+
+
+def query_catalogue(query: str, limit: int = None, ranking: str = "tfidf") -> list[str]:
     """
-    Queries the indexes and returns results sorted by TF-IDF.
+    Queries the indexes and returns results sorted by TF-IDF, or by
+    BM25F if ranking is "bm25f" (always by bm25 with the SQLite backend).
+        - If given a limit, only the top `limit` results are returned,
+          selected with a heap rather than sorting every match
+        - Ties keep the same order whether or not a limit is given
+        - With the binary backend and a limit, courses which cannot
+          make the top results are skipped (refer to _top_by_max_score)
+        - BM25F is scored over the JSON inverted index, whichever the
+          backend (other than SQLite)
+        - If the inverted index was built with positions, quoted phrases
+          must appear as is, and courses where consecutive query words
+          are close together are boosted (refer to phrases.py).
+          Otherwise, quotes are ignored
+        - Queries with AND/OR/NOT or dept:/title:/prereq: only return
+          the courses they match, ranked as above (refer to
+          boolean_query.py)
+        - Results are cached by the lemmatized tokens of the query,
+          refer to query_cache_info
+
+    Exceptions:
+    ValueError if ranking is not one of RANKINGS
+    BooleanQueryError if a boolean query is malformed
     """
+    if ranking not in RANKINGS:
+        raise ValueError(f"Unknown ranking: {ranking}")
+
+    # Boolean queries are evaluated over posting lists of course IDs
+    if is_boolean(query):
+        inverted_index = get_inverted_index()
+        tree = parse(query, lemmatize, lambda token: token in inverted_index)
+        key = (registry.BACKEND, ranking, tree, limit)
+        version = registry.version()
+        results = _QUERY_CACHE.get(key, version)
+        if results is None:
+            results = tuple(_rank_boolean(tree, limit, ranking))
+            _QUERY_CACHE.put(key, version, results)
+
+        return list(results)
+
     # Tokenize/lemmatize
+    # - Lemmas are looked up in the lemma table, NLTK is only loaded
+    #   for tokens which are not in the catalogue
+    tokens = tuple(lemmatize(token) for token in tokenize(query))
+    phrases = _parse_phrases(query)
+
+    key = (registry.BACKEND, ranking, tokens, phrases, limit)
+    version = registry.version()
+    results = _QUERY_CACHE.get(key, version)
+    if results is None:
+        results = tuple(_rank(tokens, limit, ranking, phrases))
+        _QUERY_CACHE.put(key, version, results)
+
+    return list(results)
+
+
+def query_cache_info() -> dict:
+    """
+    Returns the hits, misses, hit rate and size of the search results
+    cache, refer to QueryCache.info.
+    """
+    return _QUERY_CACHE.info()
+
+
+def _rank_boolean(tree: tuple, limit: int, ranking: str) -> list:
+    """
+    Returns the courses matching a boolean query, ranked by the weights
+    of its words (ties by course ID), refer to query_catalogue.
+        - Read from the JSON inverted index, whichever the backend
+    """
+    id_postings = get_id_postings()
+    ids = evaluate(tree, id_postings)
+
+    scorer = get_bm25f() if ranking == "bm25f" else None
+    weights = [id_postings.weights(token, scorer) for token in positive_tokens(tree)]
+    id_to_score = {course_id: sum(token_weights.get(course_id, 0) for token_weights in weights) for course_id in ids}
+
+    table = get_course_table()
+    return [table.code(course_id) for course_id in _top(id_to_score, lambda x:(-id_to_score[x], x), limit)]
+
+
+def _parse_phrases(query: str) -> tuple:
+    """
+    Returns the quoted phrases of a query (of more than one word), each
+    as a tuple of (lemmatized token, position within the phrase).
+    """
+    phrases = []
+    for text in _PHRASE_PATTERN.findall(query):
+        phrase = tuple((lemmatize(token), i) for i, token in enumerate(tokenize(text)) if is_word(token))
+        if len(phrase) > 1:
+            phrases.append(phrase)
+    return tuple(phrases)
+
+
+def _rank(tokens: tuple, limit: int, ranking: str, phrases: tuple) -> list:
+    """
+    Returns the courses matching the lemmatized tokens, refer to
+    query_catalogue.
+    """
+    # SQLite backend ranks by bm25 within the store
+    if registry.BACKEND == "sqlite":
+        return get_store().search(tokens, limit, [[token for token, _ in phrase] for phrase in phrases])
+
+    # Positions are only needed (and loaded) for phrases or more than
+    # one word
+    positions = None
+    if phrases or len(set(tokens)) > 1:
+        positions = get_positions()
+        if not len(positions):
+            positions = None
+
+    # Binary backend scores by course ID, ties in index order
+    if registry.BACKEND == "binary" and ranking == "tfidf" and positions is None:
+        postings = get_postings()
+        lists = [found for found in map(postings.postings, tokens) if found is not None]
+
+        if limit is None:
+            sorted_ids, _ = _top_exhaustive(lists, limit)
+        else:
+            sorted_ids, _ = _top_by_max_score(lists, limit)
+        return [postings.course(course_id) for course_id in sorted_ids]
+
+    course_to_score, scored_tokens = _score(tokens, ranking)
+
+    # Keep only courses containing every phrase, then boost courses by
+    # the proximity of consecutive query words
+    if positions is not None:
+        for phrase in phrases:
+            matches = positions.match_phrase(phrase)
+            course_to_score = {course: score for course, score in course_to_score.items() if course in matches}
+        positions.boost(course_to_score, list(zip(scored_tokens, scored_tokens[1:])))
+
+    # Sort by TF-IDF (or BM25F)
+    # - Ties are in the order courses were first matched
+    sorted_results = _top(course_to_score, lambda x:-course_to_score[x], limit)
+    
+    return sorted_results
+
+
+def _score(tokens: tuple, ranking: str) -> tuple:
+    """
+    Returns (course_to_score, scored_tokens): the score of every course
+    matching the tokens, and the tokens which matched any course.
+    """
     course_to_score = {}
-    tokens = [INDEX_OBJ._lemmatize_with_pos(token) for token in wordpunct_tokenize(query)]
+    scored_tokens = []
+
+    # BM25F weights are computed once per token, then summed
+    if ranking == "bm25f":
+        scorer = get_bm25f()
+        for token in tokens:
+            weights = scorer.weights(token)
+            if weights:
+                scored_tokens.append(token)
+            for course, weight in weights:
+                course_to_score[course] = course_to_score.get(course, 0) + weight
+        return (course_to_score, scored_tokens)
+
+    # Binary backend, in order of course ID
+    if registry.BACKEND == "binary":
+        postings = get_postings()
+        lists = []
+        for token in tokens:
+            found = postings.get(token)
+            if found is not None:
+                scored_tokens.append(token)
+                lists.append((found[0], found[2], None))
+
+        id_to_score = {}
+        for ids, weights, _ in lists:
+            for course_id, weight in zip(ids, weights):
+                id_to_score[course_id] = id_to_score.get(course_id, 0) + weight
+        for course_id in sorted(id_to_score):
+            course_to_score[postings.course(course_id)] = id_to_score[course_id]
+        return (course_to_score, scored_tokens)
+
+    inverted_index = get_inverted_index()
     for token in tokens:
-        if token in DATA_INVERTED_INDEX:
-            for page in DATA_INVERTED_INDEX[token]:
+        if token in inverted_index:
+            scored_tokens.append(token)
+            for page in inverted_index[token]:
                 course_to_score[page[0]] = course_to_score.get(page[0], 0) + page[2]
+    return (course_to_score, scored_tokens)
 
-    # Sort by TF-IDF
-    sorted_results = sorted(course_to_score.keys(), key = lambda x:-course_to_score[x])
-    
-    return sorted_results
+
+def _top_exhaustive(lists: list, limit: int) -> tuple:
+    """
+    Scores every posting of the given posting lists, refer to
+    _top_by_max_score.
+    """
+    course_to_score = {}
+    for posting_list in lists:
+        for ids, weights in posting_list.blocks():
+            for course_id, weight in zip(ids, weights):
+                course_to_score[course_id] = course_to_score.get(course_id, 0) + weight
+
+    touched = sum(posting_list.decoded() for posting_list in lists)
+    return (_top(course_to_score, lambda x:(-course_to_score[x], x), limit), touched)
+
+
+def _top_by_max_score(lists: list, limit: int) -> tuple:
+    """
+    Returns the top `limit` course IDs by total weight (ties by ID) over
+    the given posting lists, skipping postings of courses which cannot
+    make the top (MaxScore).
+        - lists are PostingLists (refer to postings.py) in query order
+        - Lists are scored from the highest max weight down. Once the
+          `limit`th best score so far is above the sum of the max weights
+          of the lists left, no course outside the scored ones can make
+          the top: the lists left are not decoded in full, instead each
+          remaining candidate is looked up in them, decoding only the
+          block which may hold it
+        - A candidate is dropped before decoding a block if its score
+          so far, plus the block's max weight and the max weights of the
+          lists after it, cannot make the top
+        - Final scores are summed in query order, exactly as when scoring
+          every posting, so the results are the same
+        - Returns (ids, number of postings decoded)
+    """
+    if limit == 0:
+        return ([], 0)
+
+    order = sorted(range(len(lists)), key=lambda i: -lists[i].max_weight)
+    bounds = [0]*(len(order)+1)
+    for j in range(len(order)-1, -1, -1):
+        bounds[j] = bounds[j+1]+lists[order[j]].max_weight
+
+    # Essential lists, scored in full
+    course_to_score = {}
+    j = 0
+    while j < len(order) and bounds[j]+_PRUNING_SLACK > _threshold(course_to_score, limit):
+        for ids, weights in lists[order[j]].blocks():
+            for course_id, weight in zip(ids, weights):
+                course_to_score[course_id] = course_to_score.get(course_id, 0) + weight
+        j += 1
+
+    # Non-essential lists, only looked up for the remaining candidates
+    candidates = course_to_score
+    for j in range(j, len(order)+1):
+        threshold = _threshold(course_to_score, limit)
+        candidates = {course_id: score for course_id, score in candidates.items()
+                      if score+bounds[j]+_PRUNING_SLACK > threshold}
+        if j == len(order):
+            break
+
+        posting_list = lists[order[j]]
+        course_ids = sorted(course_id for course_id, score in candidates.items()
+                            if score+posting_list.block_max(course_id)+bounds[j+1]+_PRUNING_SLACK > threshold)
+        candidates = {course_id: candidates[course_id] for course_id in course_ids}
+        for course_id, weight in zip(course_ids, posting_list.weights_of(course_ids)):
+            if weight is not None:
+                candidates[course_id] += weight
+                course_to_score[course_id] += weight
+
+    # Exact scores of the candidates left
+    course_ids = sorted(candidates)
+    exact_scores = dict.fromkeys(course_ids, 0)
+    for posting_list in lists:
+        for course_id, weight in zip(course_ids, posting_list.weights_of(course_ids)):
+            if weight is not None:
+                exact_scores[course_id] += weight
+
+    touched = sum(posting_list.decoded() for posting_list in lists)
+    return (_top(exact_scores, lambda x:(-exact_scores[x], x), limit), touched)
+
+
+def _threshold(course_to_score: dict, limit: int) -> float:
+    """
+    Returns the `limit`th best score so far, which the final `limit`th
+    best score can only be above (weights are never negative).
+    """
+    if len(course_to_score) < limit:
+        return float("-inf")
+    return heapq.nlargest(limit, course_to_score.values())[-1]
+
+
+def _top(results: dict, key, limit: int) -> list:
+    """
+    Returns the keys of results sorted by key, only the first `limit` if
+    given. Both are stable, so ties are in the order of results.
+    """
+    if limit is None or limit >= len(results):
+        return sorted(results, key=key)
+    return heapq.nsmallest(limit, results, key=key)
 
 
 if __name__ == "__main__":    
@@ -38,11 +325,17 @@ if __name__ == "__main__":
             break
 
         # Query the index
-        sorted_results = query_catalogue(query)
+        try:
+            sorted_results = query_catalogue(query, RESULT_LIMIT)
+        except BooleanQueryError as e:
+            print("ERROR:", e)
+            print('-'*50)
+            continue
 
         # Print results
+        index = get_index()
         for course in sorted_results:
-            print(course, '-', DATA_INDEX[course][1])
-            print(DATA_INDEX[course][2])
+            print(course, '-', index[course][1])
+            print(index[course][2])
             print('-'*50)
 
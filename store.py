@@ -0,0 +1,225 @@
+# store.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# SQLite backend for the indexes, as an alternative to loading the
+# JSON files into memory.
+#
+#   The course index, the lemma table, the vocabulary of the inverted
+#   index and a full-text (FTS5) index of every course are written into
+#   a single file (catalogue.db). Every
+#   process then reads from the same file through the OS page cache,
+#   and starts without loading anything.
+#
+#   Courses are read as a mapping, just like the index:
+#   {
+#       class: [department, title, description, prerequisites], ...
+#   }
+
+from index import Index, tokenize
+
+import os
+import sqlite3
+import argparse
+import threading
+from collections.abc import Mapping
+
+STORE_PATH = "catalogue.db"
+
+# Weights of the title and description columns when ranking by bm25
+# - Note: Title tokens are weighed 3x higher, as in the inverted index
+TITLE_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+_SCHEMA = """
+CREATE TABLE courses (
+    id INTEGER PRIMARY KEY,
+    course TEXT NOT NULL UNIQUE,
+    dept TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    prereq TEXT NOT NULL
+);
+CREATE TABLE lemmas (
+    token TEXT PRIMARY KEY,
+    lemma TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE terms (
+    term TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE courses_fts USING fts5(
+    title, description, content='', tokenize='unicode61 remove_diacritics 0'
+);
+"""
+
+
+class _Database:
+    def __init__(self, path: str):
+        """
+        Read-only connections to a store, one per thread.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        self._path = path
+        self._local = threading.local()
+
+
+    def execute(self, sql: str, parameters: tuple = ()) -> 'sqlite3.Cursor':
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self._path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection.execute(sql, parameters)
+
+
+class CourseStore(Mapping):
+    def __init__(self, path: str = STORE_PATH):
+        """
+        Courses of a store, read as the index (refer to get_index).
+
+        Exceptions:
+        FileNotFoundError if the store has not been built
+        """
+        self._db = _Database(path)
+        self.lemmas = LemmaStore(self._db)
+
+
+    def __getitem__(self, course: str) -> list:
+        row = self._db.execute("SELECT dept, title, description, prereq FROM courses WHERE course = ?", (course,)).fetchone()
+        if row is None:
+            raise KeyError(course)
+        return list(row)
+
+
+    def __contains__(self, course) -> bool:
+        return self._db.execute("SELECT 1 FROM courses WHERE course = ?", (course,)).fetchone() is not None
+
+
+    def __iter__(self):
+        return (row[0] for row in self._db.execute("SELECT course FROM courses ORDER BY id"))
+
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+
+
+    def search(self, tokens: list, limit: int = None, phrases: list = ()) -> list:
+        """
+        Returns every course matching any of the lemmatized tokens,
+        ranked by bm25 (ties in index order).
+            - If given a limit, only the top `limit` courses are returned
+            - If given phrases (lists of lemmatized tokens), only courses
+              containing every phrase are returned. Stopwords are not
+              indexed, so they are left out of each phrase
+        """
+        terms = [_quote(token) for token in dict.fromkeys(tokens) if any(x.isalnum() for x in token)]
+        if not terms:
+            return []
+
+        match = " OR ".join(terms)
+        indexed = self._indexed([token for phrase in phrases for token in phrase])
+        for phrase in phrases:
+            phrase = [token for token in phrase if token in indexed]
+            if phrase:
+                match = f"({match}) AND "+_quote(" ".join(phrase))
+
+        rows = self._db.execute(
+            "SELECT c.course FROM ("
+            "    SELECT rowid, bm25(courses_fts, ?, ?) AS score FROM courses_fts WHERE courses_fts MATCH ?"
+            ") AS s JOIN courses AS c ON c.id = s.rowid ORDER BY s.score, c.id LIMIT ?",
+            (TITLE_WEIGHT, DESCRIPTION_WEIGHT, match, -1 if limit is None else limit))
+        return [row[0] for row in rows]
+
+
+    def _indexed(self, tokens: list) -> set:
+        """
+        Returns the tokens which are in the full-text index, with one
+        query.
+            - Stores built without the terms table are looked up in the
+              vocabulary of the full-text index instead
+        """
+        tokens = list(dict.fromkeys(tokens))
+        if not tokens:
+            return set()
+
+        placeholders = ", ".join("?"*len(tokens))
+        try:
+            rows = self._db.execute(f"SELECT term FROM terms WHERE term IN ({placeholders})", tuple(tokens))
+        except sqlite3.OperationalError:
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.courses_vocab USING fts5vocab(main, courses_fts, row)")
+            rows = self._db.execute(f"SELECT term FROM courses_vocab WHERE term IN ({placeholders})", tuple(tokens))
+        return {row[0] for row in rows}
+
+
+class LemmaStore(Mapping):
+    def __init__(self, db: '_Database'):
+        """
+        Lemma table of a store, read as the lemma table (refer to
+        Index.get_lemmas).
+        """
+        self._db = db
+
+
+    def __getitem__(self, token: str) -> str:
+        row = self._db.execute("SELECT lemma FROM lemmas WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            raise KeyError(token)
+        return row[0]
+
+
+    def __iter__(self):
+        return (row[0] for row in self._db.execute("SELECT token FROM lemmas"))
+
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM lemmas").fetchone()[0]
+
+
+def _quote(text: str) -> str:
+    """
+    Returns text as an FTS5 string, i.e. a phrase of its tokens.
+    """
+    return '"'+text.replace('"', '""')+'"'
+
+
+def build_store(index: dict, inverted_index: dict, lemmas: dict, path: str = STORE_PATH) -> None:
+    """
+    Writes the index, lemma table and a full-text index of every course
+    into a SQLite file at path.
+        - Titles and descriptions are indexed by their lemmas, leaving
+          out tokens which are not in the inverted index (stopwords)
+        - The file is replaced atomically, so running processes keep
+          reading the old one until they reopen it
+    """
+    vocabulary = set(inverted_index)
+
+    def lemmatized(text: str) -> str:
+        return " ".join(lemma for lemma in (lemmas.get(token, token.lower()) for token in tokenize(text))
+                        if lemma in vocabulary)
+
+    print("Writing store into file...")
+    if os.path.exists(path+".tmp"):
+        os.remove(path+".tmp")
+
+    connection = sqlite3.connect(path+".tmp")
+    with connection:
+        connection.executescript(_SCHEMA)
+        connection.executemany("INSERT INTO courses VALUES (?, ?, ?, ?, ?, ?)",
+                               ((i, course, *info) for i, (course, info) in enumerate(index.items(), 1)))
+        connection.executemany("INSERT INTO lemmas VALUES (?, ?)", lemmas.items())
+        connection.executemany("INSERT INTO terms VALUES (?)", ((term,) for term in vocabulary))
+        connection.executemany("INSERT INTO courses_fts (rowid, title, description) VALUES (?, ?, ?)",
+                               ((i, lemmatized(info[1]), lemmatized(info[2])) for i, info in enumerate(index.values(), 1)))
+        connection.execute("INSERT INTO courses_fts (courses_fts) VALUES ('optimize')")
+    connection.close()
+
+    os.replace(path+".tmp", path)
+    print("Store completed!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes the JSON indexes into a SQLite store.")
+    parser.add_argument("--path", default=STORE_PATH, help="file to write the store into")
+    args = parser.parse_args()
+
+    index_obj = Index()
+    build_store(index_obj.get_index(), index_obj.get_inverted_index(), index_obj.get_lemmas(), args.path)
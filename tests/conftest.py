@@ -0,0 +1,67 @@
+# conftest.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Shared fixtures of the tests.
+#
+#   Indexes are built from a small fake catalogue, saved as a snapshot
+#   and replayed (refer to crawler.py), with NLTK replaced by a plain
+#   lowercasing lemmatizer so that no NLTK data has to be downloaded.
+
+import os
+import sys
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import index
+from crawler import Snapshot
+
+STOPWORDS = frozenset(["a", "an", "and", "the", "of", "to", "in", "for", "is", "on", "with"])
+
+_DEPT_LIST = """<html><body><div id="textcontainer">
+<h2 class="letternav-head" id='A'><a name='A'>A</a></h2>
+{links}
+</div><!--end #textcontainer --></body></html>"""
+
+_DEPT_PAGE = """<html><body>
+<div id="courseinventorycontainer" class="page_content tab_content">
+{blocks}
+</div>
+<footer></footer></body></html>"""
+
+
+def dept_url(dept: str) -> str:
+    return index.COURSES_URL+dept.lower().replace(" ", "_").replace("&", "")+"/"
+
+
+def save_catalogue(directory: str, catalogue: dict) -> None:
+    """
+    Saves a fake catalogue as a snapshot, which a ReplayCrawler builds
+    the indexes from.
+        catalogue takes the form of:
+        {
+            dept: [(number, title, description, prerequisites), ...], ...
+        }
+    """
+    snapshot = Snapshot(directory)
+    links = "\n".join(f'<p><a href="{dept_url(dept)}">{dept}</a></p>' for dept in catalogue)
+    snapshot.save(index.COURSES_URL, _DEPT_LIST.format(links=links))
+
+    for dept, courses in catalogue.items():
+        blocks = []
+        for number, title, description, prereq in courses:
+            block = f"<p>{dept}\xa0{number}.  {title}.  (4 Units)\n{description}\n"
+            if prereq:
+                block += f"Prerequisite: {prereq}\n"
+            blocks.append('<div class="courseblock">'+block+"</p></div>")
+        snapshot.save(dept_url(dept), _DEPT_PAGE.format(blocks="\n".join(blocks)))
+
+
+@pytest.fixture
+def no_nltk(monkeypatch):
+    """
+    Replaces NLTK's lemmatizer and stopwords within index.py.
+    """
+    monkeypatch.setattr(index, "_lemmatize_with_pos", lru_cache(maxsize=None)(str.lower))
+    monkeypatch.setattr(index, "_stopwords", lambda: STOPWORDS)
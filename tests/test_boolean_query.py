@@ -0,0 +1,116 @@
+# test_boolean_query.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Parsing and evaluation of boolean queries over a small fake index
+# (refer to boolean_query.py).
+
+import pytest
+
+from boolean_query import BooleanQueryError, IdPostings, evaluate, is_boolean, parse, positive_tokens
+from boolean_query import _difference_all, _intersect, _intersect_all, _union
+from courses import CourseTable
+from prereqs import PrereqTable, build_prereqs
+from prereq_graph import PrereqGraph
+from conftest import STOPWORDS
+
+INDEX = {
+    "COMPSCI 1": ["COMPSCI", "Intro to Trees", "Binary tree basics.", ""],
+    "COMPSCI 2": ["COMPSCI", "Graph Search", "Search over a tree or graph.", "COMPSCI 1."],
+    "COMPSCI 3": ["COMPSCI", "Heaps", "Priority queues.", "COMPSCI 1 or MATH 1. Recommended: COMPSCI 2."],
+    "MATH 1": ["MATH", "Calculus", "Limits and a tree diagram.", ""],
+    "MATH 2": ["MATH", "Graph Theory", "Graph coloring.", "MATH 1 and COMPSCI 2."],
+}
+
+# [course, frequency, tf-idf, title frequency, description frequency]
+INVERTED_INDEX = {
+    "tree": [["COMPSCI 1", 2, 0.5, 1, 1], ["COMPSCI 2", 1, 0.2, 0, 1], ["MATH 1", 1, 0.3, 0, 1]],
+    "graph": [["COMPSCI 2", 2, 0.6, 1, 1], ["MATH 2", 3, 0.9, 1, 2]],
+    "search": [["COMPSCI 2", 2, 0.4, 1, 1], ["COMPSCI 1", 0, 0.1, 0, 0]],
+    "heap": [["COMPSCI 3", 1, 0.7, 1, 0]],
+}
+
+
+def _parse(query: str) -> tuple:
+    return parse(query, str.lower, lambda token: token in INVERTED_INDEX and token not in STOPWORDS)
+
+
+def _postings() -> IdPostings:
+    table = CourseTable(INDEX)
+    graph = PrereqGraph(PrereqTable(build_prereqs(INDEX)))
+    return IdPostings(table, INVERTED_INDEX, lambda: [], lambda: graph)
+
+
+def _search(query: str) -> list:
+    postings = _postings()
+    table = CourseTable(INDEX)
+    return [table.code(course_id) for course_id in evaluate(_parse(query), postings)]
+
+
+def test_is_boolean():
+    assert is_boolean("tree AND graph")
+    assert is_boolean("dept:MATH")
+    assert not is_boolean("tree and graph")
+    assert not is_boolean("time: 10am")
+
+
+def test_precedence_and_parentheses():
+    assert _parse("tree OR graph search") == ("or", ("term", "tree"), ("and", ("term", "graph"), ("term", "search")))
+    assert _parse("(tree OR graph) search") == ("and", ("or", ("term", "tree"), ("term", "graph")), ("term", "search"))
+    assert _parse("tree AND NOT NOT graph") == ("and", ("term", "tree"), ("not", ("not", ("term", "graph"))))
+    assert _parse('dept:compsci prereq:"compsci  1"') == ("and", ("dept", "COMPSCI"), ("prereq", "COMPSCI 1"))
+
+
+def test_words_which_are_not_indexed_are_left_out():
+    assert _parse("the tree AND of graph") == ("and", ("term", "tree"), ("term", "graph"))
+    assert _parse("(the OR of) AND tree") == ("term", "tree")
+    assert _parse('"search the tree"') == ("phrase", (("search", 0), ("tree", 2)))
+    assert _parse('"the tree" OR title:"the graph"') == ("or", ("term", "tree"), ("title", "graph"))
+
+
+@pytest.mark.parametrize("query", [
+    "(tree AND graph",
+    "tree) OR graph",
+    "tree AND",
+    "OR tree",
+    "NOT",
+    "time:10am AND tree",
+    'title:"" AND tree',
+    "the AND of",
+])
+def test_malformed_queries(query):
+    with pytest.raises(BooleanQueryError):
+        _parse(query)
+
+
+def test_positive_tokens():
+    assert positive_tokens(_parse('tree NOT graph OR "search tree" title:heap')) == ["tree", "search", "tree", "heap"]
+
+
+def test_merges():
+    assert _intersect([1, 3, 5, 7], [0, 3, 4, 7, 9]) == [3, 7]
+    assert _intersect([], [1, 2]) == []
+    assert _intersect_all([[1, 2, 3, 4], [2, 4], [4, 5]]) == [4]
+    assert _intersect_all([[1], [2], [1, 2]]) == []
+    assert _union([1, 4, 6], [2, 4, 7, 8]) == [1, 2, 4, 6, 7, 8]
+    assert _union([], [3]) == [3]
+    assert _difference_all([1, 2, 3, 4, 5], [[2, 9], [], [5]]) == [1, 3, 4]
+    assert _difference_all([1, 2], [[1, 2], [3]]) == []
+
+
+def test_evaluate():
+    assert _search("tree AND graph") == ["COMPSCI 2"]
+    assert _search("tree OR heap") == ["COMPSCI 1", "COMPSCI 2", "COMPSCI 3", "MATH 1"]
+    assert _search("tree NOT search") == ["MATH 1"]
+    assert _search("NOT tree") == ["COMPSCI 3", "MATH 2"]
+    assert _search("(tree OR graph) AND dept:math") == ["MATH 1", "MATH 2"]
+    assert _search("title:graph OR title:tree") == ["COMPSCI 1", "COMPSCI 2", "MATH 2"]
+    assert _search("NOT dept:COMPSCI NOT dept:MATH") == []
+
+
+def test_prereq_only_counts_required_courses():
+    assert _search('prereq:"COMPSCI 1"') == ["COMPSCI 2", "COMPSCI 3"]
+    assert _search('prereq:"COMPSCI 2"') == ["MATH 2"]
+    assert _search('prereq:"NOPE 1"') == []
+
+
+def test_phrase_without_positions_intersects_words():
+    assert _search('"tree graph"') == ["COMPSCI 2"]
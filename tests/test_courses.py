@@ -0,0 +1,25 @@
+# test_courses.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# The course table must read back as the index it was built from
+# (refer to courses.py).
+
+from courses import CourseTable
+
+INDEX = {
+    "COMPSCI 1": ["COMPSCI", "Intro to Trees", "Binary tree basics.", ""],
+    "MATH 1": ["MATH", "Calculus", "Limits.", ""],
+    "COMPSCI 2": ["COMPSCI", "Graph Search", "Search over a graph.", "COMPSCI 1."],
+}
+
+
+def test_table_reads_as_the_index():
+    # Departments read from index.txt are separate strings
+    table = CourseTable({course: [row[0][:1]+row[0][1:], *row[1:]] for course, row in INDEX.items()})
+
+    assert dict(table) == INDEX and list(table) == list(INDEX)
+    assert table["COMPSCI 2"] is table["COMPSCI 2"]
+    assert table["COMPSCI 1"][0] is table["COMPSCI 2"][0]
+
+    course_id = table.id_of("COMPSCI 2")
+    assert table.code(course_id) == "COMPSCI 2"
+    assert [table.dept(course_id), table.title(course_id), table.description(course_id), table.prereq(course_id)] == INDEX["COMPSCI 2"]
@@ -0,0 +1,74 @@
+# test_crawler.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Cached pages and saved snapshots (refer to crawler.py).
+
+import ujson
+
+from crawler import Crawler, PageCache, Snapshot
+
+URL = "https://catalogue.uci.edu/allcourses/compsci/"
+
+
+class _Response:
+    def __init__(self, body: str):
+        self.status_code = 200
+        self.text = body
+        self.headers = {"ETag": '"1"'}
+
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class _Session:
+    def __init__(self, body: str):
+        self.body = body
+        self.requests = 0
+
+
+    def get(self, url: str, headers: dict, timeout: float) -> '_Response':
+        self.requests += 1
+        return _Response(self.body)
+
+
+def _crawler(cache: 'PageCache', body: str = "<p>Trees</p>") -> 'Crawler':
+    crawler = Crawler(cache=cache)
+    crawler._session = _Session(body)
+    return crawler
+
+
+def test_cached_results_of_another_parser_are_parsed_again(tmp_path):
+    parses = []
+
+    def parse(body: str) -> str:
+        parses.append(body)
+        return body.upper()
+
+    _crawler(PageCache(str(tmp_path), parser_version=1)).get(URL, parse)
+    assert _crawler(PageCache(str(tmp_path), parser_version=1)).get(URL, parse) == "<P>TREES</P>"
+    assert len(parses) == 1
+
+    crawler = _crawler(PageCache(str(tmp_path), parser_version=2))
+    assert crawler.get(URL, parse) == "<P>TREES</P>"
+    assert len(parses) == 2 and crawler.stats["unchanged"] == 1
+    assert PageCache(str(tmp_path), parser_version=2).load(URL)["parsed"] == "<P>TREES</P>"
+
+
+def test_entries_of_another_format_are_not_cached(tmp_path):
+    cache = PageCache(str(tmp_path))
+    _crawler(cache).get(URL)
+    with open(cache._path(URL), 'w') as f:
+        ujson.dump({"url": URL, "etag": '"1"', "last_modified": None, "sha256": "", "body": "old", "parsed": None}, f)
+
+    assert cache.load(URL) is None
+    assert _crawler(cache).get(URL) == "<p>Trees</p>"
+
+
+def test_snapshot_keeps_pages_whose_names_would_collide(tmp_path):
+    snapshot = Snapshot(str(tmp_path))
+    urls = ["https://catalogue.uci.edu/allcourses/i&c_sci/", "https://catalogue.uci.edu/allcourses/i_c_sci/"]
+    for url in urls:
+        snapshot.save(url, url[-10:])
+
+    snapshot = Snapshot(str(tmp_path))
+    assert [snapshot.load(url) for url in urls] == [url[-10:] for url in urls]
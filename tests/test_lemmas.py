@@ -0,0 +1,64 @@
+# test_lemmas.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Index terms must be lemmatized as queries and the lemma table are,
+# whether or not tokens are tagged in batches (refer to
+# Index._analyze_courses).
+
+from functools import lru_cache
+
+import nltk
+import pytest
+
+import index
+from index import Index, Course
+from conftest import STOPWORDS
+
+COURSES = [
+    Course("COMPSCI 1", "Learning by Programming", "COMPSCI", "Programming and learning, learning by doing."),
+    Course("COMPSCI 2", "Machine Learning", "COMPSCI", "Learning from data by programming models."),
+]
+
+
+def _tag(tokens: list) -> list:
+    """
+    A tagger which depends on context: words after "by" are verbs.
+    """
+    return [(token, "VBG" if i and tokens[i-1] == "by" else "NN") for i, token in enumerate(tokens)]
+
+
+@pytest.fixture
+def fake_tagger(monkeypatch):
+    monkeypatch.setattr(nltk, "pos_tag", _tag)
+    monkeypatch.setattr(index, "_pos_tag_sents", lambda sentences: [_tag(sentence) for sentence in sentences])
+    monkeypatch.setattr(index, "_lemmatize_tagged", lambda token, tag: token.lower()+"/"+tag[0])
+    monkeypatch.setattr(index, "_lemmatize_with_pos", lru_cache(maxsize=None)(index._lemmatize_with_pos.__wrapped__))
+    monkeypatch.setattr(index, "_stopwords", lambda: STOPWORDS)
+
+
+def test_batch_tagging_gives_the_same_terms(fake_tagger):
+    per_token = Index()
+    batched = Index(batch_tagging=True)
+
+    assert list(batched._analyze_courses(COURSES)) == list(per_token._analyze_courses(COURSES))
+
+    per_token._add_lemmas(COURSES)
+    batched._add_lemmas(COURSES)
+    assert batched._lemmas == per_token._lemmas
+    assert batched._lemmas["learning"] == per_token.lemmatize("learning") == "learning/N"
+
+
+def test_terms_are_in_the_lemma_table(fake_tagger):
+    batched = Index(batch_tagging=True)
+    terms = {token for tokens in batched._analyze_courses(COURSES) for token in tokens}
+    assert terms <= set(batched._lemmas.values())
+
+
+def test_missing_lemma_table_is_only_read_once(fake_tagger, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index_obj = Index()
+    assert index_obj.get_lemmas() == {}
+    assert index_obj.lemmatize("learning") == "learning/N"
+
+    (tmp_path/"lemmas.txt").write_text('{"learning": "learn"}')
+    assert index_obj.get_lemmas() == {}
+    assert Index().get_lemmas() == {"learning": "learn"}
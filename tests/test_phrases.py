@@ -0,0 +1,61 @@
+# test_phrases.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Positions must read back from positions.bin as written, and phrases
+# must match the same courses over it (refer to phrases.py).
+
+import pytest
+
+import phrases
+
+from phrases import BinaryPositions, PositionalIndex, PositionsFormatError, write_positions
+
+INDEX = {"COMPSCI 1": [], "COMPSCI 2": [], "MATH 1": []}
+
+POSITIONS = {
+    "machine": [["COMPSCI 2", [0], [4, 9]], ["COMPSCI 1", [], [200]]],
+    "learn": [["COMPSCI 2", [1], [5, 300]], ["MATH 1", [2], []], ["COMPSCI 1", [], [202]]],
+    "data": [["STATS 1", [7], [0, 1, 2]]],
+}
+
+
+def test_positions_read_back(tmp_path):
+    write_positions(INDEX, POSITIONS, str(tmp_path/"positions.bin"))
+    positions = BinaryPositions(str(tmp_path/"positions.bin"))
+
+    assert len(positions) == len(POSITIONS)
+    assert "data" in positions and "nope" not in positions
+    assert positions.get("nope") is None and positions.get("nope", []) == []
+    for token, pages in POSITIONS.items():
+        assert sorted(positions.get(token)) == sorted(pages)
+    assert dict(positions.items()).keys() == POSITIONS.keys()
+
+
+def test_phrases_match_over_binary_positions(tmp_path):
+    write_positions(INDEX, POSITIONS, str(tmp_path/"positions.bin"))
+    binary = PositionalIndex(BinaryPositions(str(tmp_path/"positions.bin")))
+    loaded = PositionalIndex(POSITIONS)
+
+    for phrase in ((("machine", 0), ("learn", 1)), (("machine", 0), ("learn", 2)), (("learn", 0), ("machine", 1))):
+        assert binary.match_phrase(phrase) == loaded.match_phrase(phrase)
+    assert binary.match_phrase((("machine", 0), ("learn", 1))) == {"COMPSCI 2"}
+    assert binary.match_phrase((("machine", 0), ("learn", 2))) == {"COMPSCI 1"}
+
+    scores = {"COMPSCI 1": 1.0, "COMPSCI 2": 1.0}
+    binary.boost(scores, [("machine", "learn")])
+    assert scores["COMPSCI 2"] > scores["COMPSCI 1"] > 1.0
+
+
+def test_not_a_positions_file(tmp_path):
+    (tmp_path/"positions.bin").write_bytes(b"ACPI"+bytes(60))
+    with pytest.raises(PositionsFormatError):
+        BinaryPositions(str(tmp_path/"positions.bin"))
+
+
+def test_decoded_positions_are_bounded(monkeypatch):
+    monkeypatch.setattr(phrases, "TOKEN_CACHE_SIZE", 2)
+    index = PositionalIndex(POSITIONS)
+
+    for token in ("machine", "learn", "data", "nope", "machine"):
+        assert index.courses(token) == {page[0]: (page[1], page[2]) for page in POSITIONS.get(token, [])}
+    assert index._courses.info()["size"] == 2
+    assert index._courses.get("learn", 0) is None
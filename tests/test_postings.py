@@ -0,0 +1,73 @@
+# test_postings.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# The binary inverted index must read back as written, block by block,
+# and MaxScore must rank as scoring every posting does (refer to
+# postings.py and search._top_by_max_score).
+
+import random
+
+from postings import BLOCK_SIZE, BinaryPostings, write_postings
+import search
+
+NUM_COURSES = 5*BLOCK_SIZE
+
+
+def _inverted_index(seed: int) -> tuple:
+    """
+    Returns an index and an inverted index with lists of a few postings
+    up to every course, spanning many blocks.
+    """
+    rng = random.Random(seed)
+    index = {f"COURSE {i}": ["DEPT", "", "", ""] for i in range(NUM_COURSES)}
+    inverted_index = {}
+    for token, size in (("rare", 3), ("block", BLOCK_SIZE), ("some", BLOCK_SIZE+1), ("many", 3*BLOCK_SIZE), ("every", NUM_COURSES)):
+        courses = rng.sample(sorted(index), size)
+        inverted_index[token] = [[course, rng.randint(1, 5), rng.random()] for course in courses]
+    return index, inverted_index
+
+
+def test_postings_read_back(tmp_path):
+    index, inverted_index = _inverted_index(0)
+    write_postings(index, inverted_index, tmp_path/"inverted_index.bin")
+    postings = BinaryPostings(tmp_path/"inverted_index.bin")
+
+    assert "nope" not in postings and postings.postings("nope") is None
+    for token, pages in inverted_index.items():
+        expected = sorted([course, frequency, weight] for course, frequency, weight in pages)
+        actual = sorted(postings[token])
+        assert [page[:2] for page in actual] == [page[:2] for page in expected]
+        assert all(abs(a[2]-b[2]) < 1e-6 for a, b in zip(actual, expected))
+
+        ids, _, weights = postings.get(token)
+        posting_list = postings.postings(token)
+        assert len(posting_list) == len(ids)
+        assert posting_list.max_weight == max(weights)
+        assert posting_list.weights_of(list(range(NUM_COURSES+1))) == \
+            [weights[ids.index(i)] if i in ids else None for i in range(NUM_COURSES+1)]
+
+
+def test_max_score_equals_exhaustive(tmp_path):
+    index, inverted_index = _inverted_index(1)
+    write_postings(index, inverted_index, tmp_path/"inverted_index.bin")
+    postings = BinaryPostings(tmp_path/"inverted_index.bin")
+
+    for query in (["every"], ["rare", "every"], ["many", "some", "block"], ["every", "many", "every", "rare"]):
+        for limit in (0, 1, 10, NUM_COURSES):
+            exhaustive, touched = search._top_exhaustive([postings.postings(token) for token in query], limit)
+            pruned, pruned_touched = search._top_by_max_score([postings.postings(token) for token in query], limit)
+            assert pruned == exhaustive, (query, limit)
+            assert pruned_touched <= touched
+
+
+def test_rewriting_leaves_open_readers_intact(tmp_path):
+    index, inverted_index = _inverted_index(2)
+    write_postings(index, inverted_index, str(tmp_path/"inverted_index.bin"))
+    postings = BinaryPostings(str(tmp_path/"inverted_index.bin"))
+    expected = {token: postings[token] for token in inverted_index}
+
+    # A smaller index, which truncated the mapped file when written in place
+    write_postings({"COURSE 0": ["DEPT", "", "", ""]}, {"rare": [["COURSE 0", 1, 1.0]]}, str(tmp_path/"inverted_index.bin"))
+
+    assert {token: postings[token] for token in inverted_index} == expected
+    assert len(BinaryPostings(str(tmp_path/"inverted_index.bin"))) == 1
+    assert not (tmp_path/"inverted_index.bin.tmp").exists()
@@ -0,0 +1,151 @@
+# test_prereqs.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Prerequisite strings from the catalogue must parse into the trees
+# they read as, and checking every course at once must agree with
+# evaluating each tree (refer to prereqs.py).
+
+import random
+
+import pytest
+
+import prereqs
+from prereqs import PrereqTable, build_prereqs, parse_prereq, _clauses, _satisfied
+
+ANTHRO_132A = "ANTHRO 2A or PSYCH 7A or (PSYCH 9A and PSYCH 9B and PSYCH 9C) or (PSY BEH 11A and PSY BEH 11B and PSY BEH 11C)"
+COMPSCI_171 = "((STATS 7 and STATS 120A) or STATS 67) ( and (I&C SCI 46 or CSE 46) and MATH 2B)"
+PSYCH_H111A = ("((PSYCH 9A and PSYCH 9B and PSYCH 9C) or (PSY BEH 11A and PSY BEH 11B and PSY BEH 11C)) and "
+               "((PSYCH 10A and 10B and 10C) or (MATH 2A and MATH 2B and (MATH 7 or STATS 7))). ")
+SOCIOL_138 = ("(ANTHRO 10A and ANTHRO 10B and ANTHRO 10C) or (SOCIOL 10A and SOCIOL 10B and SOCIOL 10C) or "
+              "(SOC SCI 10A and SOC SCI 10B and SOC SCI 10C) or (MATH 2A and MATH 2B and (STATS 7 or MGMT 7)) or "
+              "(STATS 120A and STATS 120B and STATS 120C) or (ECON 15A and ECON 15B)")
+
+INDEX = {
+    "MATH 2A": ["MATH", "", "", ""],
+    "MATH 2B": ["MATH", "", "", "MATH 2A or AP Calculus AB. AP Calculus AB with a minimum score of 4"],
+    "STATS 7": ["STATS", "", "", ""],
+    "CHEM 141": ["CHEM", "", "", "(CHEM 51C or CHEM H52C) and (MATH 2B or AP Calculus BC). AP Calculus BC with a minimum score of 4"],
+    "ANTHRO 132A": ["ANTHRO", "", "", ANTHRO_132A],
+    "SOCIOL 138": ["SOCIOL", "", "", SOCIOL_138],
+    "COMPSCI 274D": ["COMPSCI", "", "", "Recommended: COMPSCI 172B and COMPSCI 178."],
+    "ANTHRO H190B": ["ANTHRO", "", "", "r corequisite: ANTHRO 199 and ANTHRO H190A"],
+    "COMPSCI 171": ["COMPSCI", "", "", COMPSCI_171],
+    "DRAMA 130": ["DRAMA", "", "", "DRAMA 30A and DRAMA 30B and DRAMA 30C with an average grade of B or better."],
+    "DANCE 132A": ["DANCE", "", "", "(DANCE 30A and DANCE 30B and DANCE 30C) or audition."],
+    "MATH 3A": ["MATH", "", "", "MATH 1B or AP Calculus AB or SAT Mathematics or ACT Mathematics."],
+    "MUSIC 201": ["MUSIC", "", "", "Placement into MUSIC 201."],
+    "HUMAN 1BES": ["HUMAN", "", "", "C- or below in HUMAN 1AES."],
+}
+
+
+@pytest.mark.parametrize("prereq_str, tree", [
+    ("ANTHRO 2A and (ANTHRO 2B or ANTHRO 2C or ANTHRO 2D)",
+     ["and", "ANTHRO 2A", ["or", "ANTHRO 2B", "ANTHRO 2C", "ANTHRO 2D"]]),
+    ("CHEM H2B and CHEM H2LB or CHEM M2LB", ["and", "CHEM H2B", ["or", "CHEM H2LB", "CHEM M2LB"]]),
+    (ANTHRO_132A, ["or", "ANTHRO 2A", "PSYCH 7A", ["and", "PSYCH 9A", "PSYCH 9B", "PSYCH 9C"],
+                   ["and", "PSY BEH 11A", "PSY BEH 11B", "PSY BEH 11C"]]),
+    ("(CHEM 51C or CHEM H52C) and (MATH 2B or AP Calculus BC). AP Calculus BC with a minimum score of 4",
+     ["and", ["or", "CHEM 51C", "CHEM H52C"], ["or", "MATH 2B", "AP Calculus BC"]]),
+    ("CSE 141 or COMPSCI 141 or IN4MATX 101", ["or", "CSE 141", "COMPSCI 141", "IN4MATX 101"]),
+    ("I&C SCI 33 or EECS 114. I&C SCI 33 with a grade of C or better", ["or", "I&C SCI 33", "EECS 114"]),
+    ("r corequisite: ANTHRO 199 and ANTHRO H190A", ["and", "ANTHRO 199", "ANTHRO H190A"]),
+    ("AP Chemistry or SAT Subject Chemistry. AP Chemistry with a minimum score of 4", ["or", "AP Chemistry", ["unparsed"]]),
+    (PSYCH_H111A, ["and", ["or", ["and", "PSYCH 9A", "PSYCH 9B", "PSYCH 9C"], ["and", "PSY BEH 11A", "PSY BEH 11B", "PSY BEH 11C"]],
+                   ["or", ["and", "PSYCH 10A", "PSYCH 10B", "PSYCH 10C"], ["and", "MATH 2A", "MATH 2B", ["or", "MATH 7", "STATS 7"]]]]),
+    ("DRAMA 30A and DRAMA 30B and DRAMA 30C with an average grade of B or better.",
+     ["and", "DRAMA 30A", "DRAMA 30B", "DRAMA 30C"]),
+    ("(DANCE 30A and DANCE 30B and DANCE 30C) or audition.", ["or", ["and", "DANCE 30A", "DANCE 30B", "DANCE 30C"], ["unparsed"]]),
+    ("JAPANSE 2C or JAPANSE S2BC or placement into JAPANSE 3A.", ["or", "JAPANSE 2C", "JAPANSE S2BC", ["unparsed"]]),
+    ("Placement into CHINESE 1A or CHINESE 1B.", ["unparsed"]),
+    (COMPSCI_171, ["unparsed", "STATS 7", "STATS 120A", "STATS 67", "I&C SCI 46", "CSE 46", "MATH 2B"]),
+    ("Prerequisites for non-Dance majors: DANCE 50A and DANCE 50B and DANCE 50C.",
+     ["unparsed", "DANCE 50A", "DANCE 50B", "DANCE 50C"]),
+    ("Two courses from DRAMA 148A or DRAMA 148B or DRAMA 148C.", ["unparsed", "DRAMA 148A", "DRAMA 148B", "DRAMA 148C"]),
+    ("Three courses selected from ENGLISH 8, ENGLISH 9, LIT JRN 20.", ["unparsed", "ENGLISH 8", "ENGLISH 9", "LIT JRN 20"]),
+    ("Satisfactory completion of the Lower-Division Writing requirement.", None),
+    ("Recommended: COMPSCI 172B and COMPSCI 178.", None),
+    ("", None),
+])
+def test_parse_catalogue_prereqs(prereq_str, tree):
+    assert parse_prereq(prereq_str) == tree
+
+
+def test_trees_are_saved_by_id():
+    saved = build_prereqs(INDEX)
+    courses = saved["courses"]
+
+    assert courses[:len(INDEX)] == list(INDEX)
+    assert "AP Calculus AB" in courses[len(INDEX):]
+    assert saved["trees"][courses.index("MATH 2B")] == ["or", courses.index("MATH 2A"), courses.index("AP Calculus AB")]
+    assert saved["trees"][courses.index("COMPSCI 274D")] is None
+
+
+def test_unparsed_requirements_are_never_met():
+    table = PrereqTable(build_prereqs(INDEX))
+    ids = lambda courses: {table.id_of(course) for course in courses}
+
+    assert table.tree(table.id_of("MUSIC 201")) == ["unparsed"]
+    assert not table.requires("MUSIC 201", "MUSIC 201")
+    assert table.requires("MATH 2B", "COMPSCI 171")
+
+    eligible = {table.name(course_id) for course_id in table.eligible(ids(["MATH 2B", "DRAMA 30A", "HUMAN 1AES"]), True)}
+    assert not eligible & {"COMPSCI 171", "DRAMA 130", "MUSIC 201", "HUMAN 1BES"}
+    assert {"MATH 3A", "DANCE 132A"} <= {table.name(course_id) for course_id in
+                                         table.eligible(ids(["MATH 1B", "DANCE 30A", "DANCE 30B", "DANCE 30C"]))}
+
+    assert table.unmet("COMPSCI 171", ids(["MATH 2B", "COMPSCI 171"])) == \
+        [["STATS 7"], ["STATS 120A"], ["STATS 67"], ["I&C SCI 46"], ["CSE 46"]]
+    assert table.unmet("MATH 3A", set()) == [["MATH 1B", "AP Calculus AB"]]
+    assert table.unmet("DANCE 132A", set()) == [["(DANCE 30A and DANCE 30B and DANCE 30C)"]]
+
+
+def test_unmet_requirements():
+    table = PrereqTable(build_prereqs(INDEX))
+    taken = {table.id_of("CHEM 51C")}
+
+    assert table.unmet("CHEM 141", taken) == [["MATH 2B", "AP Calculus BC"]]
+    assert table.unmet("CHEM 141", taken | {table.id_of("AP Calculus BC")}) == []
+    assert table.unmet("ANTHRO 132A", set()) == [["ANTHRO 2A", "PSYCH 7A", "(PSYCH 9A and PSYCH 9B and PSYCH 9C)",
+                                                  "(PSY BEH 11A and PSY BEH 11B and PSY BEH 11C)"]]
+    assert table.unmet("MATH 2A", set()) == []
+
+
+def test_an_or_of_ands_is_distributed():
+    table = PrereqTable(build_prereqs(INDEX))
+    clauses = _clauses(table.tree(table.id_of("ANTHRO 132A")))
+
+    # (ANTHRO 2A or PSYCH 7A or PSYCH 9x or PSY BEH 11y) for each x and y
+    either = (1 << table.id_of("ANTHRO 2A")) | (1 << table.id_of("PSYCH 7A"))
+    assert len(clauses) == 9
+    assert all(clause & either == either and clause.bit_count() == 4 for clause in clauses)
+
+
+def test_subsumed_clauses_are_dropped():
+    # A and (A or B) and (B or C or A)
+    assert _clauses(["and", 0, ["or", 0, 1], ["or", 1, 2, 0]]) == [0b1]
+    # (A and B) or A
+    assert _clauses(["or", ["and", 0, 1], 0]) == [0b1]
+
+
+def test_too_many_clauses_are_evaluated_as_trees(monkeypatch):
+    table = PrereqTable(build_prereqs(INDEX))
+    sociol_138 = table.id_of("SOCIOL 138")
+    assert _clauses(table.tree(sociol_138)) is None
+    assert sociol_138 in table._compile()[2]
+
+    monkeypatch.setattr(prereqs, "MAX_CLAUSES", 8)
+    assert _clauses(table.tree(table.id_of("ANTHRO 132A"))) is None
+
+
+@pytest.mark.parametrize("max_clauses", [prereqs.MAX_CLAUSES, 1])
+def test_eligible_equals_evaluating_every_tree(monkeypatch, max_clauses):
+    monkeypatch.setattr(prereqs, "MAX_CLAUSES", max_clauses)
+    table = PrereqTable(build_prereqs(INDEX))
+    rng = random.Random(0)
+
+    for _ in range(200):
+        taken = {course_id for course_id in range(len(table)) if rng.random() < 0.5}
+        expected = [course_id for course_id in range(len(INDEX))
+                    if table.tree(course_id) is not None and _satisfied(table.tree(course_id), taken)]
+        assert table.eligible(taken) == expected
+        assert table.eligible(taken, unrestricted=True) == \
+            sorted(set(expected) | {course_id for course_id in range(len(INDEX)) if table.tree(course_id) is None})
@@ -0,0 +1,88 @@
+# test_registry.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Loading and reloading the shared indexes (refer to registry.py).
+
+import ujson
+import pytest
+
+import registry
+from prereqs import build_prereqs
+
+INDEX = {
+    "COMPSCI 1": ["COMPSCI", "Trees", "", ""],
+    "COMPSCI 2": ["COMPSCI", "Graphs", "", "COMPSCI 1."],
+}
+
+
+def _write(index: dict) -> None:
+    with open("index.txt", 'w') as f:
+        ujson.dump(index, f)
+    with open("prereqs.txt", 'w') as f:
+        ujson.dump(build_prereqs(index), f)
+
+
+@pytest.fixture
+def indexes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(registry, "BACKEND", "json")
+    _write(INDEX)
+    registry.reload()
+    yield
+    monkeypatch.undo()
+    registry.reload()
+
+
+def test_reload_rebuilds_dependent_indexes(indexes):
+    graph = registry.get_prereq_graph()
+    assert graph.dependents_of("COMPSCI 1") == [1]
+    version = registry.version()
+
+    _write(dict(INDEX, **{"COMPSCI 3": ["COMPSCI", "Heaps", "", "COMPSCI 1."]}))
+    registry.reload()
+
+    assert registry.version() == version+1
+    assert set(registry.stats()) == {"prereqs", "prereq_graph"}
+    assert registry.get_prereq_graph() is not graph
+    assert registry.get_prereq_graph().dependents_of("COMPSCI 1") == [1, 2]
+    assert registry.get_prereqs() is registry.get_prereq_graph()._prereqs
+
+
+def test_memory_is_only_measured_when_profiling(indexes, monkeypatch):
+    registry.get_course_table()
+    assert registry.stats()["index"]["bytes"] is None
+
+    monkeypatch.setattr(registry, "PROFILE", True)
+    registry.reload()
+    assert registry.stats()["index"]["bytes"] > 0
+
+
+def test_reload_leaves_out_indexes_which_cannot_load(indexes, tmp_path):
+    registry.get_course_table()
+    (tmp_path/"index.txt").unlink()
+    registry.reload()
+
+    assert "index" not in registry.stats()
+    with pytest.raises(FileNotFoundError):
+        registry.get_course_table()
+
+
+def test_changed_files_are_reloaded(indexes, monkeypatch):
+    monkeypatch.setattr(registry, "CHECK_INTERVAL", 0)
+    assert registry.get_prereq_graph().dependents_of("COMPSCI 1") == [1]
+    version = registry.version()
+    assert registry.version() == version
+
+    _write(dict(INDEX, **{"COMPSCI 3": ["COMPSCI", "Heaps", "", "COMPSCI 1."]}))
+    assert registry.get_prereq_graph().dependents_of("COMPSCI 1") == [1, 2]
+    assert registry.version() == version+1
+
+
+def test_files_are_checked_at_most_once_per_interval(indexes, monkeypatch):
+    monkeypatch.setattr(registry, "CHECK_INTERVAL", 3600)
+    registry.get_prereqs()
+    registry.version()
+    version = registry.version()
+
+    _write(dict(INDEX, **{"COMPSCI 3": ["COMPSCI", "Heaps", "", "COMPSCI 1."]}))
+    assert registry.version() == version
+    assert len(registry.get_prereqs()) == 2
@@ -0,0 +1,192 @@
+# test_search.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Searches of indexes built from a small fake catalogue, end to end
+# (refer to search.query_catalogue).
+
+import io
+import random
+import contextlib
+
+import pytest
+
+import postings
+import registry
+import search
+from bm25 import parse_params
+from crawler import ReplayCrawler
+from index import Index
+from postings import write_postings
+from search import query_catalogue, query_cache_info
+from store import build_store
+from conftest import save_catalogue
+
+# COMPSCI 2 mentions "tree" most often, but in a long description
+CATALOGUE = {
+    "COMPSCI": [
+        ("1", "Trees", "Trees.", ""),
+        ("2", "Graph Search", "Search over a tree or a graph, with a tree of search states, breadth first and depth "
+                              "first search over graphs, and heuristics which prune the tree of states which are "
+                              "searched by each of the algorithms covered in lectures.", "COMPSCI 1."),
+        ("3", "Heaps", "Priority queues over a binary tree.", "COMPSCI 1."),
+    ],
+    "MATH": [
+        ("1", "Calculus", "Limits and a tree diagram.", ""),
+    ],
+}
+
+
+WORDS = ["tree", "graph", "search", "heap", "queue", "sort", "hash", "network", "data", "model", "proof", "logic"]
+
+QUERIES = ["tree", "tree graph", "heap queue sort", "proof logic network data", "tree AND NOT graph", "nope"]
+
+
+def _catalogue(seed: int) -> dict:
+    """
+    Returns a fake catalogue of 40 courses made of random words, so that
+    posting lists span several blocks (of postings.BLOCK_SIZE = 4).
+    """
+    rng = random.Random(seed)
+    text = lambda length: " ".join(rng.choice(WORDS) for _ in range(length)).capitalize()
+    return {dept: [(str(number), text(2), text(rng.randint(3, 30))+".", "") for number in range(1, 21)]
+            for dept in ("COMPSCI", "MATH")}
+
+
+def _build(directory, catalogue: dict) -> None:
+    """
+    Builds every index of catalogue (the JSON files, the binary inverted
+    index and the SQLite store) within directory, the current directory.
+    """
+    save_catalogue(str(directory/"snapshot"), catalogue)
+    with contextlib.redirect_stdout(io.StringIO()):
+        index_obj = Index(ReplayCrawler(str(directory/"snapshot")))
+        index_obj.create_indexes()
+        write_postings(index_obj.get_index(), index_obj.get_inverted_index())
+        build_store(index_obj.get_index(), index_obj.get_inverted_index(), index_obj.get_lemmas())
+
+
+def _use(backend: str) -> None:
+    registry.BACKEND = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        registry.reload()
+
+
+def _ties(results: list, scores: dict) -> list:
+    """
+    Returns the results as a list of sets of courses with the same score.
+    """
+    groups = []
+    for i, course in enumerate(results):
+        if i and round(scores[course], 6) == round(scores[results[i-1]], 6):
+            groups[-1].add(course)
+        else:
+            groups.append({course})
+    return groups
+
+
+@pytest.fixture
+def indexes(tmp_path, monkeypatch, no_nltk):
+    save_catalogue(str(tmp_path/"snapshot"), CATALOGUE)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(registry, "BACKEND", "json")
+    monkeypatch.setattr(registry, "BM25F_PARAMS", {})
+    with contextlib.redirect_stdout(io.StringIO()):
+        Index(ReplayCrawler(str(tmp_path/"snapshot")), positions=True).create_indexes()
+        registry.reload()
+    yield
+    monkeypatch.undo()
+    registry.reload()
+
+
+@pytest.fixture
+def backends(tmp_path, monkeypatch, no_nltk):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(postings, "BLOCK_SIZE", 4)
+    monkeypatch.setattr(registry, "BACKEND", "json")
+    monkeypatch.setattr(registry, "BM25F_PARAMS", {})
+    _build(tmp_path, _catalogue(0))
+    yield
+    monkeypatch.undo()
+    with contextlib.redirect_stdout(io.StringIO()):
+        registry.reload()
+
+
+def test_bm25f_normalizes_description_lengths(indexes):
+    assert query_catalogue("tree") == ["COMPSCI 2", "COMPSCI 3", "MATH 1"]
+    assert query_catalogue("tree", ranking="bm25f") == ["MATH 1", "COMPSCI 3", "COMPSCI 2"]
+
+
+def test_bm25f_parameters(indexes, monkeypatch):
+    assert query_catalogue("tree", ranking="bm25f")[0] == "MATH 1"
+
+    monkeypatch.setattr(registry, "BM25F_PARAMS", {"title_b": 0.0, "description_b": 0.0})
+    registry.reload()
+    assert query_catalogue("tree", ranking="bm25f") == ["COMPSCI 2", "COMPSCI 3", "MATH 1"]
+
+
+def test_bm25f_parameters_are_read_by_name():
+    assert parse_params("") == {}
+    assert parse_params("k1=1.5, title_boost=2") == {"k1": 1.5, "title_boost": 2.0}
+    with pytest.raises(ValueError):
+        parse_params("k=1.5")
+
+
+@pytest.mark.parametrize("backend, ranking", [("json", "tfidf"), ("json", "bm25f"), ("binary", "tfidf"),
+                                              ("binary", "bm25f"), ("sqlite", "tfidf")])
+def test_limit_returns_the_top_results(backends, backend, ranking):
+    _use(backend)
+    for query in QUERIES:
+        results = query_catalogue(query, ranking=ranking)
+        for limit in range(len(results)+2):
+            assert query_catalogue(query, limit, ranking) == results[:limit]
+
+
+def test_max_score_equals_scoring_every_posting(backends):
+    _use("binary")
+    binary = registry.get_postings()
+    pruned = False
+    for query in QUERIES[:4]:
+        tokens = [registry.lemmatize(token) for token in query.split()]
+        for limit in range(1, 41):
+            lists = [binary.postings(token) for token in tokens]
+            max_score_ids, max_score_decoded = search._top_by_max_score(lists, limit)
+            lists = [binary.postings(token) for token in tokens]
+            exhaustive_ids, exhaustive_decoded = search._top_exhaustive(lists, limit)
+
+            assert max_score_ids == exhaustive_ids
+            pruned = pruned or max_score_decoded < exhaustive_decoded
+    assert pruned
+
+
+def test_backends_agree(backends):
+    _use("json")
+    scores = {query: search._score(tuple(registry.lemmatize(token) for token in query.split()), "tfidf")[0]
+              for query in QUERIES if "AND" not in query}
+    results = {}
+    for backend in ("json", "binary", "sqlite"):
+        _use(backend)
+        results[backend] = {query: query_catalogue(query) for query in QUERIES}
+
+    for query in QUERIES:
+        assert set(results["binary"][query]) == set(results["sqlite"][query]) == set(results["json"][query])
+        if query in scores:
+            # Courses with the same score are ordered by first match (JSON)
+            # or by ID (binary), and SQLite ranks by bm25
+            assert _ties(results["binary"][query], scores[query]) == _ties(results["json"][query], scores[query])
+        else:
+            assert results["binary"][query] == results["json"][query]
+    assert results["json"]["tree"] and not results["json"]["nope"]
+
+
+def test_cached_results_are_dropped_on_reload(backends, tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "CHECK_INTERVAL", 0)
+    _use("json")
+    results = query_catalogue("tree")
+    hits = query_cache_info()["hits"]
+    assert query_catalogue("tree") == results
+    assert query_cache_info()["hits"] == hits+1
+
+    version = registry.version()
+    _build(tmp_path, _catalogue(1))
+    assert query_catalogue("tree") != results
+    assert registry.version() > version
+    assert query_cache_info()["hits"] == hits+1
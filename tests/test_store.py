@@ -0,0 +1,51 @@
+# test_store.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Phrase searches over the SQLite store (refer to store.py).
+
+import io
+import sqlite3
+import contextlib
+
+from store import CourseStore, build_store
+
+INDEX = {
+    "COMPSCI 1": ["COMPSCI", "Machine Learning", "Learning of the machine.", ""],
+    "COMPSCI 2": ["COMPSCI", "Learning Machines", "The machine of learning.", ""],
+}
+
+INVERTED_INDEX = {token: [] for token in ("machine", "learning")}
+LEMMAS = {"Machine": "machine", "machine": "machine", "Learning": "learning", "learning": "learning",
+          "Machines": "machine", "of": "of", "the": "the", "The": "the"}
+
+
+def _build(path: str) -> 'CourseStore':
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_store(INDEX, INVERTED_INDEX, LEMMAS, path)
+    return CourseStore(path)
+
+
+def test_indexed_tokens(tmp_path):
+    store = _build(str(tmp_path/"catalogue.db"))
+    assert store._indexed(["machine", "of", "learning", "the", "machine", "nope"]) == {"machine", "learning"}
+    assert store._indexed([]) == set()
+
+
+def test_indexed_tokens_without_terms_table(tmp_path):
+    path = str(tmp_path/"catalogue.db")
+    _build(path)
+    connection = sqlite3.connect(path)
+    connection.execute("DROP TABLE terms")
+    connection.commit()
+    connection.close()
+
+    assert CourseStore(path)._indexed(["machine", "of", "learning"]) == {"machine", "learning"}
+
+
+def test_phrases_leave_out_stopwords(tmp_path):
+    store = _build(str(tmp_path/"catalogue.db"))
+    both = {"COMPSCI 1", "COMPSCI 2"}
+    assert set(store.search(["machine", "learning"], phrases=[["learning", "machine"]])) == both
+    assert set(store.search(["machine", "learning"], phrases=[["machine", "of", "learning"]])) == both
+    assert set(store.search(["machine", "learning"], phrases=[["learning", "of", "the", "machine"]])) == both
+    assert store.search(["machine", "learning"], phrases=[["machine", "learning", "machine"]]) == []
+    assert set(store.search(["machine"], phrases=[["of", "the"]])) == both
@@ -0,0 +1,179 @@
+# test_update_departments.py - Julian Zulfikar, 2023
+# ------------------------------------------------------------------
+# Re-indexing only some departments must give the same indexes as
+# rebuilding every department (refer to Index.update_departments).
+
+import io
+import os
+import contextlib
+
+import ujson
+
+from crawler import ReplayCrawler
+from index import Index
+from phrases import BinaryPositions
+from postings import BinaryPostings, write_postings
+from store import CourseStore, build_store
+from conftest import save_catalogue
+
+CATALOGUE = {
+    "COMPSCI": [
+        ("1", "Intro to Trees", "Binary tree basics and search.", ""),
+        ("2", "Graph Search", "Search over a tree or graph.", "COMPSCI 1."),
+    ],
+    "MATH": [
+        ("1", "Calculus", "Limits and a tree diagram.", ""),
+    ],
+}
+
+# COMPSCI 1's description now mentions "tree" twice, COMPSCI 3 is new
+UPDATED = dict(CATALOGUE, COMPSCI=[
+    ("1", "Intro to Trees", "Binary tree basics, tree search.", ""),
+    ("2", "Graph Search", "Search over a tree or graph.", "COMPSCI 1."),
+    ("3", "Heaps", "Priority queues.", "COMPSCI 2."),
+])
+
+# COMPSCI 2 is dropped
+REMOVED = dict(CATALOGUE, COMPSCI=CATALOGUE["COMPSCI"][:1])
+
+
+def _build(directory: str, catalogue: dict, snapshot: str) -> None:
+    save_catalogue(snapshot, catalogue)
+    os.makedirs(directory, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            Index(ReplayCrawler(snapshot), positions=True).create_indexes()
+    finally:
+        os.chdir(cwd)
+
+
+def _update(directory: str, snapshot: str, depts: list) -> None:
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            Index(ReplayCrawler(snapshot)).update_departments(depts)
+    finally:
+        os.chdir(cwd)
+
+
+def _load(directory: str, filename: str):
+    with open(os.path.join(directory, filename), 'r') as f:
+        return ujson.load(f)
+
+
+def _postings(directory: str) -> dict:
+    """
+    Returns the postings of the inverted index by token and course, with
+    rounded TF-IDF scores (postings of a token may be in any order).
+    """
+    return {token: {page[0]: [page[1], round(page[2], 9)]+page[3:] for page in pages}
+            for token, pages in _load(directory, "inverted_index.txt").items()}
+
+
+def _binary_postings(directory: str) -> dict:
+    """
+    Returns the postings of the binary inverted index by token and
+    course, refer to _postings.
+    """
+    postings = BinaryPostings(os.path.join(directory, "inverted_index.bin"))
+    return {token: {page[0]: [page[1], round(page[2], 5)] for page in postings[token]}
+            for token in _load(directory, "inverted_index.txt")}
+
+
+def _positions(directory: str) -> dict:
+    """
+    Returns the positions of every token by course (courses of a token
+    may be in any order).
+    """
+    return {token: {page[0]: page[1:] for page in pages}
+            for token, pages in BinaryPositions(os.path.join(directory, "positions.bin")).items()}
+
+
+def _assert_same_indexes(a: str, b: str) -> None:
+    for filename in ("index.txt", "fields.txt", "prereqs.txt"):
+        assert _load(a, filename) == _load(b, filename), filename
+    assert _postings(a) == _postings(b)
+    assert _positions(a) == _positions(b)
+
+
+def test_update_equals_full_rebuild(tmp_path, no_nltk):
+    _build(tmp_path/"updated", CATALOGUE, str(tmp_path/"old"))
+    save_catalogue(str(tmp_path/"new"), UPDATED)
+    _update(tmp_path/"updated", str(tmp_path/"new"), ["COMPSCI"])
+
+    _build(tmp_path/"full", UPDATED, str(tmp_path/"new"))
+    _assert_same_indexes(tmp_path/"updated", tmp_path/"full")
+    assert set(_postings(tmp_path/"updated")["tree"]) == {"COMPSCI 1", "COMPSCI 2", "MATH 1"}
+
+
+def test_update_without_changes_keeps_indexes(tmp_path, no_nltk):
+    _build(tmp_path/"updated", CATALOGUE, str(tmp_path/"old"))
+    _update(tmp_path/"updated", str(tmp_path/"old"), ["COMPSCI"])
+
+    _build(tmp_path/"full", CATALOGUE, str(tmp_path/"old"))
+    _assert_same_indexes(tmp_path/"updated", tmp_path/"full")
+
+
+def test_update_of_legacy_postings(tmp_path, no_nltk):
+    """
+    Postings without field frequencies ([course, frequency, tf-idf]) are
+    replaced by full postings rather than dropped.
+    """
+    _build(tmp_path/"updated", CATALOGUE, str(tmp_path/"old"))
+    legacy = {token: [page[:3] for page in pages] for token, pages in _load(tmp_path/"updated", "inverted_index.txt").items()}
+    with open(tmp_path/"updated"/"inverted_index.txt", 'w') as f:
+        ujson.dump(legacy, f)
+
+    _update(tmp_path/"updated", str(tmp_path/"old"), ["COMPSCI"])
+    updated = _postings(tmp_path/"updated")
+    _build(tmp_path/"full", CATALOGUE, str(tmp_path/"old"))
+    full = _postings(tmp_path/"full")
+
+    assert updated.keys() == full.keys()
+    for token in full:
+        assert updated[token].keys() == full[token].keys(), token
+        for course, page in full[token].items():
+            if course.startswith("COMPSCI"):
+                assert updated[token][course] == page
+
+
+def test_update_rewrites_binary_postings(tmp_path, no_nltk):
+    _build(tmp_path/"updated", CATALOGUE, str(tmp_path/"old"))
+    write_postings(_load(tmp_path/"updated", "index.txt"), _load(tmp_path/"updated", "inverted_index.txt"),
+                   str(tmp_path/"updated"/"inverted_index.bin"))
+    save_catalogue(str(tmp_path/"new"), REMOVED)
+    _update(tmp_path/"updated", str(tmp_path/"new"), ["COMPSCI"])
+
+    updated = _binary_postings(tmp_path/"updated")
+    assert not any("COMPSCI 2" in pages for pages in updated.values())
+    assert updated == {token: {course: [page[0], round(page[1], 5)] for course, page in pages.items()}
+                       for token, pages in _postings(tmp_path/"updated").items()}
+
+
+def test_update_counts_courses_as_full_rebuild(tmp_path, no_nltk):
+    """
+    A course listed twice is one course when computing IDF.
+    """
+    listed_twice = dict(CATALOGUE, MATH=CATALOGUE["MATH"]*2)
+    _build(tmp_path/"updated", listed_twice, str(tmp_path/"old"))
+    save_catalogue(str(tmp_path/"new"), dict(UPDATED, MATH=listed_twice["MATH"]))
+    _update(tmp_path/"updated", str(tmp_path/"new"), ["COMPSCI"])
+
+    _build(tmp_path/"full", dict(UPDATED, MATH=listed_twice["MATH"]), str(tmp_path/"new"))
+    _assert_same_indexes(tmp_path/"updated", tmp_path/"full")
+
+
+def test_update_rewrites_store(tmp_path, no_nltk):
+    _build(tmp_path/"updated", CATALOGUE, str(tmp_path/"old"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_store(_load(tmp_path/"updated", "index.txt"), _load(tmp_path/"updated", "inverted_index.txt"),
+                    _load(tmp_path/"updated", "lemmas.txt"), str(tmp_path/"updated"/"catalogue.db"))
+    save_catalogue(str(tmp_path/"new"), REMOVED)
+    _update(tmp_path/"updated", str(tmp_path/"new"), ["COMPSCI"])
+
+    store = CourseStore(str(tmp_path/"updated"/"catalogue.db"))
+    assert dict(store) == _load(tmp_path/"updated", "index.txt")
+    assert "COMPSCI 2" not in store.search(["search", "graph"])